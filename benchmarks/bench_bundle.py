@@ -0,0 +1,60 @@
+"""Benchmark importing a config bundle against a full clone of the same repo.
+
+For each scenario, reports the time to clone the repo (full history, over
+file:// so git packs objects as for a network clone) and the time to import
+its bundle, with the size of the clone and of the bundle file. Run from the
+repository root with `python -m benchmarks.bench_bundle`.
+"""
+
+import argparse
+import logging
+import tempfile
+import time
+from pathlib import Path
+
+import git
+
+from benchmarks.bench_clone import disk_usage
+from benchmarks.suite import SCENARIOS, make_remote
+from rc4me.bundle import SUFFIX, export_bundle, import_bundle
+from rc4me.rcmanager import RcManager
+
+
+def _row(scenario: str, method: str, seconds: float, size: int) -> None:
+    print(f"{scenario:>12} {method:>8} {seconds:>9.3f}s {size / (1 << 20):>9.2f}MiB")
+
+
+def main(scenarios) -> None:
+    logging.disable(logging.INFO)
+    print(f"{'scenario':>12} {'method':>8} {'time':>10} {'size':>12}")
+    for name in scenarios:
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = Path(tmp)
+            remote = make_remote(tmp, name, SCENARIOS[name])
+            clone = tmp / "clone"
+            start = time.perf_counter()
+            git.Repo.clone_from(f"file://{remote}", clone)
+            seconds = time.perf_counter() - start
+            _row(name, "clone", seconds, disk_usage(clone))
+            out = tmp / f"{name}{SUFFIX}"
+            start = time.perf_counter()
+            export_bundle(clone, out)
+            seconds = time.perf_counter() - start
+            _row(name, "export", seconds, out.stat().st_size)
+            rcmanager = RcManager(tmp / "home", tmp / "dest")
+            start = time.perf_counter()
+            repo = import_bundle(rcmanager, out)
+            seconds = time.perf_counter() - start
+            _row(name, "import", seconds, disk_usage(repo))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--scenario",
+        choices=list(SCENARIOS),
+        nargs="+",
+        default=["tiny", "nested-1k", "large-files"],
+    )
+    args = parser.parse_args()
+    main(args.scenario)
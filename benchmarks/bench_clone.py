@@ -0,0 +1,71 @@
+"""Benchmark clone time and disk use of shallow and sparse clones.
+
+Builds a synthetic dotfiles repo with a few rc files next to large assets and
+many scripts, served from a local bare repo that allows partial clones.
+
+Run from the repository root with `python -m benchmarks.bench_clone`.
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import git
+
+from rc4me.rcmanager import CLONE_STRATEGIES, RcManager
+
+
+def make_remote(root: Path, n_assets: int, asset_size: int, n_scripts: int) -> Path:
+    """Create a bare repo with rc files, large assets and many small scripts."""
+    work = root / "work"
+    (work / "assets").mkdir(parents=True)
+    (work / "scripts").mkdir()
+    for name in ["bashrc", "vimrc", "gitconfig", "inputrc", "tmux.conf"]:
+        (work / name).write_text(f"# {name}\n")
+    for i in range(n_assets):
+        (work / "assets" / f"asset{i}.bin").write_bytes(os.urandom(asset_size))
+    for i in range(n_scripts):
+        (work / "scripts" / f"script{i}.sh").write_text(f"echo {i}\n")
+    repo = git.Repo.init(work, initial_branch="master")
+    repo.git.add(all=True)
+    repo.index.commit("Add dotfiles")
+    remote = root / "dotfiles.git"
+    repo.clone(remote, bare=True)
+    git.Repo(remote).git.config("uploadpack.allowFilter", "true")
+    return remote
+
+
+def disk_usage(path: Path) -> int:
+    """Total size in bytes of the files below path."""
+    return sum(
+        os.lstat(os.path.join(dirpath, name)).st_size
+        for dirpath, _, names in os.walk(path)
+        for name in names
+    )
+
+
+def main(n_assets: int, asset_size: int, n_scripts: int) -> None:
+    logging.disable(logging.INFO)
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        remote = make_remote(tmp, n_assets, asset_size, n_scripts)
+        print(f"{'strategy':>10} {'time':>12} {'disk':>12}")
+        for strategy in CLONE_STRATEGIES:
+            rcmanager = RcManager(tmp / strategy, tmp, clone_strategy=strategy)
+            start = time.perf_counter()
+            rcmanager.fetch_repo(str(remote))
+            elapsed = time.perf_counter() - start
+            size = disk_usage(rcmanager.repo_path)
+            print(f"{strategy:>10} {elapsed * 1e3:>10.2f}ms {size / 2**20:>9.2f}MiB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--assets", type=int, default=20)
+    parser.add_argument("--asset-size", type=int, default=4 << 20)
+    parser.add_argument("--scripts", type=int, default=2000)
+    args = parser.parse_args()
+    main(args.assets, args.asset_size, args.scripts)
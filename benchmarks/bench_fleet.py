@@ -0,0 +1,39 @@
+"""Benchmark applying one config repo to many destination directories.
+
+Run from the repository root with `python -m benchmarks.bench_fleet`.
+"""
+
+import argparse
+import logging
+import tempfile
+from pathlib import Path
+
+from benchmarks.suite import SCENARIOS, make_remote
+from rc4me.fleet import apply_fleet
+from rc4me.rcmanager import RcManager
+
+
+def main(scenario: str, n_dests: int, workers: int) -> None:
+    logging.disable(logging.INFO)
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        remote = make_remote(tmp, scenario, SCENARIOS[scenario])
+        dests = [tmp / "ws" / f"ws-{i}" for i in range(n_dests)]
+        for dest in dests:
+            dest.mkdir(parents=True)
+        rcmanager = RcManager(tmp / "home", tmp / "home", dir_mode="files")
+        for jobs in workers:
+            # Start each run from destinations without links
+            for dest in dests:
+                RcManager(dest / ".rc4me", dest).change_current_to_init()
+            report = apply_fleet(rcmanager, str(remote), dests, workers=jobs)
+            print(f"{f'-j{jobs}':>6} {report}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scenario", choices=list(SCENARIOS), default="tiny")
+    parser.add_argument("--dests", type=int, default=1000)
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1, 8])
+    args = parser.parse_args()
+    main(args.scenario, args.dests, args.jobs)
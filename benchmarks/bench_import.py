@@ -0,0 +1,33 @@
+"""Benchmark the startup time of the rc4me command line entry point.
+
+Run from the repository root with `python -m benchmarks.bench_import`. Prints
+the slowest imports of `rc4me.cli` and exits with an error if the best run
+exceeds the budget.
+"""
+
+import argparse
+import sys
+
+from rc4me.timing import import_times
+
+
+def main(module: str, repeat: int, top: int, budget_ms: float) -> int:
+    runs = [import_times(f"import {module}") for _ in range(repeat)]
+    best = min(runs, key=lambda times: times[module])
+    print(f"slowest imports of {module} (best of {repeat}):")
+    slowest = sorted(best.items(), key=lambda item: item[1], reverse=True)
+    for name, us in slowest[:top]:
+        print(f"{us / 1e3:>10.2f}ms  {name}")
+    total_ms = best[module] / 1e3
+    print(f"{module}: {total_ms:.2f}ms, budget {budget_ms:.0f}ms")
+    return 0 if total_ms < budget_ms else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--module", default="rc4me.cli")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget-ms", type=float, default=250)
+    args = parser.parse_args()
+    sys.exit(main(args.module, args.repeat, args.top, args.budget_ms))
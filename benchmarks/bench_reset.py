@@ -0,0 +1,68 @@
+"""Benchmark `reset` copying backed-up files from init into the destination.
+
+Run from the repository root with `python -m benchmarks.bench_reset`.
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+from rc4me.rcmanager import RcManager
+
+
+def make_files(root: Path, n_files: int, size: int) -> List[str]:
+    """Create `n_files` dot files of `size` random bytes in root."""
+    root.mkdir(parents=True, exist_ok=True)
+    names = [f"rc{i}" for i in range(n_files)]
+    for name in names:
+        (root / f".{name}").write_bytes(os.urandom(size))
+    return names
+
+
+def time_reset(n_files: int, size: int, workers: int) -> List[float]:
+    """Time a reset after an apply, then a second reset with nothing to copy.
+
+    The destination starts out with real files, which the apply backs up into
+    init and the reset copies back.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        dest = tmp / "dest"
+        names = make_files(dest, n_files, size)
+        repo = tmp / "repo"
+        repo.mkdir()
+        for name in names:
+            (repo / name).write_text("")
+        rcmanager = RcManager(tmp / "home", dest, workers=workers)
+        rcmanager.change_current_to_repo(repo)
+        timings = []
+        for _ in range(2):
+            start = time.perf_counter()
+            rcmanager.change_current_to_init()
+            timings.append(time.perf_counter() - start)
+        return timings
+
+
+def main(workers: List[int]) -> None:
+    # Per-file log lines would dominate the measurement
+    logging.disable(logging.INFO)
+    cases = {"5000 x 4KiB": (5000, 4 << 10), "4 x 64MiB": (4, 64 << 20)}
+    print(f"{'case':>12} {'jobs':>5} {'reset':>12} {'repeat':>12}")
+    for case, (n_files, size) in cases.items():
+        for n_workers in workers:
+            first, repeat = time_reset(n_files, size, n_workers)
+            print(
+                f"{case:>12} {n_workers:>5} {first * 1e3:>10.2f}ms "
+                f"{repeat * 1e3:>10.2f}ms"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1, 8])
+    args = parser.parse_args()
+    main(args.jobs)
@@ -0,0 +1,45 @@
+"""Benchmark `rc4me status` on a config with many linked files.
+
+Run from the repository root with `python -m benchmarks.bench_status`.
+"""
+
+import argparse
+import logging
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.suite import Scenario, make_repo
+from rc4me.rcmanager import RcManager
+from rc4me.status import check_status, repair
+
+
+def main(n_files: int, workers) -> None:
+    logging.disable(logging.INFO)
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        repo = make_repo(tmp / "repo", Scenario(nested_files=n_files))
+        dest = tmp / "dest"
+        dest.mkdir()
+        rcmanager = RcManager(tmp / "home", dest, dir_mode="files")
+        rcmanager.change_current_to_repo(repo)
+        for jobs in workers:
+            status = check_status(rcmanager, jobs)
+            print(f"{f'-j{jobs}':>6} {status}")
+        # Drift one file in a hundred, then repair only those
+        links = sorted(dest.glob(".config/**/file*"))[::100]
+        for link in links:
+            link.unlink()
+        status = check_status(rcmanager, max(workers))
+        start = time.perf_counter()
+        ops = repair(rcmanager, status)
+        seconds = time.perf_counter() - start
+        print(f"{'repair':>6} {len(ops)} operations in {seconds * 1e3:.1f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=10_000)
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1, 8])
+    args = parser.parse_args()
+    main(args.files, args.jobs)
@@ -0,0 +1,57 @@
+"""Benchmark config switch latency for each rc4me link mode.
+
+Run from the repository root with `python -m benchmarks.bench_switch`.
+"""
+
+import argparse
+import logging
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+from rc4me.rcmanager import LINK_MODES, RcManager
+
+
+def make_repo(path: Path, n_files: int, prefix: str) -> Path:
+    """Create a flat config directory with `n_files` small rc files."""
+    path.mkdir(parents=True)
+    for i in range(n_files):
+        (path / f"rc{i}").write_text(f"{prefix} {i}\n")
+    return path
+
+
+def time_switch(n_files: int, link_mode: str, repeat: int) -> float:
+    """Return the best switch time in seconds between two same-named configs."""
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        repo_a = make_repo(tmp / "a", n_files, "a")
+        repo_b = make_repo(tmp / "b", n_files, "b")
+        dest = tmp / "dest"
+        dest.mkdir()
+        rcmanager = RcManager(tmp / "home", dest, link_mode=link_mode)
+        rcmanager.change_current_to_repo(repo_a)
+        best = float("inf")
+        for i in range(repeat):
+            target = repo_b if i % 2 == 0 else repo_a
+            start = time.perf_counter()
+            rcmanager.change_current_to_repo(target)
+            best = min(best, time.perf_counter() - start)
+        return best
+
+
+def main(sizes: List[int], repeat: int) -> None:
+    # Per-file log lines would dominate the measurement
+    logging.disable(logging.INFO)
+    print(f"{'files':>8} " + " ".join(f"{mode:>12}" for mode in LINK_MODES))
+    for n_files in sizes:
+        timings = [time_switch(n_files, mode, repeat) for mode in LINK_MODES]
+        print(f"{n_files:>8} " + " ".join(f"{t * 1e3:>10.2f}ms" for t in timings))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 50000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    main(args.sizes, args.repeat)
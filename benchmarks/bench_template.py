@@ -0,0 +1,88 @@
+"""Benchmark applying a config with templates, cold and with cached renders.
+
+Times a first apply, which renders every template, a repeat apply, which
+should render nothing, and an apply after a fact changed, which only renders
+the templates that use it. Run from the repository root with
+`python -m benchmarks.bench_template`.
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.suite import Scenario, make_repo
+from rc4me.rcmanager import RcManager
+from rc4me.timing import Profiler
+
+# One block of a template, repeated to the requested number of lines
+_BLOCK = """export HOST={{ hostname }}
+{% if os == "darwin" %}
+alias ls="ls -G"
+{% else %}
+alias ls="ls --color=auto"
+{% endif %}
+export PATH={{ env.PATH }}
+"""
+
+
+def _write_templates(repo: Path, templates: int, lines: int) -> None:
+    body = _BLOCK * max(1, lines // _BLOCK.count("\n"))
+    for i in range(templates):
+        # Distinct, since identical templates share their renders
+        text = f"# rc{i}\n{body}"
+        if i % 10 == 0:
+            # A tenth of the templates also use the fact that changes below
+            text += "export EDITOR={{ env.RC4ME_BENCH_EDITOR }}\n"
+        (repo / f"rc{i}.tmpl").write_text(text)
+
+
+def _totals(profiler: Profiler):
+    """Templates rendered and seconds spent in the render span so far."""
+    summary = profiler.summary()
+    span = summary["spans"].get("render", {"seconds": 0.0})
+    return summary["counters"].get("rendered", 0), span["seconds"]
+
+
+def _apply(rcmanager: RcManager, repo: Path, label: str) -> None:
+    profiler = rcmanager.profiler
+    before = _totals(profiler)
+    start = time.perf_counter()
+    rcmanager.change_current_to_repo(repo)
+    seconds = time.perf_counter() - start
+    rendered, render_seconds = (a - b for a, b in zip(_totals(profiler), before))
+    print(
+        f"{label:>13} {seconds * 1e3:8.1f}ms, rendered {rendered} templates "
+        f"({render_seconds * 1e3:.1f}ms in render)"
+    )
+
+
+def main(n_files: int, templates: int, lines: int) -> None:
+    logging.disable(logging.INFO)
+    os.environ["RC4ME_BENCH_EDITOR"] = "vim"
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        repo = make_repo(tmp / "repo", Scenario(nested_files=n_files))
+        _write_templates(repo, templates, lines)
+        dest = tmp / "dest"
+        dest.mkdir()
+        rcmanager = RcManager(
+            tmp / "home", dest, dir_mode="files", templates=True, profiler=Profiler()
+        )
+        _apply(rcmanager, repo, "first apply")
+        rcmanager.change_current_to_init()
+        _apply(rcmanager, repo, "repeat apply")
+        rcmanager.change_current_to_init()
+        os.environ["RC4ME_BENCH_EDITOR"] = "nvim"
+        _apply(rcmanager, repo, "fact changed")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=1000)
+    parser.add_argument("--templates", type=int, default=200)
+    parser.add_argument("--lines", type=int, default=500)
+    args = parser.parse_args()
+    main(args.files, args.templates, args.lines)
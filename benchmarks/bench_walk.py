@@ -0,0 +1,79 @@
+"""Benchmark walking and linking a synthetic tree of nested config files.
+
+Run from the repository root with `python -m benchmarks.bench_walk`.
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable
+
+from rc4me.rcmanager import RcManager
+from rc4me.walk import walk_files
+
+
+def make_tree(root: Path, n_files: int, fanout: int = 20) -> Path:
+    """Create `n_files` files spread over a two-level tree of directories."""
+    per_dir = max(1, n_files // (fanout * fanout))
+    count = 0
+    for i in range(fanout):
+        for j in range(fanout):
+            subdir = root / "vim" / f"pack{i}" / f"plugin{j}"
+            subdir.mkdir(parents=True)
+            for k in range(per_dir):
+                (subdir / f"file{k}.vim").write_text("")
+                count += 1
+    return root
+
+
+def best_of(func: Callable[[], object], repeat: int) -> float:
+    """Return the best wall time in seconds of calling func."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def time_apply(repo: Path, workers: int) -> float:
+    """Time linking every file in repo into a fresh destination."""
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        dest = tmp / "dest"
+        dest.mkdir()
+        rcmanager = RcManager(tmp / "home", dest, dir_mode="files", workers=workers)
+        start = time.perf_counter()
+        rcmanager.change_current_to_repo(repo)
+        return time.perf_counter() - start
+
+
+def main(n_files: int, repeat: int) -> None:
+    # Per-file log lines would dominate the measurement
+    logging.disable(logging.INFO)
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = make_tree(Path(tmp) / "repo", n_files)
+        root = repo / "vim"
+        n_found = sum(1 for _ in walk_files(root))
+        print(f"walking {n_found} files")
+        walkers = {
+            "walk_files": lambda: sum(1 for _ in walk_files(root, "vim")),
+            "os.walk": lambda: sum(len(files) for _, _, files in os.walk(root)),
+            "Path.rglob": lambda: sum(1 for p in root.rglob("*") if not p.is_dir()),
+        }
+        for name, func in walkers.items():
+            print(f"{name:>16} {best_of(func, repeat) * 1e3:>10.2f}ms")
+        for workers in (1, 8):
+            elapsed = time_apply(repo, workers)
+            print(f"{f'apply -j{workers}':>16} {elapsed * 1e3:>10.2f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    main(args.files, args.repeat)
@@ -0,0 +1,73 @@
+"""Benchmark how fast `rc4me watch` links a file added to the current config.
+
+Compares the latency of inotify and polling with re-running a switch to the
+same config, which relists it. Run from the repository root with
+`python -m benchmarks.bench_watch`.
+"""
+
+import argparse
+import logging
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from benchmarks.suite import SCENARIOS, make_repo
+from rc4me.rcmanager import RcManager
+from rc4me.watch import watch
+
+
+def _latencies(rcmanager: RcManager, repo: Path, poll: bool, rounds: int):
+    """Seconds from adding a file to the repo until it is linked, per round."""
+    updated = threading.Event()
+    thread = threading.Thread(
+        target=watch,
+        args=(rcmanager,),
+        kwargs=dict(
+            debounce=0.005,
+            poll=poll,
+            interval=0.01,
+            on_update=lambda changed, ops: updated.set(),
+            batches=rounds,
+        ),
+        daemon=True,
+    )
+    thread.start()
+    time.sleep(0.5)
+    latencies = []
+    for i in range(rounds):
+        updated.clear()
+        start = time.perf_counter()
+        (repo / f"added{i}").write_text("")
+        updated.wait()
+        latencies.append(time.perf_counter() - start)
+    thread.join()
+    return latencies
+
+
+def main(scenario: str, rounds: int) -> None:
+    logging.disable(logging.INFO)
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        repo = make_repo(tmp / "repo", SCENARIOS[scenario])
+        dest = tmp / "dest"
+        dest.mkdir()
+        rcmanager = RcManager(tmp / "home", dest, dir_mode="files")
+        rcmanager.change_current_to_repo(repo)
+        for poll in (False, True):
+            latencies = _latencies(rcmanager, repo, poll, rounds)
+            name = "poll" if poll else "inotify"
+            print(f"{name:>8} median {statistics.median(latencies) * 1e3:8.2f}ms")
+        start = time.perf_counter()
+        (repo / "added").write_text("")
+        rcmanager.change_current_to_repo(repo)
+        print(f"{'apply':>8} {(time.perf_counter() - start) * 1e3:15.2f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scenario", choices=list(SCENARIOS), default="nested-1k")
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+    main(args.scenario, args.rounds)
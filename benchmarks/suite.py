@@ -0,0 +1,266 @@
+"""Offline benchmark suite of rc4me commands on synthetic config repos.
+
+Each scenario generates a config repo (from a handful of rc files up to 100k
+files in nested trees, or a few large files) and serves it from a local bare
+repo, so nothing is fetched from the network. The suite then times apply,
+a repeated fetch, revert, the catalog listing of select and reset through
+`RcManager`, and writes the best time of each as JSON. Pass a previous
+results file with `--compare` to report the ratio of each time and fail on
+regressions.
+
+Run from the repository root with, for example:
+
+    python -m benchmarks.suite --output before.json
+    python -m benchmarks.suite --scenario tiny --scenario nested-1k \
+        --compare before.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import git
+
+from rc4me.rcmanager import RcManager
+from rc4me.timing import Profiler
+
+# Top-level rc files in every synthetic repo. The destination starts out with
+# real files of the same names, so apply backs them up and reset restores them.
+RC_FILES = ["bashrc", "vimrc", "gitconfig", "inputrc", "tmux.conf"]
+
+# Files per directory of nested trees
+FANOUT = 10
+
+_IDENTITY = {
+    "GIT_AUTHOR_NAME": "rc4me",
+    "GIT_AUTHOR_EMAIL": "rc4me@localhost",
+    "GIT_COMMITTER_NAME": "rc4me",
+    "GIT_COMMITTER_EMAIL": "rc4me@localhost",
+}
+
+
+class Scenario(NamedTuple):
+    """Shape of a synthetic config repo."""
+
+    # Files in nested directories, on top of RC_FILES
+    nested_files: int = 0
+    # Depth of the nested directories
+    depth: int = 3
+    # Number and size in bytes of large top-level rc files
+    large_files: int = 0
+    large_size: int = 16 << 20
+
+
+SCENARIOS = {
+    "tiny": Scenario(nested_files=10, depth=1),
+    "nested-1k": Scenario(nested_files=1000),
+    "nested-100k": Scenario(nested_files=100_000),
+    "large-files": Scenario(large_files=4),
+}
+
+# Timed operations, in the order they run
+OPERATIONS = ["apply", "fetch", "fetch-ttl", "revert", "select", "reset"]
+
+
+def make_repo(root: Path, scenario: Scenario) -> Path:
+    """Write the files of a scenario into a new directory."""
+    root.mkdir(parents=True)
+    for name in RC_FILES:
+        (root / name).write_text(f"# {name}\n")
+    for i in range(scenario.large_files):
+        (root / f"large{i}").write_bytes(os.urandom(scenario.large_size))
+    for i in range(scenario.nested_files):
+        # Spread files over a tree with FANOUT entries per level
+        parts = [
+            f"d{(i // FANOUT ** (level + 1)) % FANOUT}"
+            for level in range(scenario.depth)
+        ]
+        directory = root.joinpath("config", *parts)
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / f"file{i}").write_text(f"{i}\n")
+    return root
+
+
+def make_remote(root: Path, name: str, scenario: Scenario) -> Path:
+    """Commit a scenario repo and clone it to a local bare remote."""
+    work = make_repo(root / "work" / name, scenario)
+    repo = git.Repo.init(work, initial_branch="master")
+    repo.git.update_environment(**_IDENTITY)
+    repo.git.add(all=True)
+    # The git CLI commits large trees much faster than GitPython's index
+    repo.git.commit("--quiet", "-m", f"Add {name}")
+    remote = root / "remotes" / f"{name}.git"
+    repo.clone(remote, bare=True)
+    return remote
+
+
+def make_dest(dest: Path, scenario: Scenario) -> None:
+    """Create a destination with real files that rc4me has to back up."""
+    dest.mkdir(parents=True)
+    for name in RC_FILES:
+        (dest / f".{name}").write_text(f"# my {name}\n")
+    for i in range(scenario.large_files):
+        (dest / f".large{i}").write_bytes(os.urandom(scenario.large_size))
+
+
+def _timed(func: Callable[[], object]) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def run_once(tmp: Path, remote: Path, scenario: Scenario) -> Dict[str, float]:
+    """Run every operation once against a fresh rc4me home and destination."""
+    home, dest = tmp / "home", tmp / "dest"
+    make_dest(dest, scenario)
+    rcmanager = RcManager(home, dest, dir_mode="files")
+    # A manager that skips remote checks of recently fetched repos
+    cached = RcManager(home, dest, dir_mode="files", fetch_ttl=3600)
+
+    def apply():
+        rcmanager.fetch_repo(str(remote))
+        rcmanager.change_current_to_fetched_repo()
+
+    seconds = {
+        "apply": _timed(apply),
+        "fetch": _timed(lambda: rcmanager.fetch_repo(str(remote))),
+        "fetch-ttl": _timed(lambda: cached.fetch_repo(str(remote))),
+        "revert": _timed(rcmanager.change_current_to_prev),
+        "select": _timed(rcmanager.repo_infos),
+    }
+    # Revert went back to init, switch to the repo again so reset has work
+    rcmanager.change_current_to_fetched_repo()
+    seconds["reset"] = _timed(rcmanager.change_current_to_init)
+    return seconds
+
+
+def count_files(tmp: Path, remote: Path, scenario: Scenario) -> Dict[str, int]:
+    """Profile one apply and reset to report how many files they touch."""
+    profiler = Profiler()
+    make_dest(tmp / "dest", scenario)
+    rcmanager = RcManager(
+        tmp / "home", tmp / "dest", dir_mode="files", profiler=profiler
+    )
+    rcmanager.fetch_repo(str(remote))
+    rcmanager.change_current_to_fetched_repo()
+    rcmanager.change_current_to_init()
+    return profiler.summary()["counters"]
+
+
+def run_scenario(tmp: Path, name: str, repeat: int) -> Dict[str, object]:
+    """Time the operations of a scenario, keeping the best of `repeat` runs."""
+    scenario = SCENARIOS[name]
+    start = time.perf_counter()
+    remote = make_remote(tmp, name, scenario)
+    print(f"{name}: generated in {time.perf_counter() - start:.1f}s")
+    runs = []
+    for i in range(repeat):
+        runs.append(run_once(tmp / f"{name}-run{i}", remote, scenario))
+    best = {op: min(run[op] for run in runs) for op in OPERATIONS}
+    for op in OPERATIONS:
+        print(f"{name:>14} {op:>10} {best[op] * 1e3:>10.2f}ms")
+    return {
+        "scenario": scenario._asdict(),
+        "counters": count_files(tmp / f"{name}-count", remote, scenario),
+        "seconds": best,
+    }
+
+
+def _git_revision() -> Optional[str]:
+    """Commit of the rc4me checkout being benchmarked, if known."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=Path(__file__).parent,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(
+    base: Dict[str, object],
+    results: Dict[str, object],
+    threshold: float,
+    min_seconds: float,
+) -> List[str]:
+    """Print the ratio of each time to base and return the regressions.
+
+    An operation regresses if it is more than `threshold` times slower and
+    at least `min_seconds` slower than in base, which ignores noise in
+    operations that take a few milliseconds.
+    """
+    regressions = []
+    print(f"{'scenario':>14} {'operation':>10} {'base':>10} {'now':>10} {'ratio':>7}")
+    for name, result in results["scenarios"].items():
+        if name not in base["scenarios"]:
+            continue
+        base_seconds = base["scenarios"][name]["seconds"]
+        for op, seconds in result["seconds"].items():
+            if op not in base_seconds:
+                continue
+            ratio = seconds / base_seconds[op] if base_seconds[op] else float("inf")
+            slower = ratio > threshold and seconds - base_seconds[op] > min_seconds
+            if slower:
+                regressions.append(f"{name} {op}")
+            print(
+                f"{name:>14} {op:>10} {base_seconds[op] * 1e3:>8.2f}ms "
+                f"{seconds * 1e3:>8.2f}ms {ratio:>6.2f}x{' !' if slower else ''}"
+            )
+    return regressions
+
+
+def main(args: argparse.Namespace) -> int:
+    # Per-file log lines would dominate the measurement
+    logging.disable(logging.INFO)
+    results = {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "git": git.Git().version(),
+        "repeat": args.repeat,
+        "scenarios": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in args.scenario or list(SCENARIOS):
+            results["scenarios"][name] = run_scenario(Path(tmp), name, args.repeat)
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2) + "\n")
+    if not args.compare:
+        return 0
+    base = json.loads(Path(args.compare).read_text())
+    regressions = compare(base, results, args.threshold, args.min_seconds)
+    if regressions:
+        print(f"regressions: {', '.join(regressions)}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=list(SCENARIOS),
+        help="Scenario to run, repeatable. Defaults to all of them.",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="File to write the results to as JSON.")
+    parser.add_argument("--compare", help="Earlier results to compare against.")
+    parser.add_argument("--threshold", type=float, default=1.25)
+    parser.add_argument("--min-seconds", type=float, default=0.005)
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,257 @@
+"""Run many rc4me operations from a plan file in one process.
+
+A plan lists operations as JSON lines,
+
+    {"command": "apply", "repo": "jeffmm/vimrc", "dest": "/srv/alice"}
+    {"command": "revert", "dest": "/srv/alice"}
+
+or as a TOML array of `op` tables:
+
+    [[op]]
+    command = "select"
+    repo = "vimrc"
+    dest = "/srv/bob"
+
+Each operation has a `command` (apply, revert, reset or select), a `repo` for
+apply (a local path or GitHub repo) and select (a repo name in the rc4me
+home), a `dest` and a `home`, which defaults to `.rc4me` in dest.
+
+Operations that share a home or a dest run in plan order, and each repo is
+fetched at most once per home. Independent destinations run in parallel.
+"""
+
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from rc4me.plan import Op
+from rc4me.rcmanager import RcManager
+
+logger = logging.getLogger(__name__)
+
+COMMANDS = ("apply", "revert", "reset", "select")
+# Commands that take a repo
+REPO_COMMANDS = ("apply", "select")
+
+
+class BatchOp(NamedTuple):
+    """A single operation of a batch plan."""
+
+    command: str
+    dest: Path
+    home: Path
+    repo: Optional[str] = None
+
+
+class BatchResult(NamedTuple):
+    """Outcome of a single operation of a batch plan.
+
+    Attributes:
+        index: Position of the operation in the plan, starting at 1.
+        op: The operation.
+        seconds: Wall time spent on the operation.
+        changes: Number of file operations it planned (and ran).
+        error: Error message if the operation failed, otherwise None.
+    """
+
+    index: int
+    op: BatchOp
+    seconds: float = 0.0
+    changes: int = 0
+    error: Optional[str] = None
+
+    def __str__(self) -> str:
+        repo = f" {self.op.repo}" if self.op.repo else ""
+        if self.error is not None:
+            status = f"failed: {self.error}"
+        else:
+            status = f"{self.changes} change(s)"
+        return (
+            f"{self.index}: {self.op.command}{repo} in {self.op.dest} "
+            f"({self.seconds * 1e3:.1f}ms) {status}"
+        )
+
+    def to_dict(self) -> Dict[str, object]:
+        """Return the result as a JSON-serializable dict."""
+        return {
+            "index": self.index,
+            "command": self.op.command,
+            "repo": self.op.repo,
+            "dest": str(self.op.dest),
+            "home": str(self.op.home),
+            "seconds": self.seconds,
+            "changes": self.changes,
+            "error": self.error,
+        }
+
+
+def _path(value: str) -> Path:
+    return Path(os.path.abspath(os.path.expanduser(value)))
+
+
+def parse_op(raw: Dict[str, str], default_dest: Path, where: str) -> BatchOp:
+    """Validate one operation of a plan.
+
+    Args:
+        raw: The operation as read from the plan.
+        default_dest: Dest of operations that do not set one.
+        where: Location of the operation in the plan, for error messages.
+
+    Raises:
+        ValueError: If the operation is malformed.
+    """
+    if not isinstance(raw, dict):
+        raise ValueError(f"{where}: expected a table of operation fields")
+    unknown = set(raw) - set(BatchOp._fields)
+    if unknown:
+        raise ValueError(f"{where}: unknown fields {', '.join(sorted(unknown))}")
+    command = raw.get("command")
+    if command not in COMMANDS:
+        raise ValueError(f"{where}: command must be one of {', '.join(COMMANDS)}")
+    repo = raw.get("repo")
+    if command in REPO_COMMANDS and not repo:
+        raise ValueError(f"{where}: {command} needs a repo")
+    dest = _path(raw["dest"]) if "dest" in raw else Path(default_dest)
+    home = _path(raw["home"]) if "home" in raw else dest / ".rc4me"
+    return BatchOp(command, dest, home, repo)
+
+
+def _load_toml(text: str) -> Dict[str, object]:
+    try:
+        import tomllib
+    except ImportError:  # Python < 3.11
+        try:
+            import tomli as tomllib
+        except ImportError:
+            raise ImportError(
+                "Reading TOML plans needs Python 3.11 or the tomli package"
+            ) from None
+    return tomllib.loads(text)
+
+
+def load_plan(path: Path, default_dest: Path) -> List[BatchOp]:
+    """Read a plan from a TOML file (by its suffix) or a JSON-lines file.
+
+    Raises:
+        ValueError: If the plan can't be parsed or an operation is malformed.
+    """
+    path = Path(path)
+    text = path.read_text()
+    if path.suffix == ".toml":
+        raws = _load_toml(text).get("op", [])
+        return [
+            parse_op(raw, default_dest, f"{path} op {i}")
+            for i, raw in enumerate(raws, 1)
+        ]
+    ops = []
+    for lineno, line in enumerate(text.splitlines(), 1):
+        if line.strip():
+            ops.append(parse_op(json.loads(line), default_dest, f"{path}:{lineno}"))
+    return ops
+
+
+def _groups(ops: List[BatchOp]) -> List[List[int]]:
+    """Split operations into groups that share no home or dest.
+
+    Returns:
+        Indices into ops of each group, in plan order.
+    """
+    parent = list(range(len(ops)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    first: Dict[Tuple[str, Path], int] = {}
+    for i, op in enumerate(ops):
+        for key in (("home", op.home), ("dest", op.dest)):
+            parent[find(i)] = find(first.setdefault(key, i))
+    groups: Dict[int, List[int]] = {}
+    for i in range(len(ops)):
+        groups.setdefault(find(i), []).append(i)
+    return list(groups.values())
+
+
+def _run_op(
+    rcmanager: RcManager,
+    op: BatchOp,
+    fetched: Dict[Tuple[Path, str], Path],
+    pull: bool,
+) -> List[Op]:
+    """Run one operation, fetching each repo once per home."""
+    if op.command == "apply":
+        key = (op.home, op.repo)
+        if key in fetched:
+            rcmanager.repo_path = fetched[key]
+        else:
+            rcmanager.fetch_repo(op.repo, confirm=lambda: pull)
+            fetched[key] = rcmanager.repo_path
+        return rcmanager.change_current_to_fetched_repo()
+    if op.command == "revert":
+        return rcmanager.change_current_to_prev()
+    if op.command == "reset":
+        return rcmanager.change_current_to_init()
+    repos = rcmanager.get_rc_repos()
+    if op.repo not in repos:
+        raise ValueError(f"No repo named {op.repo} in {op.home}")
+    return rcmanager.change_current_to_repo(repos[op.repo])
+
+
+def _run_group(
+    template: RcManager, ops: List[BatchOp], group: List[int], pull: bool
+) -> List[BatchResult]:
+    """Run a group of operations in order, skipping the rest after a failure."""
+    fetched: Dict[Tuple[Path, str], Path] = {}
+    results = []
+    failed = None
+    for i in group:
+        op = ops[i]
+        if failed is not None:
+            results.append(BatchResult(i + 1, op, error=f"skipped, {failed} failed"))
+            continue
+        start = time.perf_counter()
+        try:
+            # A fresh manager per operation, so none works from stale state
+            # that another operation on the same home has changed
+            rcmanager = template.for_paths(op.home, op.dest)
+            changes = _run_op(rcmanager, op, fetched, pull)
+        except Exception as e:
+            logger.debug(f"Operation {i + 1} failed", exc_info=True)
+            failed = f"operation {i + 1}"
+            seconds = time.perf_counter() - start
+            results.append(BatchResult(i + 1, op, seconds, error=str(e)))
+            continue
+        seconds = time.perf_counter() - start
+        results.append(BatchResult(i + 1, op, seconds, len(changes)))
+    return results
+
+
+def run_batch(
+    template: RcManager, ops: List[BatchOp], workers: int = 4, pull: bool = False
+) -> List[BatchResult]:
+    """Run the operations of a plan.
+
+    Args:
+        template: Manager whose options (link mode, dirs, ...) every
+            operation uses, see `RcManager.for_paths`.
+        ops: Operations from `load_plan`.
+        workers: Maximum number of independent destinations switched at once.
+        pull: Pull new commits into repos that are applied. Otherwise they
+            are applied as cloned.
+
+    Returns:
+        One result per operation, in plan order.
+    """
+    groups = _groups(ops)
+    with ThreadPoolExecutor(max(1, min(workers, len(groups)))) as pool:
+        results = pool.map(lambda group: _run_group(template, ops, group, pull), groups)
+        return sorted(
+            (result for group in results for result in group),
+            key=lambda result: result.index,
+        )
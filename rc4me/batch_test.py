@@ -0,0 +1,81 @@
+import json
+
+import pytest
+
+from rc4me.batch import BatchOp, _groups, load_plan, run_batch
+from rc4me.rcmanager import RcManager
+from rc4me.timing import Profiler
+
+
+def test_load_plan_jsonl(tmp_path):
+    plan = tmp_path / "plan.jsonl"
+    ops = [
+        {"command": "apply", "repo": "jeffmm/vimrc", "dest": str(tmp_path / "a")},
+        {"command": "revert", "home": str(tmp_path / "home")},
+    ]
+    plan.write_text("\n".join(json.dumps(op) for op in ops) + "\n\n")
+    assert load_plan(plan, tmp_path / "b") == [
+        BatchOp("apply", tmp_path / "a", tmp_path / "a" / ".rc4me", "jeffmm/vimrc"),
+        BatchOp("revert", tmp_path / "b", tmp_path / "home"),
+    ]
+
+
+def test_load_plan_toml(tmp_path):
+    plan = tmp_path / "plan.toml"
+    plan.write_text(
+        f'[[op]]\ncommand = "select"\nrepo = "vimrc"\ndest = "{tmp_path}"\n'
+    )
+    assert load_plan(plan, tmp_path) == [
+        BatchOp("select", tmp_path, tmp_path / ".rc4me", "vimrc")
+    ]
+
+
+@pytest.mark.parametrize(
+    "op,message",
+    [
+        ({"command": "pull"}, "command must be"),
+        ({"command": "apply"}, "needs a repo"),
+        ({"command": "reset", "force": True}, "unknown fields force"),
+    ],
+)
+def test_load_plan_errors(tmp_path, op, message):
+    plan = tmp_path / "plan.jsonl"
+    plan.write_text(json.dumps(op))
+    with pytest.raises(ValueError, match=message):
+        load_plan(plan, tmp_path)
+
+
+def test_groups(tmp_path):
+    ops = [
+        BatchOp("reset", tmp_path / "a", tmp_path / "h1"),
+        BatchOp("reset", tmp_path / "b", tmp_path / "h2"),
+        BatchOp("reset", tmp_path / "c", tmp_path / "h1"),
+        BatchOp("reset", tmp_path / "b", tmp_path / "h3"),
+    ]
+    assert sorted(_groups(ops)) == [[0, 2], [1, 3]]
+
+
+def test_run_batch(tmp_path, rc1_git):
+    dests = [tmp_path / "a", tmp_path / "b"]
+    ops = []
+    for dest in dests:
+        dest.mkdir()
+        ops += [
+            BatchOp("apply", dest, dest / ".rc4me", str(rc1_git)),
+            BatchOp("reset", dest, dest / ".rc4me"),
+            BatchOp("apply", dest, dest / ".rc4me", str(rc1_git)),
+            BatchOp("select", dest, dest / ".rc4me", "missing"),
+            BatchOp("revert", dest, dest / ".rc4me"),
+        ]
+    profiler = Profiler()
+    template = RcManager(tmp_path / "home", tmp_path, profiler=profiler)
+    results = run_batch(template, ops, workers=2)
+    assert [result.index for result in results] == list(range(1, 11))
+    for dest in dests:
+        assert (dest / ".bashrc").read_text() == "foo"
+    errors = [result.error for result in results]
+    assert errors[:3] == [None, None, None]
+    assert "No repo named missing" in errors[3]
+    assert errors[4] == "skipped, operation 4 failed"
+    # Each repo is cloned once per home, and not fetched again
+    assert profiler.summary()["spans"]["git"]["count"] == 2
@@ -0,0 +1,282 @@
+"""Offline config bundles: a config repo packed into a single archive.
+
+Hosts that cannot clone can still apply a config from a bundle,
+
+    rc4me bundle export jeffmm/vimrc -o vimrc.rc4me.tar.gz
+    rc4me apply vimrc.rc4me.tar.gz
+
+A bundle is a gzipped tar of the repo's files, without `.git`. Its first
+member is a manifest with the repo name, the commit it was exported at and
+the SHA-256 of every file, so importing can stream the archive straight into
+the rc4me home, checking each file as it is written, and skip the work if the
+same bundle was already imported. Files are extracted into a staging
+directory next to the repo, which then replaces the repo with a rename.
+"""
+
+import hashlib
+import io
+import json
+import logging
+import os
+import posixpath
+import shutil
+import tarfile
+import time
+import zlib
+from pathlib import Path
+from typing import IO, TYPE_CHECKING, Dict, Iterator, NamedTuple, Optional, Union
+
+from rc4me.manifest import read_head
+from rc4me.store import hash_file
+from rc4me.walk import ALWAYS_EXCLUDE
+
+if TYPE_CHECKING:
+    from rc4me.rcmanager import RcManager
+
+logger = logging.getLogger(__name__)
+
+# Bump when the bundle layout changes; older rc4me versions refuse new bundles
+BUNDLE_VERSION = 1
+MANIFEST_NAME = "rc4me-bundle.json"
+SUFFIX = ".rc4me.tar.gz"
+_CHUNK_SIZE = 1 << 20
+# Entries of the rc4me home that are not config repos
+RESERVED_NAMES = ("init", "current", "prev")
+
+
+class BundleManifest(NamedTuple):
+    """Contents of a bundle.
+
+    Attributes:
+        name: Directory name of the repo in the rc4me home.
+        head: Commit the repo was exported at, or None if it is not a git repo.
+        files: SHA-256 hex digest of each regular file, by relative path.
+        links: Target of each symlink, by relative path.
+    """
+
+    name: str
+    head: Optional[str]
+    files: Dict[str, str]
+    links: Dict[str, str]
+
+
+def is_bundle(path: Path) -> bool:
+    """Check if a path is a bundle file, going by its name."""
+    return path.name.endswith(SUFFIX) and path.is_file()
+
+
+def _check_repo_name(name: str) -> None:
+    """Reject repo names that would replace rc4me's own entries of the home."""
+    if not name or "/" in name or name.startswith(".") or name in RESERVED_NAMES:
+        raise ValueError(f"Bundle has an invalid repo name {name!r}")
+
+
+def _walk(repo: Path) -> Iterator[str]:
+    """Relative paths of the files and symlinks of a repo, outside `.git`."""
+    stack = [(os.fspath(repo), "")]
+    while stack:
+        path, rel_dir = stack.pop()
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.name in ALWAYS_EXCLUDE:
+                    continue
+                rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append((entry.path, rel))
+                else:
+                    yield rel
+
+
+def _normalize(info: tarfile.TarInfo) -> tarfile.TarInfo:
+    """Drop the owner of a member, which means nothing on another host.
+
+    Sub-second mtimes are dropped too; they need a pax header per member,
+    which doubles the headers to parse on import.
+    """
+    info.uid = info.gid = 0
+    info.uname = info.gname = ""
+    info.mtime = int(info.mtime)
+    return info
+
+
+def export_bundle(repo: Path, out: Path, level: int = 6) -> BundleManifest:
+    """Pack the files of a config repo into a bundle.
+
+    Args:
+        repo: Config repo to pack.
+        out: Bundle file to write.
+        level: gzip compression level, from 1 (fastest) to 9 (smallest).
+
+    Raises:
+        ValueError: If repo is named like an entry of the rc4me home, e.g.
+            init.
+    """
+    repo = Path(repo).resolve()
+    _check_repo_name(repo.name)
+    files, links = {}, {}
+    for rel in sorted(_walk(repo)):
+        path = repo / rel
+        if path.is_symlink():
+            links[rel] = os.readlink(path)
+        else:
+            files[rel] = hash_file(path)
+    manifest = BundleManifest(repo.name, read_head(repo), files, links)
+    data = json.dumps({"version": BUNDLE_VERSION, **manifest._asdict()}).encode()
+    out = Path(out)
+    tmp = out.with_name(f".{out.name}.{os.getpid()}.tmp")
+    with tarfile.open(tmp, "w:gz", compresslevel=level) as tar:
+        info = tarfile.TarInfo(MANIFEST_NAME)
+        info.size, info.mtime = len(data), int(time.time())
+        tar.addfile(info, io.BytesIO(data))
+        for rel in sorted(files.keys() | links.keys()):
+            tar.add(repo / rel, arcname=rel, recursive=False, filter=_normalize)
+    os.replace(tmp, out)
+    logger.info(f"Exported {len(files)} files of {repo.name} to {out}")
+    return manifest
+
+
+def _read_manifest(tar: tarfile.TarFile, member: Optional[tarfile.TarInfo]):
+    """Parse the manifest, which must be the first member of a bundle."""
+    if member is None or member.name != MANIFEST_NAME or not member.isfile():
+        raise ValueError("Not an rc4me bundle: it does not start with a manifest")
+    raw = tar.extractfile(member).read()
+    data = json.loads(raw)
+    if data.pop("version", None) != BUNDLE_VERSION:
+        raise ValueError("Bundle was made by an incompatible rc4me version")
+    try:
+        manifest = BundleManifest(**data)
+    except TypeError:
+        raise ValueError("Bundle has a malformed manifest") from None
+    _check_repo_name(manifest.name)
+    return manifest, hashlib.sha256(raw).hexdigest()
+
+
+def _check_name(manifest: BundleManifest, name: str) -> str:
+    """Reject member paths that would land outside the repo or in a symlink."""
+    rel = posixpath.normpath(name)
+    if rel != name or rel.startswith(("/", "../")) or rel in (".", ".."):
+        raise ValueError(f"Bundle member {name!r} is outside the repo")
+    parts = rel.split("/")
+    for i in range(1, len(parts)):
+        if "/".join(parts[:i]) in manifest.links:
+            raise ValueError(f"Bundle member {name!r} is inside a symlink")
+    return rel
+
+
+def _write_checked(source: IO[bytes], path: Path, digest: str, mode: int):
+    """Stream a member to path, checking its contents against the manifest."""
+    hasher = hashlib.sha256()
+    # Created with its mode (less the umask, as git does), saving a chmod
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, mode & 0o777)
+    with open(fd, "wb") as out:
+        for chunk in iter(lambda: source.read(_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+            out.write(chunk)
+    if hasher.hexdigest() != digest:
+        raise ValueError(f"Checksum mismatch for {path.name}, the bundle is corrupt")
+
+
+def _extract(tar: tarfile.TarFile, manifest: BundleManifest, root: Path) -> None:
+    """Extract the remaining members of a bundle into a new directory."""
+    root.mkdir()
+    seen = set()
+    made = {root}
+    for member in iter(tar.next, None):
+        rel = _check_name(manifest, member.name)
+        path = root / rel
+        if path.parent not in made:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            made.add(path.parent)
+        if member.issym() and manifest.links.get(rel) == member.linkname:
+            os.symlink(member.linkname, path)
+        elif member.isfile() and rel in manifest.files:
+            source = tar.extractfile(member)
+            _write_checked(source, path, manifest.files[rel], member.mode)
+        else:
+            raise ValueError(f"Bundle member {rel!r} is not in its manifest")
+        seen.add(rel)
+    missing = len(manifest.files.keys() | manifest.links.keys()) - len(seen)
+    if missing:
+        raise ValueError(f"Bundle is truncated, {missing} file(s) are missing")
+
+
+def _replace(staging: Path, repo_path: Path) -> None:
+    """Move an extracted repo into place, replacing any existing one."""
+    if not repo_path.exists():
+        os.rename(staging, repo_path)
+        return
+    logger.info(f"Replacing {repo_path.name} with the bundle")
+    old = repo_path.with_name(f".{repo_path.name}.old.{os.getpid()}")
+    os.rename(repo_path, old)
+    os.rename(staging, repo_path)
+    shutil.rmtree(old)
+
+
+def _open(bundle: Union[Path, IO[bytes]]) -> tarfile.TarFile:
+    # Stream mode reads the archive front to back, without seeking
+    if isinstance(bundle, Path):
+        return tarfile.open(bundle, "r|gz", bufsize=_CHUNK_SIZE)
+    return tarfile.open(fileobj=bundle, mode="r|gz", bufsize=_CHUNK_SIZE)
+
+
+def import_bundle(rcmanager: "RcManager", bundle: Union[Path, IO[bytes]]) -> Path:
+    """Unpack a bundle into the rc4me home as a config repo.
+
+    Importing the same bundle again only reads its manifest.
+
+    Args:
+        rcmanager: Manager of the rc4me home to import into.
+        bundle: Bundle file, or a binary stream of one such as stdin.
+
+    Returns:
+        Path of the imported repo, also set as `rcmanager.repo_path`.
+
+    Raises:
+        ValueError: If the bundle is not an rc4me bundle or is corrupt.
+    """
+    try:
+        with rcmanager.profiler.span("bundle"), _open(bundle) as tar:
+            repo_path = _import(rcmanager, tar)
+    except (tarfile.TarError, EOFError, zlib.error) as e:
+        raise ValueError(f"Bundle is corrupt: {e}") from e
+    rcmanager.repo_path = repo_path
+    with rcmanager._locked():
+        rcmanager.catalog.update(repo_path)
+    return repo_path
+
+
+def _import(rcmanager: "RcManager", tar: tarfile.TarFile) -> Path:
+    """Unpack an opened bundle, unless it was already imported."""
+    manifest, digest = _read_manifest(tar, tar.next())
+    repo_path = rcmanager.home / manifest.name
+    bundles = rcmanager.home / ".bundles"
+    bundles.mkdir(exist_ok=True)
+    record = bundles / f"{manifest.name}.json"
+    with rcmanager._repo_locked(repo_path):
+        if repo_path.is_dir() and _load_digest(record) == digest:
+            logger.info(f"Bundle of {manifest.name} is already imported")
+            return repo_path
+        staging = rcmanager.home / f".{manifest.name}.import.{os.getpid()}"
+        try:
+            _extract(tar, manifest, staging)
+            _replace(staging, repo_path)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        _save_record(record, manifest, digest)
+    logger.info(f"Imported {len(manifest.files)} files of {manifest.name}")
+    return repo_path
+
+
+def _load_digest(record: Path) -> Optional[str]:
+    try:
+        return json.loads(record.read_text())["digest"]
+    except (FileNotFoundError, ValueError, KeyError):
+        return None
+
+
+def _save_record(record: Path, manifest: BundleManifest, digest: str) -> None:
+    """Remember which bundle a repo was imported from."""
+    data = {"digest": digest, "head": manifest.head, "time": time.time()}
+    tmp = record.with_name(f".{record.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(data))
+    os.replace(tmp, record)
@@ -0,0 +1,81 @@
+import gzip
+import io
+import json
+import os
+import tarfile
+
+import pytest
+
+from rc4me.bundle import BUNDLE_VERSION, MANIFEST_NAME, export_bundle, import_bundle
+from rc4me.rcmanager import RcManager
+
+
+def test_bundle_round_trip(tmp_path, rc1_git):
+    (rc1_git / "vim").mkdir()
+    (rc1_git / "vim" / "plugin.vim").write_text("set nu")
+    os.symlink("vim/plugin.vim", rc1_git / "exrc")
+    out = tmp_path / "rc1.rc4me.tar.gz"
+    manifest = export_bundle(rc1_git, out)
+    assert sorted(manifest.files) == ["bashrc", "vim/plugin.vim", "vimrc"]
+    assert manifest.links == {"exrc": "vim/plugin.vim"}
+
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    rcmanager = RcManager(tmp_path / "home", dest, offline=True)
+    # Apply reads the bundle directly, without the network or git
+    rcmanager.fetch_repo(str(out))
+    repo = rcmanager.home / rc1_git.name
+    assert rcmanager.repo_path == repo
+    assert (repo / "vim" / "plugin.vim").read_text() == "set nu"
+    assert os.readlink(repo / "exrc") == "vim/plugin.vim"
+    assert not (repo / ".git").exists()
+    rcmanager.change_current_to_fetched_repo()
+    assert (dest / ".bashrc").read_text() == "foo"
+    # Importing the same bundle again leaves the repo alone
+    mtime = (repo / "bashrc").stat().st_mtime_ns
+    with open(out, "rb") as stream:
+        assert import_bundle(rcmanager, stream) == repo
+    assert (repo / "bashrc").stat().st_mtime_ns == mtime
+
+
+def test_corrupt_bundle(tmp_path, rc1):
+    out = tmp_path / "rc1.rc4me.tar.gz"
+    export_bundle(rc1, out)
+    data = bytearray(gzip.decompress(out.read_bytes()))
+    # Flip a bit of the contents of vimrc
+    data[data.index(b"blahblah")] ^= 1
+    out.write_bytes(gzip.compress(bytes(data)))
+    rcmanager = RcManager(tmp_path / "home", tmp_path / "dest")
+    with pytest.raises(ValueError, match="Checksum mismatch"):
+        import_bundle(rcmanager, out)
+    assert not (rcmanager.home / rc1.name).exists()
+    assert [p.name for p in rcmanager.home.glob(".*.import.*")] == []
+    out.write_bytes(b"not a bundle")
+    with pytest.raises(ValueError, match="corrupt"):
+        import_bundle(rcmanager, out)
+
+
+@pytest.mark.parametrize("name", ["init", "current", "prev"])
+def test_reserved_bundle_names(tmp_path, name):
+    rcmanager = RcManager(tmp_path / "home", tmp_path / "dest")
+    (rcmanager.init / "bashrc").write_text("backup")
+    out = tmp_path / f"{name}.rc4me.tar.gz"
+    with pytest.raises(ValueError, match="invalid repo name"):
+        export_bundle(rcmanager.home / name, out)
+    # A bundle made by other means is refused on import as well
+    data = json.dumps(
+        {
+            "version": BUNDLE_VERSION,
+            "name": name,
+            "head": None,
+            "files": {},
+            "links": {},
+        }
+    ).encode()
+    with tarfile.open(out, "w:gz") as tar:
+        info = tarfile.TarInfo(MANIFEST_NAME)
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+    with pytest.raises(ValueError, match="invalid repo name"):
+        import_bundle(rcmanager, out)
+    assert [p.name for p in rcmanager.init.iterdir()] == ["bashrc"]
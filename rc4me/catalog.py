@@ -0,0 +1,210 @@
+"""Cached metadata of the config repos in an rc4me home.
+
+`rc4me select` lists every repo with its HEAD commit, when it was last
+fetched, and how many files it holds. Counting files walks the whole repo, so
+the results are kept in `.catalog.json` of the rc4me home and only recomputed
+for repos whose HEAD or directory mtime changed, as for `rc4me.manifest`.
+Fetching or applying a repo updates its entry. Listings only hold a shared
+lock on the home, so the file is always replaced atomically.
+"""
+
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from rc4me.freshness import FetchCache
+from rc4me.manifest import read_head
+
+logger = logging.getLogger(__name__)
+
+# Bump when the catalog layout changes so old files are rebuilt
+CATALOG_VERSION = 1
+
+
+class RepoInfo(NamedTuple):
+    """Metadata of one config repo.
+
+    Attributes:
+        name: Directory name of the repo in the rc4me home.
+        path: Path of the repo.
+        head: Commit hash of the repo HEAD, or None if it is not a git repo.
+        fetched: When the repo was last fetched, in seconds since the epoch,
+            or None if it never was.
+        files: Number of files in the repo, outside `.git`.
+        size: Total size of those files in bytes.
+        mtime_ns: Modification time of the repo directory when counted.
+    """
+
+    name: str
+    path: str
+    head: Optional[str]
+    fetched: Optional[float]
+    files: int
+    size: int
+    mtime_ns: int
+
+
+def _count_files(root: Path) -> Tuple[int, int]:
+    """Count the files of a repo and their total size, without following links."""
+    files = size = 0
+    stack = [str(root)]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name != ".git":
+                        stack.append(entry.path)
+                    continue
+                files += 1
+                size += entry.stat(follow_symlinks=False).st_size
+    return files, size
+
+
+def fuzzy_score(query: str, text: str) -> Optional[int]:
+    """Score how well query matches text as a case-insensitive subsequence.
+
+    Consecutive matches and matches at the start of a word score higher, so
+    "vrc" ranks "vimrc" above "very_long_rc".
+
+    Returns:
+        The score, higher is better, or None if query does not match.
+    """
+    text_lower = text.lower()
+    score = 0
+    last = -1
+    for char in query.lower():
+        pos = text_lower.find(char, last + 1)
+        if pos < 0:
+            return None
+        if pos == last + 1:
+            score += 3
+        elif not text[pos - 1].isalnum():
+            score += 2
+        else:
+            score -= min(pos - last - 1, 3)
+        last = pos
+    if query.lower() == text_lower:
+        score += 10
+    return score
+
+
+def filter_repos(infos: Iterable[RepoInfo], query: str) -> List[RepoInfo]:
+    """Repos whose name fuzzy-matches query, best match first.
+
+    An empty query matches every repo, in name order.
+    """
+    scored = []
+    for info in infos:
+        score = fuzzy_score(query, info.name)
+        if score is not None:
+            scored.append((-score, info.name, info))
+    return [info for _, _, info in sorted(scored)]
+
+
+class Catalog:
+    """Repo metadata of an rc4me home, stored as a single JSON file."""
+
+    def __init__(self, path: Path, fetch_cache: Optional[FetchCache] = None):
+        """Initialize the catalog file.
+
+        Args:
+            path: File holding the catalog, e.g. `~/.rc4me/.catalog.json`.
+            fetch_cache: Fetch records that repos new to the catalog take
+                their fetch time from.
+        """
+        self.path = Path(path)
+        self.fetch_cache = fetch_cache
+
+    def load(self) -> Dict[str, RepoInfo]:
+        """Load the cached entries, keyed on repo name."""
+        try:
+            data = json.loads(self.path.read_text())
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            logger.warning(f"Ignoring unreadable catalog {self.path}")
+            return {}
+        if data.get("version") != CATALOG_VERSION:
+            return {}
+        try:
+            return {name: RepoInfo(**info) for name, info in data["repos"].items()}
+        except (KeyError, TypeError):
+            return {}
+
+    def _save(self, infos: Dict[str, RepoInfo]) -> None:
+        data = {
+            "version": CATALOG_VERSION,
+            "repos": {name: info._asdict() for name, info in sorted(infos.items())},
+        }
+        # Listings save it under a shared lock, so threads need their own file
+        tmp = self.path.with_name(
+            f".{self.path.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+        )
+        tmp.write_text(json.dumps(data))
+        os.replace(tmp, self.path)
+
+    @staticmethod
+    def _is_fresh(info: Optional[RepoInfo], path: Path) -> bool:
+        return (
+            info is not None
+            and info.path == str(path)
+            and info.mtime_ns == path.stat().st_mtime_ns
+            and info.head == read_head(path)
+        )
+
+    def scan(self, path: Path, fetched: Optional[float] = None) -> RepoInfo:
+        """Compute the metadata of a repo from disk."""
+        if fetched is None and self.fetch_cache is not None:
+            record = self.fetch_cache.load(path)
+            fetched = record.fetched_at if record else None
+        mtime_ns = path.stat().st_mtime_ns
+        files, size = _count_files(path)
+        return RepoInfo(
+            path.name, str(path), read_head(path), fetched, files, size, mtime_ns
+        )
+
+    def update(self, path: Path, fetched: Optional[float] = None) -> RepoInfo:
+        """Update the entry of one repo, rescanning it only if it changed.
+
+        Args:
+            path: Path of the repo.
+            fetched: When the repo was just fetched, if it was.
+        """
+        infos = self.load()
+        info = infos.get(path.name)
+        if not self._is_fresh(info, path):
+            logger.info(f"Indexing {path.name}")
+            info = self.scan(path, info.fetched if info else None)
+        if fetched is not None:
+            info = info._replace(fetched=fetched)
+        if infos.get(path.name) != info:
+            infos[path.name] = info
+            self._save(infos)
+        return info
+
+    def refresh(self, repos: Dict[str, Path]) -> List[RepoInfo]:
+        """Bring the catalog in line with the repos of the home.
+
+        Repos that are new or changed are rescanned, entries of repos that
+        are gone are dropped, and everything else is served from the cache.
+
+        Args:
+            repos: Repos of the home, see `RcManager.get_rc_repos`.
+
+        Returns:
+            Entries of all repos, in name order.
+        """
+        cached = self.load()
+        infos = {}
+        for name, path in sorted(repos.items()):
+            info = cached.get(name)
+            if not self._is_fresh(info, path):
+                logger.info(f"Indexing {name}")
+                info = self.scan(path, info.fetched if info else None)
+            infos[name] = info
+        if infos != cached:
+            self._save(infos)
+        return list(infos.values())
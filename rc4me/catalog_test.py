@@ -0,0 +1,60 @@
+import threading
+
+import git
+
+from rc4me.catalog import Catalog, filter_repos, fuzzy_score
+from rc4me.lock import file_lock
+from rc4me.rcmanager import RcManager
+
+
+def test_fuzzy_score():
+    assert fuzzy_score("vrc", "vimrc") > fuzzy_score("vrc", "very_long_rc")
+    assert fuzzy_score("vimrc", "vimrc") > fuzzy_score("vimrc", "jeffmm_vimrc")
+    assert fuzzy_score("xyz", "vimrc") is None
+    assert fuzzy_score("", "vimrc") == 0
+
+
+def test_catalog_is_incremental(tmp_path, rc1_remote, push_commit, monkeypatch):
+    rcmanager = RcManager(tmp_path / "home", tmp_path / "dest")
+    rcmanager.fetch_repo(str(rc1_remote))
+    infos = {info.name: info for info in rcmanager.repo_infos()}
+    info = infos["rc1.git"]
+    assert info.head == git.Repo(rcmanager.repo_path).head.commit.hexsha
+    assert (info.files, info.size) == (2, len("foo") + len("blahblah"))
+    assert info.fetched is not None
+    assert infos["init"].head is None
+
+    scanned = []
+    scan = Catalog.scan
+
+    def _scan(self, path, fetched=None):
+        scanned.append(path.name)
+        return scan(self, path, fetched)
+
+    monkeypatch.setattr(Catalog, "scan", _scan)
+    # Unchanged repos are served from the catalog
+    rcmanager.repo_infos()
+    assert scanned == []
+    # Fetching new commits rescans the repo
+    push_commit(rc1_remote, "inputrc", "set editing-mode vi")
+    monkeypatch.setattr("builtins.input", lambda prompt: "y")
+    rcmanager.fetch_repo(str(rc1_remote))
+    assert scanned == ["rc1.git"]
+    assert rcmanager.catalog.load()["rc1.git"].files == 3
+    matches = filter_repos(rcmanager.repo_infos(), "rc1")
+    assert [info.name for info in matches] == ["rc1.git"]
+
+
+def test_listing_takes_a_shared_lock(tmp_path):
+    rcmanager = RcManager(tmp_path / "home", tmp_path)
+    (rcmanager.home / "rc-demo").mkdir()
+    infos = []
+    # Another process listing repos, or any other reader, holds the lock
+    with file_lock(rcmanager.home / ".lock", shared=True):
+        thread = threading.Thread(
+            target=lambda: infos.extend(rcmanager.repo_infos()), daemon=True
+        )
+        thread.start()
+        thread.join(5)
+        assert not thread.is_alive()
+    assert [info.name for info in infos] == ["init", "rc-demo"]
@@ -1,15 +1,24 @@
 """TODO - Docstring."""
 
+import json
 import logging
+import time
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Set, Tuple
 
 import click
-from pick import pick
 
-from rc4me.rcmanager import RcManager
+from rc4me.batch import load_plan, run_batch
+from rc4me.bundle import SUFFIX, export_bundle, import_bundle
+from rc4me.catalog import RepoInfo, filter_repos, fuzzy_score
+from rc4me.fleet import apply_fleet, expand_dests
+from rc4me.mirror import Mirror
+from rc4me.plan import Op
+from rc4me.rcmanager import CLONE_STRATEGIES, DIR_MODES, LINK_MODES, RcManager
+from rc4me.status import check_status, repair
+from rc4me.sync import sync_repos
+from rc4me.timing import Profiler
 
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 
@@ -26,40 +35,250 @@ logger = logging.getLogger(__name__)
     ),
     show_default=True,
 )
+@click.option(
+    "--link-mode",
+    type=click.Choice(LINK_MODES),
+    default="indirect",
+    help=(
+        "How to switch configs. 'indirect' swaps the ~/.rc4me/current link and "
+        "only relinks files whose names change; 'full' relinks every file."
+    ),
+    show_default=True,
+)
+@click.option(
+    "--plan",
+    is_flag=True,
+    help="Show the file operations a command would perform without running them.",
+)
+@click.option(
+    "--dirs",
+    type=click.Choice(DIR_MODES),
+    default="skip",
+    help=(
+        "How to handle directories in a config repo: skip them, link each one "
+        "as a whole, or recreate the tree and link its files individually."
+    ),
+    show_default=True,
+)
+@click.option(
+    "--exclude",
+    multiple=True,
+    help="Glob pattern of repo paths not to link, e.g. 'vim/pack/*'. Repeatable.",
+)
+@click.option(
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Number of threads used to create links and copies.",
+    show_default=True,
+)
+@click.option(
+    "--fetch-ttl",
+    type=click.FloatRange(min=0),
+    default=0,
+    envvar="RC4ME_FETCH_TTL",
+    help=(
+        "Seconds after fetching a repo during which apply uses it as is, "
+        "without contacting its remote."
+    ),
+    show_default=True,
+)
+@click.option(
+    "--offline",
+    is_flag=True,
+    envvar="RC4ME_OFFLINE",
+    help="Never contact remotes; only use repos already in the rc4me home.",
+)
+@click.option(
+    "--mirror",
+    type=click.Path(file_okay=False),
+    envvar="RC4ME_MIRROR",
+    help=(
+        "Shared mirror directory (e.g. /var/cache/rc4me). New repos are cloned "
+        "from it, borrowing its objects instead of downloading their own."
+    ),
+)
+@click.option(
+    "--mirror-ttl",
+    type=click.FloatRange(min=0),
+    default=300,
+    envvar="RC4ME_MIRROR_TTL",
+    help="Seconds after fetching a mirror during which it is not fetched again.",
+    show_default=True,
+)
+@click.option(
+    "--clone",
+    type=click.Choice(CLONE_STRATEGIES),
+    default="shallow",
+    envvar="RC4ME_CLONE",
+    help=(
+        "How to clone new repos: the latest commit with its whole tree, or a "
+        "blobless sparse clone that only checks out the files rc4me links."
+    ),
+    show_default=True,
+)
+@click.option(
+    "--include",
+    multiple=True,
+    help="Extra sparse-checkout pattern for sparse clones, e.g. '/vim/'. Repeatable.",
+)
+@click.option(
+    "--keep-generations",
+    type=click.IntRange(min=1),
+    default=50,
+    envvar="RC4ME_KEEP_GENERATIONS",
+    help="Number of past configs kept for rollback.",
+    show_default=True,
+)
+@click.option(
+    "--templates",
+    is_flag=True,
+    envvar="RC4ME_TEMPLATES",
+    help="Render .tmpl files of configs with facts of the host, see --fact.",
+)
+@click.option(
+    "--fact",
+    multiple=True,
+    callback=lambda ctx, param, value: _parse_facts(value),
+    help=(
+        "Template fact as NAME=VALUE, replacing or adding to the host's facts, "
+        "e.g. 'os=linux'. Repeatable."
+    ),
+)
+@click.option(
+    "--verbose",
+    "-v",
+    count=True,
+    help="Log what rc4me does: -v for each step, -vv for every file.",
+)
+@click.option(
+    "--profile",
+    is_flag=True,
+    help="Print the time spent in each phase and the files touched as JSON on stderr.",
+)
 @click.pass_context
 def cli(
     ctx: Dict[str, RcManager],
     dest: Optional[str] = None,
+    link_mode: str = "indirect",
+    plan: bool = False,
+    dirs: str = "skip",
+    exclude: Tuple[str, ...] = (),
+    jobs: int = 1,
+    fetch_ttl: float = 0,
+    offline: bool = False,
+    mirror: Optional[str] = None,
+    mirror_ttl: float = 300,
+    clone: str = "shallow",
+    include: Tuple[str, ...] = (),
+    keep_generations: int = 50,
+    templates: bool = False,
+    fact: Optional[Dict[str, str]] = None,
+    verbose: int = 0,
+    profile: bool = False,
 ) -> None:
     """Management for rc4me run commands."""
+    levels = (logging.WARNING, logging.INFO, logging.DEBUG)
+    logging.basicConfig(level=levels[min(verbose, len(levels) - 1)])
     # If the command was called without any arguments or options
     ctx.ensure_object(dict)
     home = Path.home() / ".rc4me"
-    ctx.obj["rcmanager"] = RcManager(home=home, dest=dest)
+    profiler = Profiler() if profile else None
+    if profiler is not None:
+        # Runs after the command, even if it fails
+        ctx.call_on_close(lambda: _echo_profile(profiler))
+    ctx.obj["rcmanager"] = RcManager(
+        home=home,
+        dest=dest,
+        link_mode=link_mode,
+        dry_run=plan,
+        dir_mode=dirs,
+        exclude=exclude,
+        workers=jobs,
+        fetch_ttl=fetch_ttl,
+        offline=offline,
+        mirror=Mirror(mirror, ttl=mirror_ttl) if mirror else None,
+        clone_strategy=clone,
+        sparse_include=include,
+        profiler=profiler,
+        keep_generations=keep_generations,
+        templates=templates,
+        facts=fact,
+    )
+    # Finish any switch that an earlier, interrupted run left half done
+    ctx.obj["rcmanager"].recover()
 
 
-@click.argument("repo", required=True, type=str)
+def _parse_facts(values: Tuple[str, ...]) -> Dict[str, str]:
+    """Parse NAME=VALUE pairs of --fact."""
+    facts = {}
+    for value in values:
+        name, sep, fact = value.partition("=")
+        if not sep or not name:
+            raise click.BadParameter(f"expected NAME=VALUE, got {value!r}")
+        facts[name] = fact
+    return facts
+
+
+def _echo_profile(profiler: Profiler) -> None:
+    """Print the profiler summary as JSON on stderr."""
+    click.echo(json.dumps(profiler.summary(), indent=2), err=True)
+
+
+def _echo_plan(ctx: Dict[str, RcManager], ops: List[Op]) -> None:
+    """Print the planned operations if the --plan flag was given."""
+    if ctx.obj["rcmanager"].dry_run:
+        for op in ops:
+            click.echo(str(op))
+
+
+@click.argument("repos", nargs=-1, required=True, type=str)
 @cli.command()
+@click.option(
+    "--concat",
+    multiple=True,
+    help=(
+        "Glob pattern of files to concatenate across stacked repos instead of "
+        "taking them from the last repo, e.g. 'bashrc'. Repeatable."
+    ),
+)
 @click.pass_context
-def apply(ctx: Dict[str, RcManager], repo: str):
+def apply(ctx: Dict[str, RcManager], repos: Tuple[str, ...], concat: Tuple[str, ...]):
     """Apply rc environment. Will download from GitHub if not found in .rc4me/
 
     Replaces rc files in rc4me home directory with symlinks to files located in
     target repo. If the target repo does not exist in the rc4me home directory,
     the repo is cloned either locally or from GitHub.
 
+    Given several repos, e.g. a team base config and personal overrides, links
+    the files of all of them, with files in later repos taking precedence.
+
+    With --templates, files ending in .tmpl are rendered with facts of the
+    host (see --fact) and linked without the suffix.
+
     Args:
-        repo: Target repo with rc files. May be a local repo or reference a
-            GitHub repository (e.g. jeffmm/vimrc).
+        repos: Target repos with rc files. Each may be a local repo or reference
+            a GitHub repository (e.g. jeffmm/vimrc).
     """
     rcmanager = ctx.obj["rcmanager"]
-    # Init repo variables
-    logger.info(f"Getting and setting rc4me config: {repo}")
-    # Clone repo to rc4me home dir or update existing local config repo
-    rcmanager.fetch_repo(repo)
+    paths = []
+    for repo in repos:
+        # Init repo variables
+        logger.info(f"Getting and setting rc4me config: {repo}")
+        # Clone repo to rc4me home dir or update existing local config repo
+        rcmanager.fetch_repo(repo)
+        paths.append(rcmanager.repo_path)
     # Wait to relink current until after fetching repo, since it could fail if
     # the git repo doesn't exist or similar.
-    rcmanager.change_current_to_fetched_repo()
+    try:
+        if len(paths) == 1 and not concat:
+            ops = rcmanager.change_current_to_fetched_repo()
+        else:
+            ops = rcmanager.change_current_to_stack(paths, concat)
+    except ValueError as e:
+        # A template of the config is invalid, see rc4me.template
+        raise click.ClickException(str(e))
+    _echo_plan(ctx, ops)
 
 
 @cli.command()
@@ -73,7 +292,7 @@ def revert(ctx: Dict[str, RcManager]):
     # Init rc4me directory variables
     rcmanager = ctx.obj["rcmanager"]
     logger.info("Reverting rc4me config to previous configuration")
-    rcmanager.change_current_to_prev()
+    _echo_plan(ctx, rcmanager.change_current_to_prev())
 
 
 @cli.command()
@@ -88,25 +307,398 @@ def reset(ctx: Dict[str, RcManager]):
     # Init rc4me directory variables
     rcmanager = ctx.obj["rcmanager"]
     logger.info("Restoring rc4me config to initial configuration")
-    rcmanager.change_current_to_init()
+    _echo_plan(ctx, rcmanager.change_current_to_init())
+
+
+def _match_repo(infos: List[RepoInfo], query: str) -> RepoInfo:
+    """Repo named query, or the single best fuzzy match of it."""
+    for info in infos:
+        if info.name == query:
+            return info
+    matches = filter_repos(infos, query)
+    if not matches:
+        raise click.ClickException(f"No repo matches {query!r}")
+    top = fuzzy_score(query, matches[0].name)
+    best = [info for info in matches if fuzzy_score(query, info.name) == top]
+    if len(best) > 1:
+        names = ", ".join(info.name for info in best)
+        raise click.ClickException(f"{query!r} matches several repos: {names}")
+    return matches[0]
 
 
 @cli.command()
+@click.option(
+    "--match",
+    "query",
+    metavar="QUERY",
+    help=(
+        "Apply the repo named QUERY, or the repo that best fuzzy-matches it, "
+        "without prompting. Fails if no repo or several equally good ones match."
+    ),
+)
 @click.pass_context
-def select(ctx: Dict[str, RcManager]):
+def select(ctx: Dict[str, RcManager], query: Optional[str]):
     """Select rc4me configurations.
 
-    Displays all available repos and allow user to select one
+    Displays all available repos with their commit, last fetch and size, and
+    allows the user to select one. Type to filter the list.
+    """
+    rcmanager = ctx.obj["rcmanager"]
+    infos = rcmanager.repo_infos()
+    if query is not None:
+        selected = _match_repo(infos, query)
+    else:
+        from rc4me.picker import pick_repo
+
+        title = "Please select the repo/configuration you want to use:"
+        selected = pick_repo(infos, title)
+        if selected is None:
+            return
+    logger.info(f"Selected and applying: {selected.path}")
+    _echo_plan(ctx, rcmanager.change_current_to_repo(Path(selected.path)))
+
+
+@cli.command()
+@click.pass_context
+def generations(ctx: Dict[str, RcManager]):
+    """List past rc4me configurations.
+
+    Prints the number, time, config and commit of each generation, marking
+    the current one with '*'.
+    """
+    rcmanager = ctx.obj["rcmanager"]
+    current = rcmanager.generations.current
+    for generation in rcmanager.generations.list():
+        marker = "*" if generation.number == current else " "
+        when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(generation.time))
+        head = (generation.head or "")[:8]
+        name = Path(generation.repo).name
+        click.echo(f"{marker}{generation.number:>4}  {when}  {name}  {head}".rstrip())
+
+
+@click.argument("number", required=False, type=int)
+@cli.command()
+@click.pass_context
+def rollback(ctx: Dict[str, RcManager], number: Optional[int] = None):
+    """Switch to a past rc4me configuration.
+
+    Switches to generation NUMBER, or to the one before the current
+    generation, as listed by `rc4me generations`. Does not fetch or rescan
+    the repo. If the repo has new commits since, the files of the recorded
+    commit are restored from it, and rollback fails if that commit is gone.
+    """
+    rcmanager = ctx.obj["rcmanager"]
+    if number is None:
+        current = rcmanager.generations.current
+        older = [n for n in rcmanager.generations.numbers() if n < (current or 0)]
+        if not older:
+            raise click.UsageError("No generation before the current one")
+        number = older[-1]
+    logger.info(f"Rolling back to generation {number}")
+    try:
+        ops = rcmanager.rollback(number)
+    except KeyError as e:
+        raise click.UsageError(e.args[0])
+    except FileNotFoundError as e:
+        raise click.ClickException(f"Can't restore generation {number}: {e}")
+    _echo_plan(ctx, ops)
+
+
+@cli.command()
+@click.option(
+    "--keep",
+    type=click.IntRange(min=0),
+    help="Number of newest generations to keep [default: --keep-generations].",
+)
+@click.option(
+    "--older-than",
+    type=click.FloatRange(min=0),
+    help="Only delete generations older than this many days.",
+)
+@click.pass_context
+def gc(ctx: Dict[str, RcManager], keep: Optional[int], older_than: Optional[float]):
+    """Delete old rc4me generations.
+
+    The current generation is always kept. Stacks of repos and rendered
+    templates that no kept generation uses are deleted too.
+    """
+    rcmanager = ctx.obj["rcmanager"]
+    keep = rcmanager.keep_generations if keep is None else keep
+    seconds = None if older_than is None else older_than * 86400
+    removed = rcmanager.gc(keep, seconds)
+    click.echo(f"removed {len(removed)} generation(s)")
+
+
+@cli.command()
+@click.option(
+    "--repair",
+    "fix",
+    is_flag=True,
+    help="Fix the entries that drifted: relink, replace or remove them.",
+)
+@click.option(
+    "--jobs",
+    "-j",
+    type=click.IntRange(min=1),
+    default=8,
+    help="Threads that check entries.",
+    show_default=True,
+)
+@click.pass_context
+def status(ctx: Dict[str, RcManager], fix: bool, jobs: int):
+    """Check that the destination matches the current configuration.
+
+    Lists entries that are missing, foreign (replaced by something else),
+    dangling (linking to a file the config no longer has) or modified (edited
+    copies from init). Exits with status 1 if any drifted and --repair is not
+    given.
+    """
+    rcmanager = ctx.obj["rcmanager"]
+    result = check_status(rcmanager, jobs)
+    for drift in result.drifts:
+        click.echo(str(drift))
+    click.echo(str(result))
+    if not fix:
+        if not result.ok:
+            ctx.exit(1)
+        return
+    try:
+        ops = repair(rcmanager, result)
+    except FileNotFoundError as e:
+        raise click.ClickException(str(e))
+    _echo_plan(ctx, ops)
+    if not rcmanager.dry_run:
+        click.echo(f"repaired {len(result.drifts)} entries")
+
+
+# Same check, for those who look for it by that name
+cli.add_command(status, "verify")
+
+
+@cli.command()
+@click.option(
+    "--debounce",
+    type=click.FloatRange(min=0),
+    default=0.05,
+    help="Seconds without changes that end a burst of changes.",
+    show_default=True,
+)
+@click.option(
+    "--poll",
+    is_flag=True,
+    help="Rescan the config for changes instead of using inotify.",
+)
+@click.option(
+    "--interval",
+    type=click.FloatRange(min=0.01),
+    default=0.5,
+    help="Seconds between rescans when polling.",
+    show_default=True,
+)
+@click.pass_context
+def watch(ctx: Dict[str, RcManager], debounce: float, poll: bool, interval: float):
+    """Apply edits to the current configuration as they happen.
+
+    Watches the repo of the current configuration and links files added to
+    it, and unlinks files removed from it, until interrupted.
+    """
+    from rc4me.watch import watch as watch_current
+
+    rcmanager = ctx.obj["rcmanager"]
+
+    def _echo_update(changed: Set[str], ops: List[Op]):
+        if rcmanager.dry_run:
+            _echo_plan(ctx, ops)
+        else:
+            click.echo(f"{len(changed)} path(s) changed, {len(ops)} change(s)")
+
+    try:
+        watch_current(rcmanager, debounce, poll, interval, on_update=_echo_update)
+    except KeyboardInterrupt:
+        pass
+
+
+@cli.command()
+@click.option(
+    "--yes", "-y", is_flag=True, help="Pull new commits without asking for each repo."
+)
+@click.option(
+    "--jobs",
+    "-j",
+    type=click.IntRange(min=1),
+    default=8,
+    help="Maximum number of repos fetched at once.",
+    show_default=True,
+)
+@click.pass_context
+def sync(ctx: Dict[str, RcManager], yes: bool, jobs: int):
+    """Fetch all cached rc4me configurations.
+
+    Fetches every repo in the rc4me home directory concurrently and prints
+    the fetch time and number of new commits for each. Repos are only
+    updated when --yes is given.
+    """
+    rcmanager = ctx.obj["rcmanager"]
+    if rcmanager.offline:
+        raise click.UsageError("sync fetches from remotes and can't run --offline")
+    logger.info("Syncing all rc4me configurations")
+    results = sync_repos(rcmanager, pull=yes, workers=jobs)
+    for result in results:
+        click.echo(str(result))
+    if any(result.error is not None for result in results):
+        ctx.exit(1)
+
+
+@cli.command()
+@click.argument("plan_file", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--yes", "-y", is_flag=True, help="Pull new commits of applied repos, no prompt."
+)
+@click.option(
+    "--jobs",
+    "-j",
+    type=click.IntRange(min=1),
+    default=4,
+    help="Maximum number of destinations switched at once.",
+    show_default=True,
+)
+@click.option("--json", "as_json", is_flag=True, help="Print results as JSON lines.")
+@click.pass_context
+def batch(
+    ctx: Dict[str, RcManager], plan_file: str, yes: bool, jobs: int, as_json: bool
+):
+    """Run the operations of a JSON-lines or TOML plan file.
+
+    Each operation applies, reverts, resets or selects a config in its own
+    destination and rc4me home, using the options given to rc4me. Prints
+    the time and number of file changes of each operation.
+    """
+    rcmanager = ctx.obj["rcmanager"]
+    try:
+        ops = load_plan(Path(plan_file), default_dest=rcmanager.dest)
+    except (ImportError, ValueError) as e:
+        raise click.UsageError(str(e))
+    logger.info(f"Running {len(ops)} operations from {plan_file}")
+    results = run_batch(rcmanager, ops, workers=jobs, pull=yes)
+    for result in results:
+        click.echo(json.dumps(result.to_dict()) if as_json else str(result))
+    if any(result.error is not None for result in results):
+        ctx.exit(1)
+
+
+@cli.command()
+@click.argument("repo", required=True, type=str)
+@click.argument("dests", nargs=-1, type=click.Path(file_okay=False))
+@click.option(
+    "--glob",
+    "patterns",
+    multiple=True,
+    help="Glob pattern of destination directories, e.g. '/ci/ws-*'. Repeatable.",
+)
+@click.option("--yes", "-y", is_flag=True, help="Pull new commits, no prompt.")
+@click.option(
+    "--jobs",
+    "-j",
+    type=click.IntRange(min=1),
+    default=8,
+    help="Maximum number of destinations switched at once.",
+    show_default=True,
+)
+@click.pass_context
+def fleet(
+    ctx: Dict[str, RcManager],
+    repo: str,
+    dests: Tuple[str, ...],
+    patterns: Tuple[str, ...],
+    yes: bool,
+    jobs: int,
+):
+    """Apply an rc environment to many destination directories.
+
+    Fetches the repo once, then links it into every destination, each with
+    its own rc4me home in DEST/.rc4me. Prints the destinations that failed
+    and the number of destinations applied per second.
+    """
+    rcmanager = ctx.obj["rcmanager"]
+    paths = expand_dests(dests, patterns)
+    if not paths:
+        raise click.UsageError("No destinations given or matched")
+    logger.info(f"Applying {repo} to {len(paths)} destinations")
+    report = apply_fleet(rcmanager, repo, paths, workers=jobs, pull=yes)
+    for result in report.failed:
+        click.echo(str(result))
+    click.echo(str(report))
+    if report.failed:
+        ctx.exit(1)
+
+
+@cli.group()
+def bundle():
+    """Pack config repos into single-file bundles for offline hosts.
+
+    A bundle can be applied directly, e.g. `rc4me apply vimrc.rc4me.tar.gz`.
+    """
+
+
+def _find_repo(rcmanager: RcManager, repo: str) -> Path:
+    """Path of a local repo, or of a repo cloned in the rc4me home."""
+    for path in (
+        Path(repo).expanduser(),
+        rcmanager.home / repo,
+        rcmanager.home / repo.replace("/", "_"),
+    ):
+        if path.is_dir():
+            return path
+    raise click.UsageError(f"No repo {repo} in {rcmanager.home} or on disk")
+
+
+@bundle.command("export")
+@click.argument("repo", type=str)
+@click.option(
+    "--output",
+    "-o",
+    type=click.Path(dir_okay=False),
+    help=f"Bundle file to write [default: <repo name>{SUFFIX}].",
+)
+@click.option(
+    "--level",
+    type=click.IntRange(1, 9),
+    default=6,
+    help="gzip compression level, from 1 (fastest) to 9 (smallest).",
+    show_default=True,
+)
+@click.pass_context
+def bundle_export(
+    ctx: Dict[str, RcManager], repo: str, output: Optional[str], level: int
+):
+    """Pack REPO into a bundle.
+
+    REPO is a local repo or a repo in the rc4me home, e.g. jeffmm/vimrc.
+    """
+    path = _find_repo(ctx.obj["rcmanager"], repo)
+    out = Path(output) if output else Path(f"{path.resolve().name}{SUFFIX}")
+    try:
+        manifest = export_bundle(path, out, level)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    size = out.stat().st_size
+    click.echo(f"{out}: {len(manifest.files)} files, {size} bytes")
+
+
+@bundle.command("import")
+@click.argument("bundle_file", type=click.File("rb"))
+@click.pass_context
+def bundle_import(ctx: Dict[str, RcManager], bundle_file):
+    """Unpack a bundle into the rc4me home, '-' reading it from stdin.
+
+    Use `rc4me select` or `rc4me apply` to switch to it afterwards.
     """
-    # Init rc4me directory variables
     rcmanager = ctx.obj["rcmanager"]
-    my_repos = rcmanager.get_rc_repos()
-    # Show all dirs that aren't curr/prev
-    title = "Please select the repo/configuration you want to use:"
-    options = list(my_repos.keys())
-    selected, _ = pick(options, title)
-    logger.info(f"Selected and applying: {my_repos[selected]}")
-    rcmanager.change_current_to_repo(my_repos[selected])
+    try:
+        repo_path = import_bundle(rcmanager, bundle_file)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"imported {repo_path.name}")
 
 
 if __name__ == "__main__":
@@ -1,8 +1,17 @@
+import json
+import os
 from pathlib import Path
 
 from click.testing import CliRunner
 
 from rc4me.cli import cli
+from rc4me.generations import Generations
+from rc4me.timing import import_times
+
+# Startup budget for `import rc4me.cli`, which runs on every rc4me command
+IMPORT_BUDGET_MS = 250
+# Modules only the commands that need them may import
+LAZY_MODULES = ("git", "curses")
 
 
 def check_repo_files_in_home(repo: Path):
@@ -51,3 +60,189 @@ def test_reset():
 
 def test_apply_local():
     pass
+
+
+def test_plan_does_not_switch(tmp_path, monkeypatch, rc1_git):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    runner = CliRunner()
+    result = runner.invoke(cli, ["--dest", str(dest), "--plan", "apply", str(rc1_git)])
+    assert result.exit_code == 0, result.output
+    assert "symlink" in result.output
+    assert list(dest.iterdir()) == []
+
+
+def test_sync(tmp_path, monkeypatch, rc1_remote, push_commit):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    runner = CliRunner()
+    result = runner.invoke(cli, ["--dest", str(dest), "apply", str(rc1_remote)])
+    assert result.exit_code == 0, result.output
+    push_commit(rc1_remote, "bashrc", "new")
+    result = runner.invoke(cli, ["--dest", str(dest), "sync", "--yes"])
+    assert result.exit_code == 0, result.output
+    assert "rc1.git" in result.output
+    assert "pulled 1 commit(s)" in result.output
+    assert (dest / ".bashrc").read_text() == "new"
+
+
+def test_import_budget():
+    # Best of a few runs, so a busy machine doesn't fail the test
+    best = min(import_times("import rc4me.cli")["rc4me.cli"] for _ in range(3))
+    assert best / 1000 < IMPORT_BUDGET_MS
+    times = import_times("import rc4me.cli")
+    assert not [name for name in LAZY_MODULES if name in times]
+
+
+def test_revert_does_not_import_git(tmp_path):
+    env = dict(os.environ, HOME=str(tmp_path))
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    code = (
+        "from rc4me.cli import cli\n"
+        f"cli(['--dest', {str(dest)!r}, 'revert'], standalone_mode=False)"
+    )
+    times = import_times(code, env)
+    assert (tmp_path / ".rc4me" / "current").is_symlink()
+    assert not [name for name in LAZY_MODULES if name in times]
+
+
+def test_profile(tmp_path, monkeypatch, rc1_git):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    runner = CliRunner()
+    args = ["--dest", str(dest), "--profile", "apply", str(rc1_git)]
+    result = runner.invoke(cli, args)
+    assert result.exit_code == 0, result.output
+    summary = json.loads(result.output)
+    assert summary["counters"]["linked"] == 2
+    assert summary["spans"]["git"]["count"] == 1
+
+
+def test_batch(tmp_path, monkeypatch, rc1_git):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    plan = tmp_path / "plan.jsonl"
+    ops = [
+        {"command": "apply", "repo": str(rc1_git), "dest": str(tmp_path / "a")},
+        {"command": "apply", "repo": str(rc1_git), "dest": str(tmp_path / "b")},
+        {"command": "reset", "dest": str(tmp_path / "b")},
+    ]
+    plan.write_text("\n".join(json.dumps(op) for op in ops))
+    for name in "ab":
+        (tmp_path / name).mkdir()
+    runner = CliRunner()
+    result = runner.invoke(cli, ["batch", "--json", str(plan)])
+    assert result.exit_code == 0, result.output
+    results = [json.loads(line) for line in result.output.splitlines()]
+    assert [r["command"] for r in results] == ["apply", "apply", "reset"]
+    assert (tmp_path / "a" / ".bashrc").is_symlink()
+    assert not (tmp_path / "b" / ".bashrc").exists()
+
+
+def test_fleet(tmp_path, monkeypatch, rc1_git):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    for i in range(3):
+        (tmp_path / f"ws-{i}").mkdir()
+    runner = CliRunner()
+    args = ["fleet", str(rc1_git), "--glob", str(tmp_path / "ws-*")]
+    result = runner.invoke(cli, args)
+    assert result.exit_code == 0, result.output
+    assert "applied to 3 of 3 destinations" in result.output
+    assert (tmp_path / "ws-2" / ".bashrc").is_symlink()
+
+
+def test_rollback(tmp_path, monkeypatch, rc1_git):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    runner = CliRunner()
+    result = runner.invoke(cli, ["--dest", str(dest), "apply", str(rc1_git)])
+    assert result.exit_code == 0, result.output
+    result = runner.invoke(cli, ["--dest", str(dest), "reset"])
+    assert result.exit_code == 0, result.output
+    result = runner.invoke(cli, ["generations"])
+    lines = result.output.splitlines()
+    assert [line[:5] for line in lines] == ["    1", "*   2"]
+    assert "mstefferson_rc" in lines[0]
+    result = runner.invoke(cli, ["--dest", str(dest), "rollback"])
+    assert result.exit_code == 0, result.output
+    assert (dest / ".vimrc").read_text() == "blahblah"
+    result = runner.invoke(cli, ["rollback", "7"])
+    assert result.exit_code == 2
+    assert "No generation 7" in result.output
+    # A generation whose commit is gone is not linked as the repo is now
+    generations = Generations(tmp_path / ".rc4me" / ".generations")
+    generations.record(rc1_git, "0" * 40, ["bashrc"])
+    result = runner.invoke(cli, ["--dest", str(dest), "rollback", "3"])
+    assert result.exit_code == 1
+    assert "Can't restore generation 3" in result.output
+
+
+def test_apply_stack(tmp_path, monkeypatch, rc1_git, rc1_remote, push_commit):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    push_commit(rc1_remote, "bashrc", "override")
+    runner = CliRunner()
+    args = ["--dest", str(dest), "apply", str(rc1_git), str(rc1_remote)]
+    result = runner.invoke(cli, args)
+    assert result.exit_code == 0, result.output
+    assert (dest / ".bashrc").read_text() == "override"
+    assert (dest / ".vimrc").read_text() == "blahblah"
+
+
+def test_select_match(tmp_path, monkeypatch, rc1_git, rc2):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    runner = CliRunner()
+    result = runner.invoke(cli, ["--dest", str(dest), "apply", str(rc1_git)])
+    assert result.exit_code == 0, result.output
+    result = runner.invoke(cli, ["--dest", str(dest), "select", "--match", "msrc"])
+    assert result.exit_code == 0, result.output
+    assert (dest / ".vimrc").read_text() == "blahblah"
+    result = runner.invoke(cli, ["select", "--match", "nope"])
+    assert result.exit_code == 1
+    assert "No repo matches 'nope'" in result.output
+
+
+def test_bundle(tmp_path, monkeypatch, rc1_git):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    out = tmp_path / "rc1.rc4me.tar.gz"
+    runner = CliRunner()
+    result = runner.invoke(cli, ["bundle", "export", str(rc1_git), "-o", str(out)])
+    assert result.exit_code == 0, result.output
+    assert f"{out}: 2 files" in result.output
+    result = runner.invoke(cli, ["bundle", "import", "-"], input=out.read_bytes())
+    assert result.exit_code == 0, result.output
+    assert "imported mstefferson_rc" in result.output
+    result = runner.invoke(cli, ["--dest", str(dest), "apply", str(out)])
+    assert result.exit_code == 0, result.output
+    assert (dest / ".vimrc").read_text() == "blahblah"
+
+
+def test_apply_template_fact(tmp_path, monkeypatch, rc1_git):
+    import git
+
+    monkeypatch.setenv("HOME", str(tmp_path))
+    template = '{% if os == "plan9" %}\nglenda\n{% endif %}\n'
+    (rc1_git / "bashrc.tmpl").write_text(template)
+    repo = git.Repo(rc1_git)
+    repo.index.add(["bashrc.tmpl"])
+    repo.index.commit("Add bashrc template")
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    runner = CliRunner()
+    args = ["--dest", str(dest), "--templates", "--fact", "os=plan9"]
+    args += ["apply", str(rc1_git)]
+    result = runner.invoke(cli, args)
+    assert result.exit_code == 0, result.output
+    assert (dest / ".bashrc").read_text() == "glenda\n"
+    result = runner.invoke(cli, ["--fact", "os", "apply", str(rc1_git)])
+    assert result.exit_code == 2
+    assert "expected NAME=VALUE" in result.output
@@ -1,3 +1,4 @@
+import git
 import pytest
 
 
@@ -82,3 +83,36 @@ def rc2(tmp_path, bashrc2):
     assert (d / "bashrc").is_file()
     assert (d / "bashrc").read_text() == bashrc2
     return d
+
+
+@pytest.fixture()
+def rc1_git(rc1):
+    """rc repo 1 committed to a git repo on master"""
+    repo = git.Repo.init(rc1, initial_branch="master")
+    repo.index.add(["bashrc", "vimrc"])
+    repo.index.commit("Add rc files")
+    return rc1
+
+
+@pytest.fixture()
+def rc1_remote(tmp_path, rc1_git):
+    """Bare clone of rc repo 1, served as a local remote"""
+    remote = tmp_path / "remote" / "rc1.git"
+    git.Repo(rc1_git).clone(remote, bare=True)
+    return remote
+
+
+@pytest.fixture()
+def push_commit():
+    """Function committing a file to a remote through a working copy"""
+
+    def _push_commit(remote, name, text):
+        work = remote.parent / f"{remote.stem}_work"
+        repo = git.Repo(work) if work.exists() else git.Repo.clone_from(remote, work)
+        (work / name).parent.mkdir(parents=True, exist_ok=True)
+        (work / name).write_text(text)
+        repo.index.add([name])
+        repo.index.commit(f"Update {name}")
+        repo.remote("origin").push("master")
+
+    return _push_commit
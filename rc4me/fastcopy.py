@@ -0,0 +1,90 @@
+"""File copies that avoid moving data through Python where the OS allows."""
+
+import errno
+import fcntl
+import os
+import shutil
+from pathlib import Path
+
+# ioctl request that clones a file's extents (reflink) on Btrfs, XFS and others
+FICLONE = 0x40049409
+
+# Errors meaning a copy strategy isn't supported here, so the next one is tried
+_UNSUPPORTED = (errno.EXDEV, errno.ENOSYS, errno.EOPNOTSUPP, errno.EINVAL, errno.ENOTTY)
+
+
+def _reflink(src_fd: int, dst_fd: int) -> bool:
+    """Clone src into dst, sharing the data blocks. Return False if unsupported."""
+    try:
+        fcntl.ioctl(dst_fd, FICLONE, src_fd)
+    except OSError as e:
+        if e.errno in _UNSUPPORTED or e.errno == errno.EBADF:
+            return False
+        raise
+    return True
+
+
+def _copy_file_range(src_fd: int, dst_fd: int, size: int) -> bool:
+    """Copy src into dst in the kernel. Return False if unsupported."""
+    if not hasattr(os, "copy_file_range"):
+        return False
+    offset = 0
+    while offset < size:
+        try:
+            copied = os.copy_file_range(src_fd, dst_fd, size - offset)
+        except OSError as e:
+            if offset == 0 and e.errno in _UNSUPPORTED:
+                return False
+            raise
+        if copied == 0:
+            break
+        offset += copied
+    return True
+
+
+def _sendfile(src_fd: int, dst_fd: int, size: int) -> bool:
+    """Copy src into dst with sendfile. Return False if unsupported."""
+    offset = 0
+    while offset < size:
+        try:
+            sent = os.sendfile(dst_fd, src_fd, offset, size - offset)
+        except OSError as e:
+            if offset == 0 and e.errno in _UNSUPPORTED:
+                return False
+            raise
+        if sent == 0:
+            break
+        offset += sent
+    return True
+
+
+def _copy_data(src_fd: int, dst_fd: int) -> None:
+    """Copy all data from src to dst with the fastest supported strategy."""
+    size = os.fstat(src_fd).st_size
+    if _reflink(src_fd, dst_fd) or _copy_file_range(src_fd, dst_fd, size):
+        return
+    if _sendfile(src_fd, dst_fd, size):
+        return
+    with open(src_fd, "rb", closefd=False) as fsrc:
+        with open(dst_fd, "wb", closefd=False) as fdst:
+            shutil.copyfileobj(fsrc, fdst)
+
+
+def copy_file(src: Path, dst: Path, atomic: bool = False) -> None:
+    """Copy file contents and metadata, like `shutil.copy2`.
+
+    Tries, in order, a reflink (no data is copied at all), an in-kernel
+    `os.copy_file_range`, `os.sendfile`, and finally a regular buffered copy.
+
+    Args:
+        src: File to copy.
+        dst: Destination file, replaced if it exists.
+        atomic: Write to a temporary file next to dst and rename it into
+            place, so readers never see a partially written file.
+    """
+    out = dst.with_name(f".{dst.name}.rc4me-tmp") if atomic else dst
+    with open(src, "rb") as fsrc, open(out, "wb") as fdst:
+        _copy_data(fsrc.fileno(), fdst.fileno())
+    shutil.copystat(src, out)
+    if atomic:
+        os.replace(out, dst)
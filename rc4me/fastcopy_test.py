@@ -0,0 +1,32 @@
+import os
+
+import pytest
+
+from rc4me import fastcopy
+from rc4me.fastcopy import copy_file
+
+
+def test_copy_file_keeps_content_and_mtime(tmp_path):
+    src = tmp_path / "src"
+    src.write_bytes(os.urandom(3 << 20))
+    os.utime(src, ns=(1_000_000_000, 1_000_000_000))
+    dst = tmp_path / "dst"
+    dst.write_text("old contents that are replaced")
+    copy_file(src, dst)
+    assert dst.read_bytes() == src.read_bytes()
+    assert dst.stat().st_mtime_ns == src.stat().st_mtime_ns
+
+
+@pytest.mark.parametrize(
+    "unsupported", [["_reflink"], ["_reflink", "_copy_file_range", "_sendfile"]]
+)
+def test_copy_file_fallbacks(tmp_path, monkeypatch, unsupported):
+    for name in unsupported:
+        monkeypatch.setattr(fastcopy, name, lambda *args: False)
+    src = tmp_path / "src"
+    src.write_bytes(os.urandom(1 << 20))
+    dst = tmp_path / "dst"
+    copy_file(src, dst, atomic=True)
+    assert dst.read_bytes() == src.read_bytes()
+    # No temporary file is left behind
+    assert sorted(tmp_path.iterdir()) == [dst, src]
@@ -0,0 +1,130 @@
+"""Apply one config repo to many destination directories at once.
+
+The repo is fetched once into the rc4me home and listed once. Each
+destination then gets its own small rc4me home (`.rc4me` in the destination)
+whose `current` links to the shared clone, so each destination keeps its own
+backups and can be reverted or reset on its own. Destinations are switched on
+a thread pool, and a failure in one does not affect the others.
+"""
+
+import glob
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from rc4me.rcmanager import RcManager
+
+logger = logging.getLogger(__name__)
+
+# rc4me home of each destination, relative to it
+DEST_HOME = ".rc4me"
+
+
+class FleetResult(NamedTuple):
+    """Outcome of applying the config to one destination.
+
+    Attributes:
+        dest: Destination directory.
+        seconds: Wall time spent on the destination.
+        changes: Number of file operations it planned (and ran).
+        error: Error message if the destination failed, otherwise None.
+    """
+
+    dest: Path
+    seconds: float
+    changes: int = 0
+    error: Optional[str] = None
+
+    def __str__(self) -> str:
+        if self.error is not None:
+            status = f"failed: {self.error}"
+        else:
+            status = f"{self.changes} change(s)"
+        return f"{self.dest} ({self.seconds * 1e3:.1f}ms) {status}"
+
+
+class FleetReport(NamedTuple):
+    """Results of a fleet apply, in destination order, and its wall time."""
+
+    results: List[FleetResult]
+    seconds: float
+
+    @property
+    def failed(self) -> List[FleetResult]:
+        return [result for result in self.results if result.error is not None]
+
+    @property
+    def rate(self) -> float:
+        """Destinations per second."""
+        return len(self.results) / self.seconds if self.seconds else 0.0
+
+    def __str__(self) -> str:
+        done = len(self.results) - len(self.failed)
+        return (
+            f"applied to {done} of {len(self.results)} destinations in "
+            f"{self.seconds:.2f}s ({self.rate:.1f} destinations/s)"
+        )
+
+
+def expand_dests(dests: Iterable[str], patterns: Iterable[str] = ()) -> List[Path]:
+    """Combine destination paths and glob patterns into a list of directories.
+
+    Patterns may use `**` to match nested directories; only directories they
+    match are kept. Duplicates are dropped, keeping the first occurrence.
+    """
+    paths = [Path(dest).expanduser() for dest in dests]
+    for pattern in patterns:
+        matches = sorted(glob.glob(str(Path(pattern).expanduser()), recursive=True))
+        paths += [Path(match) for match in matches if Path(match).is_dir()]
+    return list(dict.fromkeys(path.absolute() for path in paths))
+
+
+def _apply_one(
+    template: RcManager, repo_path: Path, links: Dict[Path, List[str]], dest: Path
+) -> FleetResult:
+    """Switch one destination to the shared repo, catching any failure."""
+    start = time.perf_counter()
+    try:
+        # Parallelism is across destinations, not within one
+        rcmanager = template.for_paths(
+            dest / DEST_HOME, dest, workers=1, pinned_links=links
+        )
+        ops = rcmanager.change_current_to_repo(repo_path)
+    except Exception as e:
+        logger.debug(f"Failed to apply to {dest}", exc_info=True)
+        return FleetResult(dest, time.perf_counter() - start, error=str(e))
+    return FleetResult(dest, time.perf_counter() - start, len(ops))
+
+
+def apply_fleet(
+    rcmanager: RcManager,
+    repo: str,
+    dests: List[Path],
+    workers: int = 8,
+    pull: bool = False,
+) -> FleetReport:
+    """Fetch a repo once and apply it to every destination.
+
+    Args:
+        rcmanager: Manager of the rc4me home the repo is fetched into. Its
+            options (link mode, dirs, ...) are used for every destination.
+        repo: Local path or GitHub repo to apply.
+        dests: Destination directories.
+        workers: Maximum number of destinations switched at once.
+        pull: Pull new commits if the repo is already cloned and behind.
+
+    Returns:
+        Per-destination results and the total wall time, including the fetch.
+    """
+    start = time.perf_counter()
+    rcmanager.fetch_repo(repo, confirm=lambda: pull)
+    repo_path = rcmanager.repo_path.resolve()
+    # List the repo once; every destination plans against the same listing
+    links = {repo_path: rcmanager.link_names(repo_path)}
+    with ThreadPoolExecutor(max(1, min(workers, len(dests)))) as pool:
+        results = list(
+            pool.map(lambda dest: _apply_one(rcmanager, repo_path, links, dest), dests)
+        )
+    return FleetReport(results, time.perf_counter() - start)
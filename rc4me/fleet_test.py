@@ -0,0 +1,40 @@
+from rc4me.fleet import DEST_HOME, apply_fleet, expand_dests
+from rc4me.rcmanager import RcManager
+
+
+def test_expand_dests(tmp_path):
+    for name in ["ws-1", "ws-2", "other"]:
+        (tmp_path / name).mkdir()
+    (tmp_path / "ws-file").write_text("")
+    dests = expand_dests([str(tmp_path / "ws-2")], [str(tmp_path / "ws-*")])
+    assert dests == [tmp_path / "ws-2", tmp_path / "ws-1"]
+
+
+def test_apply_fleet(tmp_path, rc1_git, monkeypatch):
+    listed = []
+    link_names = RcManager.link_names
+
+    def _link_names(self, repo):
+        listed.append(repo)
+        return link_names(self, repo)
+
+    monkeypatch.setattr(RcManager, "link_names", _link_names)
+    dests = [tmp_path / f"ws-{i}" for i in range(5)]
+    for dest in dests:
+        dest.mkdir()
+    (dests[0] / ".bashrc").write_text("mine")
+    missing = tmp_path / "missing"
+    rcmanager = RcManager(tmp_path / "home", tmp_path / "home")
+    report = apply_fleet(rcmanager, str(rc1_git), dests + [missing], workers=3)
+    assert [result.dest for result in report.results] == dests + [missing]
+    assert [result.dest for result in report.failed] == [missing]
+    assert report.rate > 0
+    for dest in dests:
+        assert (dest / ".bashrc").read_text() == "foo"
+        assert (dest / DEST_HOME / "current").resolve() == rcmanager.repo_path
+    # The repo is listed once; each destination only lists its own init
+    assert listed.count(rcmanager.repo_path) == 1
+    # Each destination keeps its own backups
+    dest_manager = RcManager(dests[0] / DEST_HOME, dests[0])
+    dest_manager.change_current_to_init()
+    assert (dests[0] / ".bashrc").read_text() == "mine"
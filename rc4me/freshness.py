@@ -0,0 +1,85 @@
+"""Per-repo record of when and what was last fetched from a remote.
+
+A repeat `apply` within the TTL of the last fetch is served from the local
+clone without any network or git subprocess work. After the TTL a single
+`ls-remote` checks whether the remote branch moved before fetching.
+"""
+
+import json
+import os
+import time
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from rc4me.manifest import read_head
+
+
+class FetchRecord(NamedTuple):
+    """Outcome of the last fetch of a repo.
+
+    Attributes:
+        fetched_at: When the remote was last checked, in seconds since epoch.
+        remote_ref: Remote ref that was checked, e.g. refs/heads/master.
+        remote_sha: Commit the remote ref pointed to, as from ls-remote.
+        head: Local HEAD commit after the fetch.
+    """
+
+    fetched_at: float
+    remote_ref: str
+    remote_sha: str
+    head: Optional[str]
+
+
+class FetchCache:
+    """Fetch records of cloned rc repos, stored as one JSON file per repo."""
+
+    def __init__(self, root: Path):
+        """Initialize the directory holding fetch records.
+
+        Args:
+            root: Directory holding the records, e.g. `~/.rc4me/.fetch`.
+        """
+        self.root = root
+
+    def _path(self, repo_path: Path) -> Path:
+        return self.root / f"{repo_path.name}.json"
+
+    def load(self, repo_path: Path) -> Optional[FetchRecord]:
+        """Load the fetch record of a repo, if there is a valid one."""
+        try:
+            return FetchRecord(**json.loads(self._path(repo_path).read_text()))
+        except (FileNotFoundError, ValueError, TypeError):
+            return None
+
+    def record(self, repo_path: Path, remote_ref: str, remote_sha: str) -> None:
+        """Record that the remote of a repo was just checked.
+
+        Args:
+            repo_path: Path to the cloned repo.
+            remote_ref: Remote ref that was checked.
+            remote_sha: Commit the remote ref points to.
+        """
+        self.root.mkdir(exist_ok=True)
+        record = FetchRecord(time.time(), remote_ref, remote_sha, read_head(repo_path))
+        path = self._path(repo_path)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(record._asdict()))
+        os.replace(tmp, path)
+
+    def is_fresh(self, repo_path: Path, remote_ref: str, ttl: float) -> bool:
+        """Check if a repo was fetched within ttl seconds and is unchanged since.
+
+        Only reads the record and the local HEAD, so no git process is run.
+
+        Args:
+            repo_path: Path to the cloned repo.
+            remote_ref: Remote ref the record must be for.
+            ttl: Maximum age of the record in seconds.
+        """
+        record = self.load(repo_path)
+        return (
+            record is not None
+            and record.remote_ref == remote_ref
+            and time.time() - record.fetched_at < ttl
+            and record.head == read_head(repo_path)
+        )
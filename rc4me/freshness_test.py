@@ -0,0 +1,50 @@
+import git
+import pytest
+
+from rc4me.rcmanager import RcManager
+
+
+def _no_git(*args, **kwargs):
+    pytest.fail("git was used")
+
+
+def test_apply_within_ttl_skips_git(tmp_path, monkeypatch, rc1_remote, push_commit):
+    rcmanager = RcManager(tmp_path / "home", tmp_path, fetch_ttl=3600)
+    rcmanager.fetch_repo(str(rc1_remote))
+    push_commit(rc1_remote, "bashrc", "new")
+    with monkeypatch.context() as m:
+        m.setattr(git, "Repo", _no_git)
+        rcmanager.fetch_repo(str(rc1_remote))
+    assert (rcmanager.repo_path / "bashrc").read_text() == "foo"
+
+
+def test_remote_change_invalidates_after_ttl(
+    tmp_path, monkeypatch, rc1_remote, push_commit
+):
+    rcmanager = RcManager(tmp_path / "home", tmp_path)
+    rcmanager.fetch_repo(str(rc1_remote))
+    record = rcmanager.fetch_cache.load(rcmanager.repo_path)
+    assert record.remote_sha == git.Repo(rcmanager.repo_path).head.commit.hexsha
+    push_commit(rc1_remote, "bashrc", "new")
+    monkeypatch.setattr("builtins.input", lambda prompt: "y")
+    rcmanager.fetch_repo(str(rc1_remote))
+    assert (rcmanager.repo_path / "bashrc").read_text() == "new"
+    new_record = rcmanager.fetch_cache.load(rcmanager.repo_path)
+    assert new_record.remote_sha != record.remote_sha
+    assert new_record.head == new_record.remote_sha
+
+
+def test_unchanged_remote_is_not_fetched(tmp_path, monkeypatch, rc1_remote):
+    rcmanager = RcManager(tmp_path / "home", tmp_path)
+    rcmanager.fetch_repo(str(rc1_remote))
+    monkeypatch.setattr(git.Remote, "fetch", _no_git)
+    rcmanager.fetch_repo(str(rc1_remote))
+
+
+def test_offline(tmp_path, monkeypatch, rc1_remote):
+    rcmanager = RcManager(tmp_path / "home", tmp_path, offline=True)
+    with pytest.raises(FileNotFoundError):
+        rcmanager.fetch_repo(str(rc1_remote))
+    RcManager(tmp_path / "home", tmp_path).fetch_repo(str(rc1_remote))
+    monkeypatch.setattr(git, "Repo", _no_git)
+    rcmanager.fetch_repo(str(rc1_remote))
@@ -0,0 +1,192 @@
+"""Numbered history of the configs applied from an rc4me home.
+
+Every switch records a generation: the config directory it switched to, the
+commit that directory was at, and the paths that were linked from it. Rolling
+back to a generation reuses that listing instead of rescanning the repo, and
+only runs git if the repo has moved since, to restore the recorded commit, see
+`rc4me.snapshot`. Like Nix profile generations, rolling back only moves the
+current generation; the next switch records a new one after the newest.
+
+Each generation is stored as `<number>.json` holding its metadata and
+`<number>.links` holding its link paths, one per line, so listing the history
+does not read the (possibly long) link lists.
+"""
+
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# File holding the number of the current generation
+_CURRENT = "current"
+
+
+class Generation(NamedTuple):
+    """A config that was switched to.
+
+    Attributes:
+        number: Position in the history, starting at 1.
+        repo: Resolved path of the config directory.
+        head: Commit hash of the repo HEAD, or None if it is not a git repo.
+        time: When the generation was recorded, in seconds since the epoch.
+        sources: For configs derived from repos, such as stacks, the commit
+            of each repo they link into, keyed on repo path.
+    """
+
+    number: int
+    repo: str
+    head: Optional[str]
+    time: float
+    sources: Optional[Dict[str, Optional[str]]] = None
+
+
+def _write_atomic(path: Path, text: str) -> None:
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(text)
+    os.replace(tmp, path)
+
+
+class Generations:
+    """Generation records in a directory of the rc4me home."""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def numbers(self) -> List[int]:
+        """Numbers of all recorded generations, in increasing order."""
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return []
+        return sorted(
+            int(name[:-5])
+            for name in names
+            if name.endswith(".json") and name[:-5].isdigit()
+        )
+
+    def get(self, number: int) -> Generation:
+        """Load the metadata of a generation.
+
+        Raises:
+            KeyError: If there is no such generation.
+        """
+        try:
+            data = json.loads((self.root / f"{number}.json").read_text())
+        except FileNotFoundError:
+            raise KeyError(f"No generation {number}") from None
+        return Generation(**data)
+
+    def list(self) -> List[Generation]:
+        """All recorded generations, oldest first."""
+        generations = []
+        for number in self.numbers():
+            try:
+                generations.append(self.get(number))
+            except KeyError:
+                # Removed by a concurrent gc
+                continue
+        return generations
+
+    def links(self, number: int) -> Optional[List[str]]:
+        """Paths linked from the config of a generation, relative to it.
+
+        Returns None if the paths were not (or not yet) recorded.
+        """
+        try:
+            return (self.root / f"{number}.links").read_text().splitlines()
+        except FileNotFoundError:
+            return None
+
+    @property
+    def current(self) -> Optional[int]:
+        """Number of the generation dest is switched to, if recorded."""
+        try:
+            return int((self.root / _CURRENT).read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def set_current(self, number: int) -> None:
+        _write_atomic(self.root / _CURRENT, str(number))
+
+    def record(
+        self,
+        repo: Path,
+        head: Optional[str],
+        links: List[str],
+        sources: Optional[Dict[str, Optional[str]]] = None,
+    ) -> Generation:
+        """Add a generation after the newest one and make it current.
+
+        Args:
+            repo: Config directory that was switched to.
+            head: Commit the config directory was at.
+            links: Paths linked from the config directory.
+            sources: Commits of the repos a derived config directory links
+                into, keyed on repo path.
+        """
+        self.root.mkdir(exist_ok=True)
+        repo = str(Path(repo).resolve())
+        numbers = self.numbers()
+        number = numbers[-1] + 1 if numbers else 1
+        generation = Generation(number, repo, head, time.time(), sources)
+        # A concurrent switch may claim the same number, then take the next
+        while not self._claim(generation):
+            generation = generation._replace(number=generation.number + 1)
+        self.set_links(generation.number, links)
+        self.set_current(generation.number)
+        return generation
+
+    def set_links(self, number: int, links: List[str]) -> None:
+        """Replace the recorded link paths of a generation."""
+        text = "".join(f"{name}\n" for name in links)
+        _write_atomic(self.root / f"{number}.links", text)
+
+    def _claim(self, generation: Generation) -> bool:
+        """Write the metadata of a generation unless its number is taken."""
+        tmp = self.root / f".{generation.number}.json.{os.getpid()}.tmp"
+        tmp.write_text(json.dumps(generation._asdict()))
+        try:
+            os.link(tmp, self.root / f"{generation.number}.json")
+        except FileExistsError:
+            return False
+        finally:
+            tmp.unlink()
+        return True
+
+    def gc(self, keep: int, older_than: Optional[float] = None) -> List[int]:
+        """Delete old generations, always keeping the current one.
+
+        Args:
+            keep: Number of newest generations to keep.
+            older_than: If given, only delete generations recorded more than
+                this many seconds ago.
+
+        Returns:
+            Numbers of the deleted generations.
+        """
+        numbers = self.numbers()
+        candidates = numbers[: max(0, len(numbers) - keep)]
+        current = self.current
+        cutoff = None if older_than is None else time.time() - older_than
+        removed = []
+        for number in candidates:
+            if number == current:
+                continue
+            try:
+                if cutoff is not None and self.get(number).time > cutoff:
+                    continue
+            except KeyError:
+                continue
+            (self.root / f"{number}.json").unlink()
+            try:
+                (self.root / f"{number}.links").unlink()
+            except FileNotFoundError:
+                pass
+            removed.append(number)
+        if removed:
+            logger.info(f"Removed {len(removed)} old generations")
+        return removed
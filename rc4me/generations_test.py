@@ -0,0 +1,98 @@
+import json
+
+import git
+import pytest
+
+from rc4me.generations import Generations
+from rc4me.rcmanager import RcManager
+
+
+def test_record_and_list(tmp_path):
+    generations = Generations(tmp_path / "generations")
+    assert generations.list() == []
+    assert generations.current is None
+    first = generations.record(tmp_path, "abc", ["bashrc", "vim/vimrc"])
+    second = generations.record(tmp_path, None, [])
+    assert (first.number, second.number) == (1, 2)
+    assert generations.list() == [first, second]
+    assert generations.current == 2
+    assert generations.links(1) == ["bashrc", "vim/vimrc"]
+    assert generations.links(2) == []
+    with pytest.raises(KeyError):
+        generations.get(3)
+
+
+def test_gc(tmp_path):
+    generations = Generations(tmp_path / "generations")
+    for _ in range(5):
+        generations.record(tmp_path, None, ["bashrc"])
+    generations.set_current(1)
+    assert generations.gc(keep=2) == [2, 3]
+    assert generations.numbers() == [1, 4, 5]
+    assert generations.links(2) is None
+    assert generations.gc(keep=0, older_than=3600) == []
+    old = generations.root / "4.json"
+    old.write_text(json.dumps(generations.get(4)._replace(time=0)._asdict()))
+    assert generations.gc(keep=0, older_than=3600) == [4]
+
+
+def test_switches_record_generations(tmp_path, rc1_git, rc2):
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    rcmanager = RcManager(tmp_path / "home", dest, keep_generations=3)
+    rcmanager.change_current_to_repo(rc1_git)
+    rcmanager.change_current_to_repo(rc2)
+    rcmanager.change_current_to_init()
+    rcmanager.change_current_to_repo(rc2)
+    assert rcmanager.generations.numbers() == [2, 3, 4]
+    assert rcmanager.generations.get(2).repo == str(rc2)
+    with pytest.raises(KeyError):
+        rcmanager.rollback(1)
+    rcmanager.rollback(3)
+    assert not (dest / ".bashrc").exists()
+    assert rcmanager.generations.current == 3
+
+
+def test_rollback_uses_recorded_links(tmp_path, rc1_git, rc2, monkeypatch):
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    rcmanager = RcManager(tmp_path / "home", dest)
+    rcmanager.change_current_to_repo(rc1_git)
+    rcmanager.change_current_to_repo(rc2)
+    listed = []
+    link_names = RcManager.link_names
+
+    def _link_names(self, repo):
+        listed.append(repo)
+        return link_names(self, repo)
+
+    monkeypatch.setattr(RcManager, "link_names", _link_names)
+    rcmanager.rollback(1)
+    assert (dest / ".vimrc").read_text() == "blahblah"
+    assert rcmanager.generations.current == 1
+    assert rcmanager.generations.numbers() == [1, 2]
+    # rc2 is not a git repo, so it is listed; rc1 is unchanged and is not
+    assert listed == [rcmanager.current]
+    # Once rc1 has a new commit, the recorded one is restored from it
+    (rc1_git / "inputrc").write_text("set editing-mode vi")
+    (rc1_git / "bashrc").write_text("new")
+    repo = git.Repo(rc1_git)
+    repo.index.add(["inputrc", "bashrc"])
+    repo.index.commit("Add inputrc")
+    rcmanager.change_current_to_init()
+    rcmanager.rollback(1)
+    assert not (dest / ".inputrc").exists()
+    assert (dest / ".bashrc").read_text() == "foo"
+    assert rcmanager.current.resolve().parent == rcmanager.home / ".snapshots"
+    assert (rc1_git / "bashrc").read_text() == "new"
+    assert not repo.is_dirty()
+
+
+def test_rollback_fails_if_the_commit_is_gone(tmp_path, rc1_git):
+    rcmanager = RcManager(tmp_path / "home", tmp_path)
+    rcmanager.generations.record(rc1_git, "0" * 40, ["bashrc"])
+    rcmanager.change_current_to_repo(rc1_git)
+    with pytest.raises(FileNotFoundError, match="Commit 00000000 of .* not available"):
+        rcmanager.rollback(1)
+    assert rcmanager.generations.current == 2
+    assert rcmanager.current.resolve() == rc1_git
@@ -0,0 +1,89 @@
+"""Intent journal that lets an interrupted config switch be recovered.
+
+Before a switch touches the destination it records which config it is
+switching from and to; the record is removed once the switch is complete. If
+rc4me is killed in between, the next invocation finds the record and
+finishes the switch, or, if the target config no longer exists, switches
+back to the source config. Switch plans are computed from the state on disk,
+so re-planning either way only redoes the operations that did not complete.
+"""
+
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_VERSION = 1
+
+
+class Intent(NamedTuple):
+    """A switch in progress.
+
+    Attributes:
+        source: Config directory current pointed at before the switch.
+        prev: Config directory prev pointed at before the switch.
+        target: Config directory being switched to.
+        generation: Generation being rolled back to, if the switch is a
+            rollback, see `rc4me.generations`.
+        pid: Process that started the switch.
+        time: When the switch started, in seconds since the epoch.
+    """
+
+    source: str
+    prev: str
+    target: str
+    generation: Optional[int]
+    pid: int
+    time: float
+
+
+class Journal:
+    """A single intent record in the rc4me home."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def begin(
+        self, source: Path, prev: Path, target: Path, generation: Optional[int]
+    ) -> None:
+        """Record that a switch from source to target is starting."""
+        intent = Intent(
+            str(source), str(prev), str(target), generation, os.getpid(), time.time()
+        )
+        data = intent._asdict()
+        data["version"] = JOURNAL_VERSION
+        tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(data))
+        # Make sure the record is on disk before the switch starts
+        with open(tmp) as f:
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def load(self) -> Optional[Intent]:
+        """Return the recorded switch, if there is one."""
+        try:
+            data = json.loads(self.path.read_text())
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            # Only written atomically, so this is not from rc4me
+            logger.warning(f"Ignoring unreadable journal {self.path}")
+            return None
+        if data.pop("version", None) != JOURNAL_VERSION:
+            logger.warning(f"Ignoring journal {self.path} of another rc4me version")
+            return None
+        return Intent(**data)
+
+    def clear(self) -> None:
+        """Mark the recorded switch as complete."""
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,73 @@
+import shutil
+
+import pytest
+
+from rc4me.journal import Journal
+from rc4me.plan import SWAP, SYMLINK
+from rc4me.rcmanager import RcManager
+
+
+def test_journal(tmp_path):
+    journal = Journal(tmp_path / "journal.json")
+    assert journal.load() is None
+    journal.begin(tmp_path / "a", tmp_path / "p", tmp_path / "b", 3)
+    intent = journal.load()
+    assert (intent.source, intent.prev, intent.target, intent.generation) == (
+        str(tmp_path / "a"),
+        str(tmp_path / "p"),
+        str(tmp_path / "b"),
+        3,
+    )
+    journal.clear()
+    assert not journal.exists()
+
+
+def _crash_at(monkeypatch, action):
+    """Make switches fail at the first operation of a kind."""
+    run_op = RcManager._run_op
+
+    def _run_op(self, op):
+        if op.action == action:
+            raise KeyboardInterrupt
+        run_op(self, op)
+
+    monkeypatch.setattr(RcManager, "_run_op", _run_op)
+
+
+@pytest.mark.parametrize("action", [SWAP, SYMLINK])
+def test_recover_rolls_forward(tmp_path, rc1, rc2, monkeypatch, action):
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    (rc2 / "inputrc").write_text("set editing-mode vi")
+    rcmanager = RcManager(tmp_path / "home", dest)
+    rcmanager.change_current_to_repo(rc1)
+    with monkeypatch.context() as m:
+        _crash_at(m, action)
+        with pytest.raises(KeyboardInterrupt):
+            rcmanager.change_current_to_repo(rc2)
+    rcmanager = RcManager(tmp_path / "home", dest)
+    assert rcmanager.recover() is not None
+    assert not rcmanager.journal.exists()
+    assert (dest / ".bashrc").read_text() == "bar"
+    assert (dest / ".inputrc").is_symlink()
+    assert not (dest / ".vimrc").exists()
+    assert rcmanager.prev.resolve() == rc1
+    assert rcmanager.recover() is None
+
+
+def test_recover_rolls_back(tmp_path, rc1, rc2, monkeypatch):
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    (rc2 / "inputrc").write_text("set editing-mode vi")
+    rcmanager = RcManager(tmp_path / "home", dest)
+    rcmanager.change_current_to_repo(rc1)
+    with monkeypatch.context() as m:
+        _crash_at(m, SYMLINK)
+        with pytest.raises(KeyboardInterrupt):
+            rcmanager.change_current_to_repo(rc2)
+    shutil.rmtree(rc2)
+    # The next switch recovers first
+    rcmanager.change_current_to_prev()
+    assert not rcmanager.journal.exists()
+    assert rcmanager.current.resolve() == rcmanager.init
+    assert rcmanager.prev.resolve() == rc1
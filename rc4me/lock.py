@@ -0,0 +1,52 @@
+"""Advisory file locks for state shared between rc4me processes."""
+
+import fcntl
+import logging
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def file_lock(
+    path: Path,
+    shared: bool = False,
+    on_wait: Optional[Callable[[float], None]] = None,
+) -> Iterator[None]:
+    """Hold an flock on path for the duration of the context.
+
+    The lock file is created (world-writable, subject to umask) if possible,
+    so that it can be shared between users. If it can't be created, e.g. in a
+    read-only directory, the context runs without a lock.
+
+    Args:
+        path: Lock file.
+        shared: Take a shared (read) lock instead of an exclusive one.
+        on_wait: Called with the seconds spent waiting for the lock.
+    """
+    try:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+    except PermissionError:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            yield
+            return
+    operation = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+    start = time.perf_counter()
+    try:
+        try:
+            fcntl.flock(fd, operation | fcntl.LOCK_NB)
+        except BlockingIOError:
+            logger.info(f"Waiting for another rc4me process to release {path}")
+            fcntl.flock(fd, operation)
+        if on_wait is not None:
+            on_wait(time.perf_counter() - start)
+        yield
+    finally:
+        # Closing the file releases the lock
+        os.close(fd)
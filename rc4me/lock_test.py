@@ -0,0 +1,25 @@
+import threading
+import time
+
+from rc4me.lock import file_lock
+
+
+def test_file_lock_waits(tmp_path):
+    lock = tmp_path / "lock"
+    waited = []
+    with file_lock(lock, shared=True):
+        # Shared locks don't wait for each other
+        with file_lock(lock, shared=True, on_wait=waited.append):
+            pass
+        assert waited[0] < 0.5
+
+        def _exclusive():
+            with file_lock(lock, on_wait=waited.append):
+                pass
+
+        thread = threading.Thread(target=_exclusive)
+        thread.start()
+        time.sleep(0.2)
+        assert len(waited) == 1
+    thread.join()
+    assert waited[1] >= 0.2
@@ -0,0 +1,162 @@
+"""Persisted index of the files in an rc config repo.
+
+Listing a config repo with `glob` and resolving every entry costs several
+syscalls per file on each command. A manifest records the result of a single
+`os.scandir` pass and is reused until the repo HEAD or the directory mtime
+changes.
+"""
+
+import json
+import logging
+import os
+from pathlib import Path
+from typing import List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# Bump when the manifest layout changes so old files are treated as stale
+MANIFEST_VERSION = 1
+
+# Entry kinds. Symlinks are classified by what they point to.
+FILE = "file"
+DIR = "dir"
+
+
+class Entry(NamedTuple):
+    """A single top-level entry in a config repo.
+
+    Attributes:
+        name: File name within the repo.
+        kind: FILE or DIR, following symlinks.
+        target: Link target if the entry is a symlink, otherwise None.
+    """
+
+    name: str
+    kind: str
+    target: Optional[str] = None
+
+
+class Manifest(NamedTuple):
+    """Entries of a config repo along with the key used to detect staleness.
+
+    Attributes:
+        repo: Resolved path of the config repo.
+        head: Commit hash of the repo HEAD, or None if it is not a git repo.
+        mtime_ns: Modification time of the repo directory.
+        entries: Top-level entries, sorted by name.
+    """
+
+    repo: str
+    head: Optional[str]
+    mtime_ns: int
+    entries: List[Entry]
+
+
+def read_head(repo: Path) -> Optional[str]:
+    """Read the commit hash of a repo HEAD without invoking git.
+
+    Args:
+        repo: Path to a git work tree.
+
+    Returns:
+        The HEAD commit hash, or None if it cannot be determined.
+    """
+    git_dir = repo / ".git"
+    try:
+        head = (git_dir / "HEAD").read_text().strip()
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    if not head.startswith("ref: "):
+        # Detached HEAD
+        return head
+    ref = head[len("ref: ") :]
+    try:
+        return (git_dir / ref).read_text().strip()
+    except FileNotFoundError:
+        pass
+    # Fall back to packed refs, which hold refs that haven't been updated
+    try:
+        with open(git_dir / "packed-refs") as packed:
+            for line in packed:
+                if line.endswith(f" {ref}\n"):
+                    return line.split(" ", 1)[0]
+    except FileNotFoundError:
+        pass
+    return None
+
+
+def scan(repo: Path) -> Manifest:
+    """Build a manifest of a config repo with a single scandir pass.
+
+    Args:
+        repo: Resolved path to the config repo.
+    """
+    # Stat before scanning so changes made during the scan mark it stale
+    mtime_ns = repo.stat().st_mtime_ns
+    entries = []
+    with os.scandir(repo) as it:
+        for entry in it:
+            kind = DIR if entry.is_dir() else FILE
+            target = os.readlink(entry.path) if entry.is_symlink() else None
+            entries.append(Entry(entry.name, kind, target))
+    entries.sort()
+    return Manifest(str(repo), read_head(repo), mtime_ns, entries)
+
+
+def manifest_path(manifest_dir: Path, repo: Path) -> Path:
+    """Path to the persisted manifest of a config repo."""
+    return manifest_dir / f"{repo.name}.json"
+
+
+def load(path: Path) -> Optional[Manifest]:
+    """Load a persisted manifest, returning None if it is missing or invalid."""
+    try:
+        data = json.loads(path.read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+    if data.get("version") != MANIFEST_VERSION:
+        return None
+    entries = [Entry(*entry) for entry in data["entries"]]
+    return Manifest(data["repo"], data["head"], data["mtime_ns"], entries)
+
+
+def save(path: Path, manifest: Manifest) -> None:
+    """Persist a manifest, replacing any previous one atomically."""
+    path.parent.mkdir(exist_ok=True)
+    data = manifest._asdict()
+    data["version"] = MANIFEST_VERSION
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_text(json.dumps(data))
+    os.replace(tmp, path)
+
+
+def is_fresh(manifest: Optional[Manifest], repo: Path) -> bool:
+    """Check if a manifest still describes the given repo.
+
+    Args:
+        manifest: Previously built manifest, if any.
+        repo: Resolved path to the config repo.
+    """
+    return (
+        manifest is not None
+        and manifest.repo == str(repo)
+        and manifest.mtime_ns == repo.stat().st_mtime_ns
+        and manifest.head == read_head(repo)
+    )
+
+
+def get_manifest(manifest_dir: Path, repo: Path) -> Manifest:
+    """Return an up to date manifest for repo, rescanning only if stale.
+
+    Args:
+        manifest_dir: Directory holding persisted manifests.
+        repo: Path to the config repo. Symlinks (e.g. current) are resolved.
+    """
+    repo = repo.resolve()
+    path = manifest_path(manifest_dir, repo)
+    manifest = load(path)
+    if not is_fresh(manifest, repo):
+        logger.debug(f"Scanning {repo}")
+        manifest = scan(repo)
+        save(path, manifest)
+    return manifest
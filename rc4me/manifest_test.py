@@ -0,0 +1,40 @@
+import git
+
+from rc4me import manifest
+
+
+def test_scan_records_kinds_and_link_targets(rc1):
+    (rc1 / "plugins").mkdir()
+    (rc1 / "inputrc").symlink_to("vimrc")
+    found = manifest.scan(rc1)
+    assert found.head is None
+    assert found.entries == [
+        manifest.Entry("bashrc", manifest.FILE),
+        manifest.Entry("inputrc", manifest.FILE, "vimrc"),
+        manifest.Entry("plugins", manifest.DIR),
+        manifest.Entry("vimrc", manifest.FILE),
+    ]
+
+
+def test_manifest_is_reused_until_repo_changes(tmp_path, rc1_git):
+    manifest_dir = tmp_path / ".manifests"
+    first = manifest.get_manifest(manifest_dir, rc1_git)
+    assert first.head == git.Repo(rc1_git).head.commit.hexsha
+    assert manifest.load(manifest.manifest_path(manifest_dir, rc1_git)) == first
+    assert manifest.is_fresh(first, rc1_git)
+    # A commit that changes no top-level names still invalidates the manifest
+    (rc1_git / "bashrc").write_text("changed")
+    repo = git.Repo(rc1_git)
+    repo.index.add(["bashrc"])
+    repo.index.commit("Change bashrc")
+    assert not manifest.is_fresh(first, rc1_git)
+    second = manifest.get_manifest(manifest_dir, rc1_git)
+    assert second.head == repo.head.commit.hexsha
+    assert second.entries == first.entries
+
+
+def test_read_head_from_packed_refs(rc1_git):
+    repo = git.Repo(rc1_git)
+    repo.git.pack_refs("--all")
+    assert not (rc1_git / ".git" / "refs" / "heads" / "master").exists()
+    assert manifest.read_head(rc1_git) == repo.head.commit.hexsha
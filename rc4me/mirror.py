@@ -0,0 +1,206 @@
+"""Shared, read-only mirrors of config repos for hosts with many users.
+
+A mirror directory (e.g. /var/cache/rc4me) holds one bare `--mirror` clone per
+upstream, named after the repo and a hash of its url, so that repos with the
+same name never share a mirror. Mirrors are fetched from upstream at most once
+per TTL. Per-user clones are
+made with `git clone --shared`, which borrows the mirror's objects through
+git alternates instead of copying them, so a per-user apply is a local
+checkout. Mirrors are never pruned, since user clones depend on their
+objects.
+
+Git refuses repositories owned by another user (git >= 2.35.2), which the
+mirrors are for every user but the one who created them. Clones therefore run
+`git upload-pack` on their mirror with the mirror marked as a
+`safe.directory`, and record that command as `remote.origin.uploadpack`, so
+later fetches from the mirror work too. Command line `safe.directory` settings
+need git >= 2.38; with older versions, add the mirrors to the system config
+instead, e.g. `git config --system --add safe.directory /var/cache/rc4me/*.git`
+(one entry per mirror before git 2.46, which added the `*` suffix).
+"""
+
+import hashlib
+import logging
+import os
+import shlex
+import shutil
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
+
+from rc4me.lock import file_lock
+
+if TYPE_CHECKING:
+    import git
+
+logger = logging.getLogger(__name__)
+
+# Touched after each successful fetch of a mirror
+_STAMP = "rc4me-fetched"
+
+
+def _normalize_url(url: str) -> str:
+    """Upstream url or path of a repo, spelled the same way for every user."""
+    path = Path(url).expanduser()
+    if path.exists():
+        return str(path.resolve())
+    return url.rstrip("/")
+
+
+class Mirror:
+    """Directory of bare mirror clones shared between users."""
+
+    def __init__(self, root: Path, ttl: float = 300):
+        """Initialize the mirror directory.
+
+        Args:
+            root: Directory holding the mirrors.
+            ttl: Seconds after a fetch during which a mirror is not fetched
+                from upstream again.
+        """
+        self.root = Path(root)
+        self.ttl = ttl
+
+    def path(self, name: str, url: str) -> Path:
+        """Path of the mirror of a repo.
+
+        Args:
+            name: Repo name in the rc4me home directory.
+            url: Upstream url or path of the repo.
+        """
+        stem = name[: -len(".git")] if name.endswith(".git") else name
+        digest = hashlib.sha256(_normalize_url(url).encode()).hexdigest()
+        return self.root / f"{stem}-{digest[:12]}.git"
+
+    @staticmethod
+    def upload_pack(mirror: Path) -> str:
+        """Command serving a mirror to clones, even if another user owns it."""
+        # Local fetches drop config from the environment, so it is passed to
+        # upload-pack itself
+        safe = shlex.quote(f"safe.directory={mirror.resolve()}")
+        return f"git -c {safe} upload-pack"
+
+    def configure(self, r: "git.Repo") -> None:
+        """Make a clone of a mirror fetch from it, even if another user owns it.
+
+        Clones made by `clone` are configured already.
+        """
+        url = r.remote("origin").url
+        command = self.upload_pack(Path(url))
+        with r.config_reader() as reader:
+            current = reader.get_value('remote "origin"', "uploadpack", None)
+        if current != command:
+            with r.config_writer() as writer:
+                writer.set_value('remote "origin"', "uploadpack", command)
+
+    def _lock(self, mirror: Path, shared: bool = False):
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+        except PermissionError:
+            pass
+        return file_lock(self.root / f".{mirror.name}.lock", shared=shared)
+
+    def owns(self, url: str) -> bool:
+        """Check if a clone's remote url points into this mirror directory."""
+        return Path(url).parent == self.root
+
+    def _is_fresh(self, mirror: Path) -> bool:
+        try:
+            return time.time() - (mirror / _STAMP).stat().st_mtime < self.ttl
+        except FileNotFoundError:
+            return False
+
+    def update(self, name: str, url: str) -> Path:
+        """Create the mirror of a repo, or fetch it from upstream if stale.
+
+        Args:
+            name: Repo name in the rc4me home directory.
+            url: Upstream url or path of the repo, used to create the mirror.
+
+        Returns:
+            Path to the mirror.
+        """
+        mirror = self.path(name, url)
+        self.refresh(mirror, url)
+        return mirror
+
+    def refresh(self, mirror: Path, url: Optional[str] = None) -> None:
+        """Fetch a mirror from its upstream if stale, creating it from url.
+
+        Holds an exclusive lock while changing the mirror. If the mirror
+        directory isn't writable by this user, an existing mirror is used as
+        is.
+
+        Args:
+            mirror: Path of the mirror, e.g. the origin of a clone.
+            url: Upstream url or path of the repo, used to create the mirror.
+
+        Raises:
+            FileNotFoundError: If the mirror doesn't exist and url is None.
+        """
+        # Fast path without taking the lock
+        if self._is_fresh(mirror):
+            return
+        with self._lock(mirror):
+            # Another process may have updated the mirror while we waited
+            if self._is_fresh(mirror):
+                return
+            if not mirror.exists():
+                if url is None:
+                    raise FileNotFoundError(f"Mirror {mirror} not found")
+                self._create(mirror, url)
+            elif os.access(mirror, os.W_OK):
+                import git
+
+                logger.info(f"Fetching mirror {mirror}")
+                r = git.Repo(mirror)
+                # Writable by this user, e.g. through a group, but maybe not ours
+                r.git.set_persistent_git_options(c=f"safe.directory={mirror.resolve()}")
+                r.remote("origin").fetch()
+                (mirror / _STAMP).touch()
+            else:
+                logger.info(f"Mirror {mirror} is read-only, using it as is")
+
+    @staticmethod
+    def _create(mirror: Path, url: str) -> None:
+        """Clone a new mirror next to its final path and move it into place."""
+        logger.info(f"Creating mirror {mirror} of {url}")
+        tmp = mirror.with_name(f".{mirror.name}.{os.getpid()}.tmp")
+        import git
+
+        try:
+            git.Repo.clone_from(url, tmp, mirror=True)
+            (tmp / _STAMP).touch()
+            os.rename(tmp, mirror)
+        finally:
+            if tmp.exists():
+                shutil.rmtree(tmp)
+
+    def clone(self, name: str, url: str, repo_path: Path, **kwargs) -> "git.Repo":
+        """Clone a repo for a user, borrowing objects from the mirror.
+
+        The clone's origin is the mirror, so later fetches are local too.
+
+        Args:
+            name: Repo name in the rc4me home directory.
+            url: Upstream url or path of the repo.
+            repo_path: Path of the new clone.
+            kwargs: Options passed on to `git clone`, e.g. branch.
+        """
+        import git
+
+        mirror = self.update(name, url)
+        # A shared lock keeps the mirror from being fetched mid-clone
+        with self._lock(mirror, shared=True):
+            logger.info(f"Cloning {name} from mirror {mirror}")
+            upload_pack = self.upload_pack(mirror)
+            return git.Repo.clone_from(
+                mirror,
+                repo_path,
+                shared=True,
+                upload_pack=upload_pack,
+                config=f"remote.origin.uploadpack={upload_pack}",
+                # The command is our own, not taken from user input
+                allow_unsafe_options=True,
+                **kwargs,
+            )
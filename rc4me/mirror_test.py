@@ -0,0 +1,94 @@
+import threading
+
+import git
+import pytest
+
+from rc4me.mirror import Mirror
+from rc4me.rcmanager import RcManager
+
+
+def test_clones_share_mirror_objects(tmp_path, monkeypatch, rc1_remote, push_commit):
+    mirror = Mirror(tmp_path / "mirror", ttl=0)
+    users = [
+        RcManager(tmp_path / f"user{i}", tmp_path, mirror=mirror) for i in range(2)
+    ]
+    for rcmanager in users:
+        rcmanager.fetch_repo(str(rc1_remote))
+        clone = rcmanager.repo_path
+        alternates = clone / ".git" / "objects" / "info" / "alternates"
+        assert (mirror.path("rc1.git", str(rc1_remote)) / "objects").samefile(
+            alternates.read_text().strip()
+        )
+        assert (clone / "bashrc").read_text() == "foo"
+
+    # Updates reach users through the mirror
+    push_commit(rc1_remote, "bashrc", "new")
+    monkeypatch.setattr("builtins.input", lambda prompt: "y")
+    users[0].fetch_repo(str(rc1_remote))
+    r = git.Repo(mirror.path("rc1.git", str(rc1_remote)))
+    assert r.head.commit.message == "Update bashrc"
+    assert (users[0].repo_path / "bashrc").read_text() == "new"
+
+
+def test_repos_with_the_same_name(tmp_path, rc1_git, rc2):
+    r = git.Repo.init(rc2, initial_branch="master")
+    r.index.add(["bashrc"])
+    r.index.commit("Add rc files")
+    # Two users' ~/dotfiles, with different configs
+    remotes = [tmp_path / user / "dotfiles" for user in ("alice", "bob")]
+    for rc, remote in zip((rc1_git, rc2), remotes):
+        git.Repo(rc).clone(remote, bare=True)
+    mirror = Mirror(tmp_path / "mirror")
+    for i, remote in enumerate(remotes):
+        dest = tmp_path / f"dest{i}"
+        dest.mkdir()
+        rcmanager = RcManager(tmp_path / f"user{i}", dest, mirror=mirror)
+        rcmanager.fetch_repo(str(remote))
+        rcmanager.change_current_to_fetched_repo()
+    assert (tmp_path / "dest0" / ".bashrc").read_text() == "foo"
+    assert (tmp_path / "dest1" / ".bashrc").read_text() == "bar"
+    assert len({mirror.path("dotfiles", str(remote)) for remote in remotes}) == 2
+
+
+def test_concurrent_mirror_creation(tmp_path, rc1_remote):
+    mirror = Mirror(tmp_path / "mirror")
+    errors = []
+
+    def _clone(i):
+        try:
+            mirror.clone(
+                "rc1.git", str(rc1_remote), tmp_path / f"clone{i}", branch="master"
+            )
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=_clone, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert [p for p in (tmp_path / "mirror").iterdir() if p.is_dir()] == [
+        mirror.path("rc1.git", str(rc1_remote))
+    ]
+    assert all((tmp_path / f"clone{i}" / "bashrc").exists() for i in range(4))
+
+
+def test_mirror_of_another_user(tmp_path, monkeypatch, rc1_remote):
+    mirror = Mirror(tmp_path / "mirror")
+    mirror.update("rc1.git", str(rc1_remote))
+    # Makes git treat every repo as owned by another user
+    monkeypatch.setenv("GIT_TEST_ASSUME_DIFFERENT_OWNER", "1")
+    try:
+        plain = tmp_path / "plain"
+        git.Repo.clone_from(mirror.path("rc1.git", str(rc1_remote)), plain, shared=True)
+    except git.GitCommandError as e:
+        assert "dubious ownership" in str(e)
+    else:
+        pytest.skip("git does not check repo ownership")
+    r = mirror.clone("rc1.git", str(rc1_remote), tmp_path / "clone", branch="master")
+    assert (tmp_path / "clone" / "bashrc").read_text() == "foo"
+    # The clone is this user's own, but the test setting marks it foreign too
+    r.git.set_persistent_git_options(c=f"safe.directory={tmp_path / 'clone'}")
+    assert r.git.ls_remote("origin", "refs/heads/master")
+    r.remote("origin").fetch()
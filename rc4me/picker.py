@@ -0,0 +1,126 @@
+"""Interactive terminal picker for `rc4me select`.
+
+Renders repos from the catalog with their metadata and narrows the list as
+the user types, using `rc4me.catalog.filter_repos`. Up/down (or ctrl-p and
+ctrl-n) move the selection, enter picks it and escape cancels.
+"""
+
+import time
+from typing import List, Optional
+
+from rc4me.catalog import RepoInfo, filter_repos
+
+_ESCAPE = 27
+_ENTER = (10, 13)
+_BACKSPACE = (8, 127)
+_UP = 16  # ctrl-p
+_DOWN = 14  # ctrl-n
+
+
+def _size(size: int) -> str:
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024:
+            return f"{size:.0f}{unit}"
+        size /= 1024
+    return f"{size:.1f}GiB"
+
+
+def _age(seconds: float) -> str:
+    for unit, length in (("d", 86400), ("h", 3600), ("m", 60)):
+        if seconds >= length:
+            return f"{seconds // length:.0f}{unit} ago"
+    return "just now"
+
+
+def describe(info: RepoInfo, width: int = 24) -> str:
+    """One line describing a repo: name, commit, fetch age, files and size."""
+    head = info.head[:7] if info.head else "-"
+    fetched = "never" if info.fetched is None else _age(time.time() - info.fetched)
+    return (
+        f"{info.name:<{width}} {head:<7}  fetched {fetched:<9} "
+        f"{info.files} files, {_size(info.size)}"
+    )
+
+
+class _State:
+    """Query and selection of the picker."""
+
+    def __init__(self, infos: List[RepoInfo]):
+        self.infos = infos
+        self.query = ""
+        self.index = 0
+        self.matches = infos
+
+    def type(self, query: str):
+        self.query = query
+        self.matches = filter_repos(self.infos, query)
+        self.index = 0
+
+    def move(self, step: int):
+        if self.matches:
+            self.index = (self.index + step) % len(self.matches)
+
+
+def _draw(screen, state: _State, title: str, width: int):
+    import curses
+
+    screen.erase()
+    rows, cols = screen.getmaxyx()
+    screen.addnstr(0, 0, title, cols - 1)
+    screen.addnstr(1, 0, f"> {state.query}", cols - 1)
+    for row, info in enumerate(state.matches[: max(0, rows - 3)]):
+        attr = curses.A_REVERSE if row == state.index else curses.A_NORMAL
+        screen.addnstr(row + 2, 0, describe(info, width), cols - 1, attr)
+    screen.move(1, min(len(state.query) + 2, cols - 1))
+    screen.refresh()
+
+
+def _handle_key(state: _State, key: int) -> Optional[bool]:
+    """Update the state for a key press.
+
+    Returns:
+        True to pick the selection, False to cancel, or None to continue.
+    """
+    import curses
+
+    if key in _ENTER:
+        return bool(state.matches)
+    if key == _ESCAPE:
+        return False
+    if key in (curses.KEY_UP, _UP):
+        state.move(-1)
+    elif key in (curses.KEY_DOWN, _DOWN):
+        state.move(1)
+    elif key in _BACKSPACE or key == curses.KEY_BACKSPACE:
+        state.type(state.query[:-1])
+    elif 32 <= key < 127:
+        state.type(state.query + chr(key))
+    return None
+
+
+def pick_repo(infos: List[RepoInfo], title: str) -> Optional[RepoInfo]:
+    """Let the user pick a repo, narrowing the list as they type.
+
+    Returns:
+        The picked repo, or None if the user cancelled.
+    """
+    # curses is only needed by the interactive picker
+    import curses
+
+    width = max((len(info.name) for info in infos), default=0)
+    state = _State(infos)
+
+    def _loop(screen) -> Optional[RepoInfo]:
+        if hasattr(curses, "set_escdelay"):  # Python >= 3.9
+            # React to escape without the default one second delay
+            curses.set_escdelay(25)
+        while True:
+            _draw(screen, state, title, width)
+            done = _handle_key(state, screen.getch())
+            if done is not None:
+                return state.matches[state.index] if done else None
+
+    try:
+        return curses.wrapper(_loop)
+    except KeyboardInterrupt:
+        return None
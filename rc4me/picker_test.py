@@ -0,0 +1,28 @@
+import time
+
+from rc4me.catalog import RepoInfo
+from rc4me.picker import _handle_key, _State, describe
+
+INFOS = [
+    RepoInfo("init", "/h/init", None, None, 0, 0, 0),
+    RepoInfo("jeffmm_vimrc", "/h/jm", "a" * 40, time.time() - 7200, 3, 2048, 0),
+    RepoInfo("vimrc", "/h/vimrc", "b" * 40, None, 1, 10, 0),
+]
+
+
+def test_describe():
+    line = describe(INFOS[1])
+    assert line.split() == "jeffmm_vimrc aaaaaaa fetched 2h ago 3 files, 2KiB".split()
+
+
+def test_typing_filters_and_enter_picks():
+    state = _State(INFOS)
+    for char in "vim":
+        assert _handle_key(state, ord(char)) is None
+    assert [info.name for info in state.matches] == ["vimrc", "jeffmm_vimrc"]
+    _handle_key(state, 14)  # ctrl-n
+    assert _handle_key(state, 10) is True
+    assert state.matches[state.index].name == "jeffmm_vimrc"
+    _handle_key(state, 127)
+    assert state.query == "vi"
+    assert _handle_key(state, 27) is False
@@ -0,0 +1,263 @@
+"""Plan the filesystem operations needed to switch rc4me configs."""
+
+import os
+import stat
+from pathlib import Path
+from typing import TYPE_CHECKING, List, NamedTuple, Optional, Set, Tuple
+
+from rc4me.store import hash_file
+
+if TYPE_CHECKING:
+    from rc4me.rcmanager import RcManager
+
+# Operation actions, in the order they may appear in a plan
+UNLINK = "unlink"
+BACKUP = "backup"
+KEEP = "keep"
+RMTREE = "rmtree"
+SWAP = "swap"
+TOUCH = "touch"
+MKDIR = "mkdir"
+SYMLINK = "symlink"
+COPY = "copy"
+
+
+class Op(NamedTuple):
+    """A single filesystem operation in a switch plan.
+
+    Attributes:
+        action: One of the action constants above, e.g. UNLINK or SYMLINK.
+        path: Path that is created, replaced or removed by the operation.
+        source: Path the operation reads from or links to, if any.
+    """
+
+    action: str
+    path: Path
+    source: Optional[Path] = None
+
+    def __str__(self) -> str:
+        if self.source is None:
+            return f"{self.action:<8}{self.path}"
+        return f"{self.action:<8}{self.source} -> {self.path}"
+
+
+def stat_signature(path: Path) -> Optional[Tuple[int, int]]:
+    """Return (size, mtime_ns) of a regular file, or None if it isn't one."""
+    try:
+        st = os.stat(path, follow_symlinks=False)
+    except FileNotFoundError:
+        return None
+    if not stat.S_ISREG(st.st_mode):
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def links_to(link: Path, source: Path) -> bool:
+    """Check if link is a symlink pointing at source (without resolving)."""
+    try:
+        return os.readlink(link) == str(source)
+    except OSError:
+        return False
+
+
+def plan_switch(
+    rcmanager: "RcManager",
+    target: Path,
+    full: bool = False,
+    names: Optional[List[str]] = None,
+) -> List[Op]:
+    """Compute the operations that switch `current` to target.
+
+    Compares the outgoing config (current) with the incoming one (target) and
+    only plans work for destination entries that would change. Destination
+    links point at `current/<path>`, so between two linked configs a path
+    present in both needs nothing beyond the `current` swap. When the target
+    is init the files are copied, and files whose stat signature already
+    matches are skipped. Real files are only backed up when they differ from
+    the copy already held in init.
+
+    Args:
+        rcmanager: Manager holding the rc4me home and destination paths.
+        target: Config directory to switch to.
+        full: Unlink and relink every file, without skipping any work.
+        names: Link names of target, if already known.
+
+    Returns:
+        Ordered list of operations: unlinks, the swap, removals and parent
+        directories for incoming entries, then the links or copies. Nothing
+        after the first SYMLINK or COPY depends on another operation, so
+        those may be run in parallel.
+    """
+    current = rcmanager.current
+    from_init = rcmanager._current_is_init()
+    to_init = target.resolve() == rcmanager.init.resolve()
+    # Both configs are keyed on source paths, which are all under current
+    outgoing = {source: link for link, source in rcmanager._generate_link_paths()}
+    incoming = list(rcmanager._generate_link_paths(target, names))
+    # Links into current can be kept if current will still hold that path
+    keep = set() if full or to_init else {source for _, source in incoming}
+
+    ops = []
+    # If current is init, files in dest are real copies and are left in place.
+    # Otherwise remove links into current that the target will not reuse.
+    if not from_init:
+        for source in sorted(outgoing.keys() - keep):
+            if links_to(outgoing[source], source):
+                ops.append(Op(UNLINK, outgoing[source]))
+    removed = {op.path for op in ops}
+    kept = keep & outgoing.keys()
+    always_backup = full or not from_init
+    ops.append(Op(SWAP, current, target))
+    creates = []
+    parents: Set[Path] = set()
+    for link, source in incoming:
+        top = _plan_parents(rcmanager, link, parents, removed, ops)
+        if link not in removed and top not in removed:
+            if not full and source in kept and links_to(link, source):
+                continue
+            rel = source.relative_to(current)
+            if not full and to_init:
+                same = _compare_copy(rcmanager, link, target / rel, rel.as_posix())
+                if same is not None:
+                    ops.extend(same)
+                    continue
+            ops.extend(_plan_replace(link, rcmanager.init / rel, always_backup))
+        creates.append(Op(COPY if to_init else SYMLINK, link, source))
+    return ops + creates
+
+
+def plan_update(
+    rcmanager: "RcManager",
+    added: Set[str],
+    removed: Set[str],
+    changed: Set[str] = frozenset(),
+) -> List[Op]:
+    """Compute the operations that bring dest up to date with edits to current.
+
+    Unlike `plan_switch` this only looks at the given paths, so it costs the
+    same however large the config is, see `rc4me.watch`.
+
+    Args:
+        rcmanager: Manager holding the rc4me home and destination paths.
+        added: Link names that current gained.
+        removed: Link names that current lost.
+        changed: Link names whose contents changed. Only copies need
+            updating, links already show the new contents.
+
+    Returns:
+        Ordered list of operations, like `plan_switch` but without a swap.
+    """
+    current = rcmanager.current
+    is_init = rcmanager._current_is_init()
+    ops = []
+    # Copies from init are real files and are left in place, as in a switch
+    if not is_init:
+        for rel in sorted(removed):
+            if links_to(rcmanager.dest / f".{rel}", current / rel):
+                ops.append(Op(UNLINK, rcmanager.dest / f".{rel}"))
+    gone = {op.path for op in ops}
+    creates = []
+    parents: Set[Path] = set()
+    for rel in sorted(added | changed if is_init else added):
+        link, source = rcmanager.dest / f".{rel}", current / rel
+        top = _plan_parents(rcmanager, link, parents, gone, ops)
+        if link not in gone and top not in gone:
+            if not is_init and links_to(link, source):
+                continue
+            if is_init:
+                same = _compare_copy(rcmanager, link, rcmanager.init / rel, rel)
+                if same is not None:
+                    ops.extend(same)
+                    continue
+            ops.extend(_plan_replace(link, rcmanager.init / rel, not is_init))
+        creates.append(Op(COPY if is_init else SYMLINK, link, source))
+    return ops + creates
+
+
+def _plan_parents(
+    rcmanager: "RcManager",
+    link: Path,
+    parents: Set[Path],
+    removed: Set[Path],
+    ops: List[Op],
+) -> Path:
+    """Plan the destination directories a nested link needs.
+
+    A top-level destination directory that is currently a symlink (e.g. a
+    whole-directory link from a previous config) is removed first, so that
+    per-file links are never written through it into a config repo.
+
+    Args:
+        rcmanager: Manager holding the rc4me home and destination paths.
+        link: Destination entry that will be created.
+        parents: Directories already planned, updated in place.
+        removed: Paths already planned for removal, updated in place.
+        ops: Plan to append operations to.
+
+    Returns:
+        The top-level destination entry that link is in (or link itself).
+    """
+    parent = link.parent
+    if parent == rcmanager.dest:
+        return link
+    top = rcmanager.dest / link.relative_to(rcmanager.dest).parts[0]
+    if top not in parents:
+        parents.add(top)
+        if top not in removed and (top.is_symlink() or top.is_file()):
+            ops.extend(_plan_replace(top, rcmanager.init / top.name[1:], True))
+            removed.add(top)
+    if parent not in parents:
+        parents.add(parent)
+        if top in removed or not parent.is_dir():
+            ops.append(Op(MKDIR, parent))
+    return top
+
+
+def _compare_copy(
+    rcmanager: "RcManager", path: Path, source: Path, rel: str
+) -> Optional[List[Op]]:
+    """Check if path already holds a copy of source.
+
+    Files with equal stat signatures are taken to be identical. Files of equal
+    size but different mtimes are compared by hash; the digest of source is
+    taken from the backup store index when it is known, so only path is read.
+
+    Args:
+        rcmanager: Manager holding the backup store.
+        path: Destination entry.
+        source: File in init that would be copied to path.
+        rel: Path of source relative to init.
+
+    Returns:
+        None if source must be copied, otherwise the operations (if any) that
+        bring path up to date without copying.
+    """
+    if path.is_symlink():
+        return None
+    path_signature = stat_signature(path)
+    signature = stat_signature(source)
+    if path_signature is None or signature is None:
+        return None
+    if path_signature == signature:
+        return []
+    if path_signature[0] != signature[0]:
+        return None
+    digest = rcmanager.store.digest(rel, *signature) or hash_file(source)
+    if hash_file(path) == digest:
+        return [Op(TOUCH, path, source)]
+    return None
+
+
+def _plan_replace(link: Path, backup: Path, always_backup: bool) -> List[Op]:
+    """Plan removal of whatever is at link, backing up real files to init."""
+    if link.is_symlink():
+        return [Op(UNLINK, link)]
+    if link.is_dir():
+        return [Op(BACKUP, backup, link), Op(RMTREE, link)]
+    if not link.exists():
+        return []
+    # A real file in dest is backed up to init before it is replaced, unless
+    # it is an unmodified copy of the one already there.
+    if always_backup or stat_signature(link) != stat_signature(backup):
+        return [Op(BACKUP, backup, link), Op(UNLINK, link)]
+    return [Op(UNLINK, link)]
@@ -0,0 +1,92 @@
+from pathlib import Path
+
+from rc4me.plan import (
+    BACKUP,
+    COPY,
+    SWAP,
+    SYMLINK,
+    TOUCH,
+    UNLINK,
+    Op,
+    stat_signature,
+)
+from rc4me.rcmanager import RcManager
+
+
+def _make_repo(path: Path, files):
+    path.mkdir()
+    for name, text in files.items():
+        (path / name).write_text(text)
+    return path
+
+
+def _actions(ops):
+    return [(op.action, op.path.name) for op in ops]
+
+
+def test_plan_between_similar_repos_touches_only_changes(tmp_path):
+    repo_a = _make_repo(tmp_path / "a", {"bashrc": "a", "vimrc": "a", "inputrc": "a"})
+    repo_b = _make_repo(tmp_path / "b", {"bashrc": "b", "vimrc": "b", "gitconfig": "b"})
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    rcmanager = RcManager(tmp_path / "home", dest)
+    rcmanager.change_current_to_repo(repo_a)
+    ops = rcmanager.plan_switch(repo_b)
+    assert _actions(ops) == [
+        (UNLINK, ".inputrc"),
+        (SWAP, "current"),
+        (SYMLINK, ".gitconfig"),
+    ]
+
+
+def test_full_mode_relinks_everything(tmp_path, rc1):
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    rcmanager = RcManager(tmp_path / "home", dest, link_mode="full")
+    rcmanager.change_current_to_repo(rc1)
+    ops = rcmanager.plan_switch(rc1)
+    assert sorted(op.action for op in ops) == sorted(
+        [UNLINK, UNLINK, SWAP, SYMLINK, SYMLINK]
+    )
+
+
+def test_reset_skips_identical_copies_and_backups(tmp_path, rc1):
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    (dest / ".bashrc").write_text("mine")
+    rcmanager = RcManager(tmp_path / "home", dest)
+    ops = rcmanager.change_current_to_repo(rc1)
+    assert (BACKUP, "bashrc") in _actions(ops)
+    rcmanager.change_current_to_init()
+    assert (dest / ".bashrc").read_text() == "mine"
+    assert stat_signature(dest / ".bashrc") == stat_signature(rcmanager.init / "bashrc")
+    # Nothing left to copy when resetting again
+    assert _actions(rcmanager.change_current_to_init()) == [(SWAP, "current")]
+    # The copy in dest matches init, so switching away needs no new backup
+    ops = rcmanager.change_current_to_repo(rc1)
+    assert BACKUP not in [op.action for op in ops]
+    assert (COPY, ".bashrc") not in _actions(ops)
+
+
+def test_dry_run_leaves_dest_untouched(tmp_path, rc1):
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    rcmanager = RcManager(tmp_path / "home", dest, dry_run=True)
+    ops = rcmanager.change_current_to_repo(rc1)
+    assert Op(SYMLINK, dest / ".vimrc", rcmanager.current / "vimrc") in ops
+    assert list(dest.iterdir()) == []
+    assert rcmanager._current_is_init()
+
+
+def test_reset_touches_identical_content_instead_of_copying(tmp_path, rc1):
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    (dest / ".bashrc").write_text("mine")
+    rcmanager = RcManager(tmp_path / "home", dest)
+    rcmanager.change_current_to_repo(rc1)
+    rcmanager.change_current_to_init()
+    # Same content but a new mtime: no copy and no backup, just the mtime
+    (dest / ".bashrc").write_text("mine")
+    ops = rcmanager.change_current_to_init()
+    assert _actions(ops) == [(SWAP, "current"), (TOUCH, ".bashrc")]
+    assert stat_signature(dest / ".bashrc") == stat_signature(rcmanager.init / "bashrc")
@@ -6,7 +6,6 @@ import git
 
 from rc4me.rcmanager import RcManager
 
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 
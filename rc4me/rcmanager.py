@@ -1,20 +1,120 @@
 """Utility classes and functions for rc4me."""
 
 import logging
+import os
 import shutil
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
 
-import git
+from rc4me import manifest
+from rc4me.bundle import import_bundle, is_bundle
+from rc4me.catalog import Catalog, RepoInfo
+from rc4me.fastcopy import copy_file
+from rc4me.freshness import FetchCache
+from rc4me.generations import Generations
+from rc4me.journal import Journal
+from rc4me.lock import file_lock
+from rc4me.mirror import Mirror
+from rc4me.plan import (
+    BACKUP,
+    COPY,
+    KEEP,
+    MKDIR,
+    RMTREE,
+    SWAP,
+    SYMLINK,
+    TOUCH,
+    UNLINK,
+    Op,
+    plan_switch,
+    plan_update,
+)
+from rc4me.snapshot import pin, prune_snapshots, source_repos, write_sources
+from rc4me.stack import build_stack, prune_stacks
+from rc4me.store import BlobStore
+from rc4me.template import prune_renders, render_templates
+from rc4me.timing import NULL_PROFILER, Profiler
+from rc4me.walk import compile_excludes, walk_files
+
+if TYPE_CHECKING:
+    import git
 
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+# "indirect" switches configs by swapping the `current` symlink and only
+# touching destination entries that change. "full" unlinks and relinks every
+# file on each switch.
+LINK_MODES = ("indirect", "full")
+
+# How directories in a config repo are handled: "skip" ignores them, "link"
+# links each top-level directory as a whole, and "files" recreates the tree in
+# the destination and links every file in it individually.
+DIR_MODES = ("skip", "link", "files")
+
+# "shallow" clones the latest commit with its whole tree. "sparse" makes a
+# blobless partial clone and only checks out the files rc4me will link.
+CLONE_STRATEGIES = ("shallow", "sparse")
+
+# Branch of config repos that is cloned and pulled
+BRANCH = "master"
+REMOTE_REF = f"refs/heads/{BRANCH}"
+
+# Profiler counter incremented by each kind of operation. Backups are counted
+# per file in `_backup`, since a backup may copy a whole directory.
+_OP_COUNTERS = {
+    UNLINK: "unlinked",
+    RMTREE: "removed",
+    COPY: "copied",
+    SYMLINK: "linked",
+}
+
+
+def _atomic_symlink(link: Path, target: Path) -> None:
+    """Point `link` at `target`, replacing any existing link in one rename."""
+    tmp = link.with_name(f".{link.name}.tmp")
+    # Remove any leftover temp link from an interrupted run
+    if tmp.is_symlink():
+        tmp.unlink()
+    tmp.symlink_to(target)
+    os.replace(tmp, link)
+
 
 class RcManager:
     """Class for storing and manipulating rc4me home directory structure."""
 
-    def __init__(self, home: Path = Path.home() / ".rc4me", dest: Path = Path.home()):
+    def __init__(
+        self,
+        home: Path = Path.home() / ".rc4me",
+        dest: Path = Path.home(),
+        link_mode: str = "indirect",
+        dry_run: bool = False,
+        dir_mode: str = "skip",
+        exclude: Sequence[str] = (),
+        workers: int = 1,
+        fetch_ttl: float = 0,
+        offline: bool = False,
+        mirror: Optional[Mirror] = None,
+        clone_strategy: str = "shallow",
+        sparse_include: Sequence[str] = (),
+        profiler: Optional[Profiler] = None,
+        pinned_links: Optional[Dict[Path, List[str]]] = None,
+        keep_generations: int = 50,
+        templates: bool = False,
+        facts: Optional[Dict[str, str]] = None,
+    ):
         """Initialize paths to home and source rc4me config repos.
 
         Creates attributes `home`, `dest`, `repo_path`, which is the path to
@@ -24,43 +124,173 @@ class RcManager:
         Args:
             home: Path to rc4me home directory.
             dest: Directory to copy rc files to.
+            link_mode: How to switch between configs, one of `LINK_MODES`.
+            dry_run: Only plan config switches, do not apply them.
+            dir_mode: How to handle directories, one of `DIR_MODES`.
+            exclude: Glob patterns of repo paths not to link, see
+                `rc4me.walk.compile_excludes`.
+            workers: Number of threads used to create links and copies.
+            fetch_ttl: Seconds after fetching a repo during which it is not
+                checked against its remote again.
+            offline: Never contact remotes, only use repos already cloned.
+            mirror: Shared mirror to clone new repos from, if any.
+            clone_strategy: How to clone new repos, one of `CLONE_STRATEGIES`.
+            sparse_include: Extra sparse-checkout patterns (gitignore syntax)
+                for sparse clones, e.g. "/vim/".
+            profiler: Collects phase times and file counts, see
+                `rc4me.timing`. Profiling is off if not given.
+            pinned_links: Link names of config directories, keyed on their
+                resolved path, used instead of listing those directories.
+                Lets many managers share one listing, see `rc4me.fleet`.
+            keep_generations: Number of generations kept in the history, see
+                `rc4me.generations`.
+            templates: Render `.tmpl` files of configs for this host rather
+                than linking them as they are, see `rc4me.template`.
+            facts: Facts for templates that replace or add to those of the
+                host, see `rc4me.template`.
         """
+        if link_mode not in LINK_MODES:
+            raise ValueError(f"Unknown link mode {link_mode}, expected {LINK_MODES}")
+        if dir_mode not in DIR_MODES:
+            raise ValueError(f"Unknown dir mode {dir_mode}, expected {DIR_MODES}")
+        if clone_strategy not in CLONE_STRATEGIES:
+            raise ValueError(
+                f"Unknown clone strategy {clone_strategy}, "
+                f"expected {CLONE_STRATEGIES}"
+            )
         # Directory that holds all cloned rc config repos, and init, prev, current
-        self.home = home
+        self.home = Path(home)
         # Directory to copy rc4me files to (e.g. $HOME)
-        self.dest = dest
+        self.dest = Path(dest)
+        self.link_mode = link_mode
+        # Plan switches without touching the filesystem
+        self.dry_run = dry_run
+        self.dir_mode = dir_mode
+        self.exclude = tuple(exclude)
+        self._excluded = compile_excludes(self.exclude)
+        self.workers = workers
+        self.fetch_ttl = fetch_ttl
+        self.offline = offline
+        self.mirror = mirror
+        self.clone_strategy = clone_strategy
+        self.sparse_include = tuple(sparse_include)
+        self.profiler = NULL_PROFILER if profiler is None else profiler
+        self.pinned_links = pinned_links
+        self.keep_generations = keep_generations
+        self.templates = templates
+        self.facts = facts
         # Init rc4me home dir variables (init, prev, current)
         self._init_rc4me_home()
         # Directory holding source file repo
         self.repo_path = None
 
+    def for_paths(self, home: Path, dest: Path, **overrides) -> "RcManager":
+        """Return a manager of another home and dest with the same options.
+
+        Args:
+            home: Path to the rc4me home directory of the new manager.
+            dest: Destination directory of the new manager.
+            overrides: Options of the new manager that differ from this one.
+        """
+        options = dict(
+            link_mode=self.link_mode,
+            dry_run=self.dry_run,
+            dir_mode=self.dir_mode,
+            exclude=self.exclude,
+            workers=self.workers,
+            fetch_ttl=self.fetch_ttl,
+            offline=self.offline,
+            mirror=self.mirror,
+            clone_strategy=self.clone_strategy,
+            sparse_include=self.sparse_include,
+            profiler=self.profiler,
+            pinned_links=self.pinned_links,
+            keep_generations=self.keep_generations,
+            templates=self.templates,
+            facts=self.facts,
+        )
+        options.update(overrides)
+        return RcManager(home, dest, **options)
+
     def _current_is_init(self):
         """Check if current config is init."""
         return self.current.resolve() == self.init
 
-    def _cleanup_links_to_current(self):
-        """Remove symlinks in the home directory that link to files in current."""
-        if self._current_is_init():
-            # If current points to init config, then the files in current are
-            # not symlinks and should not be unlinked. Real files will always be
-            # copied to init if they are overwritten by a symlink.
-            return
-        for link, source in self._generate_link_paths():
-            # For each file in the current directory, check if the file is symlinked
-            # to home, and if so, unlink it from home
-            if link.is_symlink() and link.resolve() == source.resolve():
-                logger.info(f"Unlinking {link}")
-                link.unlink()
-
-    def _generate_link_paths(self):
-        """Generate file paths to destination."""
-        for source in self.current.glob("*"):
-            # Skip copying any directories or README files for now (stop-gap)
-            # TODO -- add ability to copy/link directories
-            if source.is_dir() or "README" in source.name:
+    def _generate_link_paths(
+        self, repo: Optional[Path] = None, names: Optional[List[str]] = None
+    ) -> Iterator[Tuple[Path, Path]]:
+        """Generate file paths to destination.
+
+        Sources are always yielded under `current`, so destination links
+        resolve through the `current` symlink rather than into a repo directly.
+        Top-level entries are listed from the repo manifest, which is only
+        rebuilt if the repo has changed since it was last scanned. Directories
+        are handled according to `dir_mode`, except in init: init only holds
+        backups, so its directories are always restored file by file.
+
+        Args:
+            repo: Config directory to list files from. Defaults to current.
+            names: Link names of repo, if already known.
+        """
+        if names is None and repo is None:
+            names = self._current_generation_names()
+        repo = self.current if repo is None else repo
+        if names is None:
+            names = self._listing(repo)
+        for rel in names:
+            yield self.dest / f".{rel}", self.current / rel
+
+    def _listing(self, repo: Path) -> List[str]:
+        """Link names of repo, from `pinned_links` if it holds them."""
+        if self.pinned_links:
+            names = self.pinned_links.get(repo.resolve())
+            if names is not None:
+                return names
+        return self.link_names(repo)
+
+    def _current_generation_names(self) -> Optional[List[str]]:
+        """Link names recorded for current, if it is unchanged since."""
+        number = self.generations.current
+        if number is None:
+            return None
+        try:
+            generation = self.generations.get(number)
+        except KeyError:
+            return None
+        repo = self.current.resolve()
+        if generation.repo != str(repo) or generation.head is None:
+            return None
+        if manifest.read_head(repo) != generation.head:
+            return None
+        return self.generations.links(number)
+
+    def link_names(self, repo: Path) -> List[str]:
+        """List the paths in a config directory that are linked into dest.
+
+        See `_generate_link_paths`.
+
+        Args:
+            repo: Config directory to list files from.
+
+        Returns:
+            Paths relative to repo.
+        """
+        repo_manifest = manifest.get_manifest(self.manifests, repo)
+        is_init = repo_manifest.repo == str(self.init.resolve())
+        dir_mode = "files" if is_init else self.dir_mode
+        names = []
+        for entry in repo_manifest.entries:
+            # Skip README files, which document the repo rather than configure
+            if "README" in entry.name or self._excluded(entry.name, entry.name):
+                continue
+            if entry.kind == manifest.DIR and dir_mode == "skip":
                 continue
-            link = self.dest / f".{source.name}"
-            yield link, source
+            if entry.kind == manifest.DIR and dir_mode == "files":
+                root = Path(repo_manifest.repo) / entry.name
+                names.extend(walk_files(root, entry.name, self.exclude))
+                continue
+            names.append(entry.name)
+        return names
 
     def _init_rc4me_home(self):
         """Create rc4me directory variables w/ init, prev, and current config.
@@ -76,6 +306,18 @@ class RcManager:
         self.init = self.home / "init"
         self.prev = self.home / "prev"
         self.current = self.home / "current"
+        # Cached listings of config repos, see rc4me.manifest
+        self.manifests = self.home / ".manifests"
+        # Deduplicated storage for the files backed up into init
+        self.store = BlobStore(self.home / ".store")
+        # Record of a switch in progress, for recovering interrupted ones
+        self.journal = Journal(self.home / ".journal.json")
+        # Numbered history of switches, for rollbacks
+        self.generations = Generations(self.home / ".generations")
+        # When each cloned repo was last checked against its remote
+        self.fetch_cache = FetchCache(self.home / ".fetch")
+        # Metadata of the config repos, for select
+        self.catalog = Catalog(self.home / ".catalog.json", self.fetch_cache)
         # If this is the first time calling rc4me, scaffold rc4me home dir
         if not self.init.exists():
             # Allow this to fail if home parent dir doesn't
@@ -88,41 +330,366 @@ class RcManager:
             )
             self.current.symlink_to(self.init)
 
-    def change_current_to_fetched_repo(self):
+    def change_current_to_fetched_repo(self) -> List[Op]:
         """Change current symlink to recently-fetched repo."""
-        self._update_current_and_prev_repos_and_set(self.repo_path)
+        return self._update_current_and_prev_repos_and_set(self.repo_path)
 
-    def change_current_to_prev(self):
+    def change_current_to_prev(self) -> List[Op]:
         """Change current symlink to previous rc4me config."""
-        self._update_current_and_prev_repos_and_set(self.prev.resolve())
+        return self._update_current_and_prev_repos_and_set(self.prev)
 
-    def change_current_to_init(self):
+    def change_current_to_init(self) -> List[Op]:
         """Change current symlink to initial rc4me config."""
-        self._update_current_and_prev_repos_and_set(self.init)
+        return self._update_current_and_prev_repos_and_set(self.init)
 
-    def change_current_to_repo(self, repo):
+    def change_current_to_repo(self, repo: Path) -> List[Op]:
         """Change current symlink to passed repo rc4me config."""
-        self._update_current_and_prev_repos_and_set(repo)
+        return self._update_current_and_prev_repos_and_set(repo)
+
+    def change_current_to_stack(
+        self, repos: Sequence[Path], concat: Sequence[str] = ()
+    ) -> List[Op]:
+        """Change current symlink to the merge of a stack of config repos.
+
+        Args:
+            repos: Config repos, lowest precedence first.
+            concat: Glob patterns of paths to concatenate across repos
+                rather than take from the last repo, see `rc4me.stack`.
+        """
+        stack = build_stack(self, repos, concat)
+        if not self.dry_run:
+            self._record_sources(stack.path, [Path(repo).resolve() for repo in repos])
+        return self._update_current_and_prev_repos_and_set(stack.path, stack.names)
+
+    def plan_switch(self, target: Path, names: Optional[List[str]] = None) -> List[Op]:
+        """Plan the operations that change current to target.
+
+        Args:
+            target: Config directory to switch to.
+            names: Link names of target, if already known.
+
+        Returns:
+            Ordered list of operations, see `rc4me.plan.plan_switch`.
+        """
+        self._check_target(target)
+        with self.profiler.span("plan"):
+            return plan_switch(self, target, self.link_mode == "full", names)
 
-    def _update_current_and_prev_repos(self, target: Path):
-        """Change current and previous symlink to point to target path."""
+    @staticmethod
+    def _check_target(target: Path):
         # Fail early before we unlink anything
         if not (target and target.exists()):
             raise FileExistsError("Relink target not found.")
-        self._cleanup_links_to_current()
-        # Update prev symlink to point to current
-        self.prev.unlink()
-        self.prev.symlink_to(self.current.resolve())
-        # Update current to point to target
-        self.current.unlink()
-        self.current.symlink_to(target)
-
-    def _update_current_and_prev_repos_and_set(self, target: Path):
-        """Runs _update_current_and_prev_repos follow by _set_repo_files"""
-        self._update_current_and_prev_repos(target)
-        self._set_repo_files()
-
-    def fetch_repo(self, repo: str):
+
+    def _swap_current(self, target: Path):
+        """Point prev at the current config and current at target."""
+        # Each swap is a single rename, so a crash never leaves either missing
+        _atomic_symlink(self.prev, self.current.resolve())
+        _atomic_symlink(self.current, target)
+
+    @contextmanager
+    def _locked(self, shared: bool = False) -> Iterator[None]:
+        """Hold the lock on the rc4me home, see `rc4me.lock`.
+
+        Switches take it exclusively, and commands that only read the home
+        take it shared. Time spent waiting for it is profiled as "lock".
+        """
+        with file_lock(self.home / ".lock", shared, self._lock_waited):
+            yield
+
+    @contextmanager
+    def _repo_locked(self, repo_path: Path) -> Iterator[None]:
+        """Hold the lock on a repo of the home while it is fetched or replaced.
+
+        Concurrent rc4me processes fetch the same repo one at a time.
+        """
+        locks = self.home / ".locks"
+        locks.mkdir(exist_ok=True)
+        lock = locks / f"{repo_path.name}.lock"
+        with file_lock(lock, on_wait=self._lock_waited):
+            yield
+
+    def _lock_waited(self, seconds: float):
+        self.profiler.add_time("lock", seconds)
+
+    def _update_current_and_prev_repos_and_set(
+        self,
+        target: Path,
+        names: Optional[List[str]] = None,
+        generation: Optional[int] = None,
+    ) -> List[Op]:
+        """Plan the switch to target and, unless dry_run is set, run it.
+
+        Holds the rc4me home lock, exclusively unless only planning, and
+        first recovers any switch that an earlier run did not complete.
+
+        Args:
+            target: Config directory to switch to.
+            names: Link names of target, if already known.
+            generation: Number of the generation being rolled back to.
+                Otherwise the switch is recorded as a new generation.
+        """
+        with self._locked(shared=self.dry_run):
+            if not self.dry_run:
+                self._recover()
+            return self._switch(target, names, generation)
+
+    def _switch(
+        self,
+        target: Path,
+        names: Optional[List[str]] = None,
+        generation: Optional[int] = None,
+        recovering: bool = False,
+    ) -> List[Op]:
+        """Switch to target while holding the home lock, journaling the switch."""
+        if target.is_symlink():
+            # Resolve links such as prev only now that the home is locked
+            target = target.resolve()
+        self._check_target(target)
+        repo = target
+        if names is None:
+            names = self._listing(target)
+        if self.templates and target != self.init:
+            # A plan must not write to the home, so the render isn't built
+            target, names = render_templates(self, target, names, not self.dry_run)
+            if target != repo and not self.dry_run:
+                self._record_sources(target, source_repos(self, repo) or [repo])
+        with self.profiler.span("plan"):
+            ops = plan_switch(self, target, self.link_mode == "full", names)
+        if recovering and self.current.resolve() == target.resolve():
+            # Swapped before the interruption, so prev is already right
+            ops = [op for op in ops if op.action != SWAP]
+        if self.dry_run:
+            return ops
+        self.journal.begin(
+            self.current.resolve(), self.prev.resolve(), target, generation
+        )
+        self._set_repo_files(ops)
+        if generation is not None:
+            self.generations.set_current(generation)
+        else:
+            self.generations.record(
+                target, manifest.read_head(target), names, self._source_heads(target)
+            )
+            if self.generations.gc(self.keep_generations):
+                self._prune()
+        self.journal.clear()
+        if repo.parent == self.home and repo != self.init:
+            self.catalog.update(repo)
+        return ops
+
+    def gc(self, keep: int, older_than: Optional[float] = None) -> List[int]:
+        """Delete old generations, and the directories only they used.
+
+        Stack and render directories that neither a kept generation nor
+        current or prev point at are deleted too, and so are the renders of
+        templates that only deleted render directories used. The current
+        generation is always kept.
+
+        Args:
+            keep: Number of newest generations to keep.
+            older_than: If given, only delete generations recorded more than
+                this many seconds ago.
+
+        Returns:
+            Numbers of the deleted generations.
+        """
+        with self._locked():
+            removed = self.generations.gc(keep, older_than)
+            self._prune()
+        return removed
+
+    def _prune(self) -> None:
+        """Delete derived config directories that are no longer used."""
+        in_use = {Path(generation.repo) for generation in self.generations.list()}
+        in_use |= {self.current.resolve(), self.prev.resolve()}
+        prune_stacks(self, in_use)
+        prune_renders(self, in_use)
+        prune_snapshots(self, in_use)
+
+    def _record_sources(self, config: Path, repos: List[Path]) -> None:
+        """Record the repos a derived config links into, see `rc4me.snapshot`."""
+        if source_repos(self, config) is None:
+            write_sources(config, repos)
+
+    def _source_heads(self, config: Path) -> Optional[Dict[str, Optional[str]]]:
+        """Commits of the repos a derived config links into, keyed on path."""
+        repos = source_repos(self, config)
+        if repos is None:
+            return None
+        return {str(repo): manifest.read_head(repo) for repo in repos}
+
+    def recover(self) -> Optional[List[Op]]:
+        """Finish or undo a switch that an earlier run did not complete.
+
+        Only costs a stat if there is nothing to recover. See `rc4me.journal`.
+
+        Returns:
+            The operations run to recover, or None if there was nothing to do.
+        """
+        if self.dry_run or not self.journal.exists():
+            return None
+        with self._locked():
+            return self._recover()
+
+    def _recover(self) -> Optional[List[Op]]:
+        """Recover an interrupted switch while holding the home lock."""
+        if not self.journal.exists():
+            return None
+        intent = self.journal.load()
+        if intent is None:
+            self.journal.clear()
+            return None
+        target, generation = Path(intent.target), intent.generation
+        if target.exists():
+            logger.warning(f"Finishing interrupted switch to {target.name}")
+        else:
+            logger.warning(f"{target} is gone, undoing interrupted switch to it")
+            target, generation = Path(intent.source), None
+            if not self.current.exists():
+                _atomic_symlink(self.current, target)
+            if Path(intent.prev).exists():
+                _atomic_symlink(self.prev, Path(intent.prev))
+        return self._switch(target, generation=generation, recovering=True)
+
+    def rollback(self, number: int) -> List[Op]:
+        """Switch to the config of a recorded generation.
+
+        The recorded link names are used, so the repo is not scanned. If the
+        repos of the generation have moved since, the recorded commits are
+        restored from them into snapshots, and those are linked instead, see
+        `rc4me.snapshot`. Rolling back does not record a new generation.
+
+        Args:
+            number: Generation to switch to, see `rc4me.generations`.
+
+        Raises:
+            KeyError: If there is no such generation.
+            FileNotFoundError: If a recorded commit is not available, so the
+                config can't be restored.
+        """
+        generation = self.generations.get(number)
+        target = Path(generation.repo)
+        sources = generation.sources
+        if sources is None:
+            sources = {generation.repo: generation.head}
+        names = None
+        # Without commits, the configs may have changed in ways we can't see
+        if None not in sources.values():
+            names = self.generations.links(number)
+        moved = {
+            repo: head
+            for repo, head in sources.items()
+            if head is not None and manifest.read_head(Path(repo)) != head
+        }
+        if moved:
+            logger.info(f"Restoring {target.name} as of generation {number}")
+            # A plan only checks that the commits are there, as it writes nothing
+            target = pin(self, target, moved, build=not self.dry_run)
+        return self._update_current_and_prev_repos_and_set(target, names, number)
+
+    def apply_changes(self, rels: Iterable[str]) -> List[Op]:
+        """Update dest for edits to some paths of the current config.
+
+        Only the given paths are listed again, so the cost does not depend on
+        the size of the config. Links already show edits to linked files, so
+        only added and removed paths (and changed copies, if current is init)
+        need any work. The recorded links of the current generation are
+        updated to match.
+
+        Args:
+            rels: Paths relative to the current config that changed, e.g.
+                from `rc4me.watch`. An empty path relists the whole config.
+
+        Returns:
+            Operations that were run, or only planned if dry_run is set.
+        """
+        rels = set(rels)
+        with self._locked(shared=self.dry_run):
+            if not self.dry_run:
+                self._recover()
+            repo = self.current.resolve()
+            number, before = self._linked_names(repo)
+            if "" in rels:
+                after = set(self.link_names(repo))
+            else:
+                after = self._relist(repo, before, rels)
+            with self.profiler.span("plan"):
+                ops = plan_update(
+                    self, after - before, before - after, rels & before & after
+                )
+            if self.dry_run:
+                return ops
+            self._set_repo_files(ops)
+            if after == before:
+                return ops
+            if number is not None:
+                self.generations.set_links(number, sorted(after))
+            else:
+                self.generations.record(
+                    repo,
+                    manifest.read_head(repo),
+                    sorted(after),
+                    self._source_heads(repo),
+                )
+        return ops
+
+    def _linked_names(self, repo: Path) -> Tuple[Optional[int], Set[str]]:
+        """Current generation, if it is of repo, and the names linked from repo.
+
+        Unlike `_current_generation_names`, the recorded names are used even
+        if the repo HEAD moved, since they are what dest holds.
+        """
+        recorded = self._recorded_names(repo)
+        if recorded is not None:
+            return recorded[0], set(recorded[1])
+        return None, set(self._listing(repo))
+
+    def _recorded_names(self, repo: Path) -> Optional[Tuple[int, List[str]]]:
+        """Current generation and the names it linked, if it is of repo."""
+        number = self.generations.current
+        if number is None:
+            return None
+        try:
+            generation = self.generations.get(number)
+        except KeyError:
+            return None
+        links = self.generations.links(number)
+        if generation.repo != str(repo) or links is None:
+            return None
+        return number, links
+
+    def _relist(self, repo: Path, names: Set[str], rels: Set[str]) -> Set[str]:
+        """Update the link names of repo for changes to the paths rels."""
+        names = set(names)
+        for rel in sorted(rels):
+            # Drop rel and everything below it, then list what is there now
+            names = {n for n in names if n != rel and not n.startswith(f"{rel}/")}
+            names |= self._names_at(repo, rel)
+        return names
+
+    def _names_at(self, repo: Path, rel: str) -> Set[str]:
+        """Link names of repo at or below rel, by the rules of `link_names`."""
+        parts = rel.split("/")
+        prefixes = ["/".join(parts[: i + 1]) for i in range(len(parts))]
+        if "README" in parts[0] or any(map(self._excluded, prefixes, parts)):
+            return set()
+        path = repo / rel
+        if not path.exists():
+            return set()
+        top_is_dir = (repo / parts[0]).is_dir()
+        if not top_is_dir:
+            return {rel}
+        dir_mode = "files" if repo == self.init.resolve() else self.dir_mode
+        if dir_mode == "skip":
+            return set()
+        if dir_mode == "link":
+            return {parts[0]}
+        if path.is_dir():
+            return set(walk_files(path, rel, self.exclude))
+        return {rel}
+
+    def fetch_repo(self, repo: str, confirm: Optional[Callable[[], bool]] = None):
         """Clone RC repository to local directory.
 
         Clones rc4me repository to rc4me home directory at $HOME/.rc4me. If the
@@ -130,6 +697,8 @@ class RcManager:
 
         Args:
             repo: Git/local repo from which to clone rc config
+            confirm: Called when the repo has new updates; pull if it returns
+                True. Defaults to asking the user.
         """
 
         def _check_if_overwrite() -> bool:
@@ -138,6 +707,9 @@ class RcManager:
             return confirm.lower() == "y"
 
         repo_is_local = Path(repo).expanduser().exists()
+        if repo_is_local and is_bundle(Path(repo).expanduser()):
+            import_bundle(self, Path(repo).expanduser())
+            return
         if repo_is_local:
             repo = str(Path(repo).expanduser())
             self.repo_path = self.home / Path(repo).name
@@ -145,69 +717,306 @@ class RcManager:
             repo_local = repo.replace("/", "_")
             self.repo_path = self.home / repo_local
 
-        # First check whether the repo is already cloned in the home directory
-        if self.repo_path.exists():
-            r = git.Repo(self.repo_path)
-            # Fetch any changes from origin
-            fetch_info = r.remote("origin").fetch()
-            # Check that the local repo is up to date
-            if fetch_info[0].commit.hexsha != r.head.commit.hexsha:
-                # Update the repo on user confirmation
-                if _check_if_overwrite():
-                    r.remote("origin").pull("master")
-        # If the repo is a local directory, clone from the local directory
-        elif repo_is_local:
-            # If the path refers to a local directory, assume it is a git repo
-            logger.info(f"Cloning directory {repo}")
-            git.Repo(repo).clone(self.repo_path, branch="master", depth=1)
-        # Otherwise assume the repo refers to a remote GitHub repository
+        with self._repo_locked(self.repo_path):
+            # First check whether the repo is already cloned in the home dir
+            if self.repo_path.exists():
+                with self.profiler.span("git"):
+                    self._refresh_repo(self.repo_path, confirm or _check_if_overwrite)
+                    self._update_sparse_checkout(self.repo_path)
+            elif self.offline:
+                raise FileNotFoundError(
+                    f"Repository {repo} is not cloned in {self.home}"
+                )
+            else:
+                with self.profiler.span("git"):
+                    self._clone_repo(repo, repo_is_local)
+            record = self.fetch_cache.load(self.repo_path)
+        with self._locked():
+            self.catalog.update(self.repo_path, record and record.fetched_at)
+
+    def _clone_repo(self, repo: str, repo_is_local: bool):
+        """Clone a local or GitHub repo to `repo_path`."""
+        # GitPython is slow to import, so only commands that use git load it
+        import git
+
+        url = repo if repo_is_local else f"https://github.com/{repo}"
+        sparse = self.clone_strategy == "sparse"
+        # Sparse clones only check out what rc4me links, after the patterns are set
+        kwargs = {"branch": BRANCH, "no_checkout": sparse}
+        # Borrow objects from a shared mirror if one is configured
+        if self.mirror is not None:
+            r = self.mirror.clone(self.repo_path.name, url, self.repo_path, **kwargs)
         else:
-            # Clone from GitHub to the home directory
-            logger.info(f"Cloning GitHub repo {repo}")
-            git.Repo.clone_from(
-                f"https://github.com/{repo}",
-                self.repo_path,
-                branch="master",
-                depth=1,
-            )
+            if sparse:
+                # Only fetch blobs when they are checked out. Local clones
+                # ignore --filter and --depth unless cloned over file://.
+                kwargs["filter"] = "blob:none"
+                url = f"file://{repo}" if repo_is_local else url
+            # If the repo is a local directory, clone from the local directory
+            if repo_is_local and not sparse:
+                # If the path refers to a local directory, assume it is a git repo
+                logger.info(f"Cloning directory {repo}")
+                r = git.Repo(repo).clone(self.repo_path, depth=1, **kwargs)
+            # Otherwise assume the repo refers to a remote GitHub repository
+            else:
+                # Clone from GitHub to the home directory
+                logger.info(f"Cloning {url}")
+                r = git.Repo.clone_from(url, self.repo_path, depth=1, **kwargs)
+        if sparse:
+            self._set_sparse_checkout(r)
+            r.git.checkout(BRANCH)
+        self.fetch_cache.record(self.repo_path, REMOTE_REF, r.head.commit.hexsha)
+
+    def sparse_patterns(self) -> List[str]:
+        """Sparse-checkout patterns matching the files rc4me will link.
+
+        Patterns use gitignore syntax: top-level files (and directories, unless
+        `dir_mode` is "skip"), then `sparse_include`, then negated `exclude`
+        patterns.
+        """
+        patterns = ["/*"] if self.dir_mode != "skip" else ["/*", "!/*/"]
+        patterns += list(self.sparse_include)
+        patterns += [f"!{pattern}" for pattern in self.exclude]
+        return patterns
+
+    def _set_sparse_checkout(self, r: "git.Repo"):
+        """Restrict the work tree of a clone to `sparse_patterns`."""
+        r.git.sparse_checkout("set", "--no-cone", *self.sparse_patterns())
+
+    def _update_sparse_checkout(self, repo_path: Path):
+        """Reset the patterns of a sparse clone if the link options changed."""
+        sparse_file = repo_path / ".git" / "info" / "sparse-checkout"
+        if self.offline or not sparse_file.exists():
+            return
+        if sparse_file.read_text().splitlines() != self.sparse_patterns():
+            logger.info(f"Updating sparse checkout of {repo_path.name}")
+            import git
+
+            self._set_sparse_checkout(git.Repo(repo_path))
+
+    def refresh_repo(
+        self, repo_path: Path, confirm: Callable[[], bool], ttl: Optional[float] = None
+    ) -> Tuple[int, bool]:
+        """Bring a cloned repo up to date while holding its lock.
+
+        Goes through the mirror and fetch cache as `fetch_repo` does, and
+        updates the catalog entry of the repo.
+
+        Args:
+            repo_path: Path to a cloned config repo.
+            confirm: Called when the repo has new updates; pull if it returns
+                True.
+            ttl: Skip repos fetched within ttl seconds, `fetch_ttl` if None.
 
-    def _set_repo_files(self):
+        Returns:
+            Number of commits HEAD was behind origin, and whether they were
+            pulled.
+        """
+        with self._repo_locked(repo_path):
+            with self.profiler.span("git"):
+                result = self._refresh_repo(repo_path, confirm, ttl)
+            record = self.fetch_cache.load(repo_path)
+        with self._locked():
+            self.catalog.update(repo_path, record and record.fetched_at)
+        return result
+
+    def _refresh_repo(
+        self, repo_path: Path, confirm: Callable[[], bool], ttl: Optional[float] = None
+    ) -> Tuple[int, bool]:
+        """Bring a cloned repo up to date, skipping remote checks if possible.
+
+        Nothing is checked if rc4me is offline or the repo was fetched within
+        ttl. Otherwise `ls-remote` is compared with HEAD first, so the repo is
+        only fetched if the remote branch has moved.
+
+        Args:
+            repo_path: Path to a cloned config repo.
+            confirm: Called when the repo has new updates; pull if it returns
+                True.
+            ttl: Maximum age of the last fetch in seconds, `fetch_ttl` if None.
+
+        Returns:
+            Number of commits HEAD was behind origin, and whether they were
+            pulled. Repos that weren't fetched count as up to date.
+        """
+        if self.offline:
+            logger.info(f"Offline, using {repo_path.name} as cloned")
+            return 0, False
+        if not (repo_path / ".git").exists():
+            logger.info(f"{repo_path.name} is not a git repo, e.g. from a bundle")
+            return 0, False
+        ttl = self.fetch_ttl if ttl is None else ttl
+        if self.fetch_cache.is_fresh(repo_path, REMOTE_REF, ttl):
+            logger.info(f"{repo_path.name} was fetched recently, not fetching")
+            return 0, False
+        import git
+
+        r = git.Repo(repo_path)
+        origin_url = r.remote("origin").url
+        if self.mirror is not None and self.mirror.owns(origin_url):
+            # Refresh the shared mirror first, then the clone fetches from it
+            self.mirror.refresh(Path(origin_url))
+            self.mirror.configure(r)
+        remote_sha = r.git.ls_remote("origin", REMOTE_REF).split("\t", 1)[0]
+        if remote_sha and remote_sha == r.head.commit.hexsha:
+            self.fetch_cache.record(repo_path, REMOTE_REF, remote_sha)
+            return 0, False
+        return self.update_repo(repo_path, confirm)
+
+    def update_repo(
+        self, repo_path: Path, confirm: Callable[[], bool]
+    ) -> Tuple[int, bool]:
+        """Fetch a cloned rc repo and pull new commits from origin if confirmed.
+
+        Args:
+            repo_path: Path to a cloned config repo.
+            confirm: Called when the repo has new updates; pull if it returns
+                True.
+
+        Returns:
+            Number of commits HEAD was behind origin, and whether they were
+            pulled.
+        """
+        import git
+
+        r = git.Repo(repo_path)
+        # Fetch any changes from origin
+        fetch_info = r.remote("origin").fetch()
+        tracking = f"origin/{BRANCH}"
+        info = next((i for i in fetch_info if i.name == tracking), fetch_info[0])
+        remote = info.commit.hexsha
+        behind, pulled = 0, False
+        # Check that the local repo is up to date
+        if remote != r.head.commit.hexsha:
+            behind = int(r.git.rev_list("--count", f"HEAD..{remote}"))
+            # Update the repo on user confirmation
+            if confirm():
+                r.remote("origin").pull(BRANCH)
+                pulled = True
+        self.fetch_cache.record(repo_path, REMOTE_REF, remote)
+        return behind, pulled
+
+    def _set_repo_files(self, ops: List[Op]):
         """Link or copy files from rc4me source to (hidden) destination.
 
-        Transfers files found in the rc4me source directory and creates
-        symlinks of them in the rc4me destination directory. If the source
+        Runs a switch plan. Files found in the rc4me source directory are
+        symlinked into the rc4me destination directory. If the source
         directory is home/init, the files are copied instead, allowing a
-        user to safely delete their rc4me home dir after a reset.
-        """
-        # If we are restoring the initial config, copy the files rather than
-        # link them, so that the user can safely delete their rc4me home dir
-        copy_files = self._current_is_init()
-        for link_path, source_path in self._generate_link_paths():
-            # Unlink any files that exist at link_path
-            if link_path.exists():
-                # If we would be overwriting a non-symlinked file, copy to init
-                if not link_path.is_symlink():
-                    backup_path = self.init / f"{source_path.name}"
-                    logger.info(f"Backing up {link_path}->{backup_path}")
-                    shutil.copy(link_path, backup_path)
-                # Unlink the existing file
-                link_path.unlink()
-            # Copy files if we are changing config to init.
-            if copy_files:
-                logger.info(f"Copying {source_path}->{link_path}")
-                shutil.copy(source_path, link_path)
+        user to safely delete their rc4me home dir after a reset. Real files
+        that would be overwritten are first backed up to init.
+
+        Links and copies come last in a plan and are independent of each
+        other, so they are spread over `workers` threads.
+
+        Args:
+            ops: Operations from `plan_switch`.
+        """
+        creates = [op for op in ops if op.action in (SYMLINK, COPY)]
+        for op in ops[: len(ops) - len(creates)]:
+            self._run_op(op)
+        self.store.save()
+        with self.profiler.span("create"):
+            if self.workers > 1 and len(creates) > 1:
+                with ThreadPoolExecutor(self.workers) as pool:
+                    # Consume the results so that errors are raised here
+                    list(pool.map(self._run_op, creates))
             else:
-                # Symlink the source rc files to the new path.
-                logger.info(f"Linking {source_path}->{link_path}")
-                link_path.symlink_to(source_path)
+                for op in creates:
+                    self._run_op(op)
+
+    def _run_op(self, op: Op):
+        """Run a single operation of a switch plan."""
+        # Formatted lazily, since this runs once per file
+        logger.debug("%s", op)
+        with self.profiler.span(op.action):
+            self._apply_op(op)
+        if op.action in _OP_COUNTERS:
+            self.profiler.count(_OP_COUNTERS[op.action])
+        if op.action == COPY and self.profiler.enabled:
+            self.profiler.count("bytes_copied", op.path.stat().st_size)
+
+    def _apply_op(self, op: Op):
+        """Make the filesystem change of an operation."""
+        if op.action == UNLINK:
+            op.path.unlink()
+        elif op.action == RMTREE:
+            shutil.rmtree(op.path)
+        elif op.action == BACKUP:
+            self._backup(op.source, op.path)
+        elif op.action == KEEP:
+            rel = op.path.relative_to(self.init).as_posix()
+            self.store.keep(op.source, op.path, rel)
+            self.profiler.count("backed_up")
+        elif op.action == SWAP:
+            self._swap_current(op.source)
+        elif op.action == MKDIR:
+            op.path.mkdir(parents=True, exist_ok=True)
+        elif op.action == TOUCH:
+            shutil.copystat(op.source, op.path)
+        elif op.action == COPY:
+            copy_file(op.source, op.path, atomic=True)
+        else:
+            op.path.symlink_to(op.source)
+
+    def _backup(self, path: Path, backup_path: Path):
+        """Copy a real file or directory tree from dest into init.
+
+        Files go through the blob store, so entries in init are hardlinks to
+        deduplicated blobs.
+        """
+
+        def _backup_file(src: str, dst: str):
+            rel = Path(dst).relative_to(self.init).as_posix()
+            self.store.backup(Path(src), Path(dst), rel)
+            self.profiler.count("backed_up")
+
+        if not path.is_dir():
+            _backup_file(path, backup_path)
+            return
+
+        def _links_to_current(directory: str, names: List[str]) -> List[str]:
+            """Skip links into current, they are rc4me's own and not user data."""
+            current = str(self.current)
+            return [
+                name
+                for name in names
+                if os.path.islink(os.path.join(directory, name))
+                and os.readlink(os.path.join(directory, name)).startswith(current)
+            ]
+
+        shutil.copytree(
+            path,
+            backup_path,
+            symlinks=True,
+            ignore=_links_to_current,
+            copy_function=_backup_file,
+            dirs_exist_ok=True,
+        )
 
     def get_rc_repos(self) -> Dict[str, Path]:
         """Searches home dir and grabs all the rc repos it finds
 
-        Excludes "current" and "prev".
+        Excludes "current", "prev" and hidden rc4me state such as manifests.
 
         Returns:
             Map with key repo name, value repo Path
         """
-        dirs = [p for p in self.home.glob("*") if p.name not in ["current", "prev"]]
+        with self._locked(shared=True):
+            dirs = [
+                p
+                for p in self.home.glob("*")
+                if p.name not in ["current", "prev"] and not p.name.startswith(".")
+            ]
         return {p.name: p for p in dirs}
+
+    def repo_infos(self) -> List[RepoInfo]:
+        """Metadata of every rc repo in the home, in name order.
+
+        Served from the catalog, rescanning only repos that changed since
+        they were last indexed, see `rc4me.catalog`. Only reads the home, so
+        listings don't wait for each other, and the catalog is replaced
+        atomically by whichever listing saves it last.
+        """
+        repos = self.get_rc_repos()
+        with self._locked(shared=True):
+            return self.catalog.refresh(repos)
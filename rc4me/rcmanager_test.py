@@ -1,6 +1,8 @@
 from pathlib import Path
 
-from rc4me.rcmanager import RcManager
+import pytest
+
+from rc4me.rcmanager import LINK_MODES, RcManager
 
 
 def test_init():
@@ -19,3 +21,117 @@ def test_rcmanager_get_rc_repo(tmp_path, rc1, rc2):
     found_rcs = rcmanager.get_rc_repos()
     expected_rcs = {rc1.name: rc1, rc2.name: rc2, "init": tmp_path / "init"}
     assert found_rcs == expected_rcs
+
+
+def _dest_links(dest: Path):
+    return {p.name: p.resolve() for p in dest.iterdir() if p.is_symlink()}
+
+
+@pytest.mark.parametrize("link_mode", LINK_MODES)
+def test_switch_between_repos(tmp_path, rc1, rc2, link_mode):
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    rcmanager = RcManager(tmp_path / "home", dest, link_mode=link_mode)
+    rcmanager.change_current_to_repo(rc1)
+    assert _dest_links(dest) == {".bashrc": rc1 / "bashrc", ".vimrc": rc1 / "vimrc"}
+    rcmanager.change_current_to_repo(rc2)
+    assert _dest_links(dest) == {".bashrc": rc2 / "bashrc"}
+    rcmanager.change_current_to_prev()
+    assert _dest_links(dest) == {".bashrc": rc1 / "bashrc", ".vimrc": rc1 / "vimrc"}
+    assert rcmanager.prev.resolve() == rc2
+
+
+def test_indirect_switch_keeps_shared_links(tmp_path, rc1, rc2):
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    rcmanager = RcManager(tmp_path / "home", dest)
+    rcmanager.change_current_to_repo(rc1)
+    inode = (dest / ".bashrc").lstat().st_ino
+    rcmanager.change_current_to_repo(rc2)
+    # The shared name is retargeted by the current swap, not relinked
+    assert (dest / ".bashrc").lstat().st_ino == inode
+    assert (dest / ".bashrc").read_text() == rc2.joinpath("bashrc").read_text()
+
+
+def test_indirect_switch_backs_up_real_files(tmp_path, rc1, rc2):
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    rcmanager = RcManager(tmp_path / "home", dest)
+    rcmanager.change_current_to_repo(rc2)
+    (dest / ".vimrc").write_text("mine")
+    rcmanager.change_current_to_repo(rc1)
+    assert (rcmanager.init / "vimrc").read_text() == "mine"
+    rcmanager.change_current_to_init()
+    assert not (dest / ".vimrc").is_symlink()
+    assert (dest / ".vimrc").read_text() == "mine"
+
+
+@pytest.fixture()
+def rc_vim(tmp_path):
+    """rc repo with a nested vim directory"""
+    d = tmp_path / "vim_rc"
+    (d / "vim" / "pack").mkdir(parents=True)
+    (d / "vimrc").write_text("vimrc")
+    (d / "vim" / "colors.vim").write_text("colors")
+    (d / "vim" / "pack" / "plugin.vim").write_text("plugin")
+    return d
+
+
+def test_dir_mode_skip(tmp_path, rc_vim):
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    RcManager(tmp_path / "home", dest).change_current_to_repo(rc_vim)
+    assert sorted(p.name for p in dest.iterdir()) == [".vimrc"]
+
+
+def test_dir_mode_link(tmp_path, rc_vim):
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    RcManager(tmp_path / "home", dest, dir_mode="link").change_current_to_repo(rc_vim)
+    assert (dest / ".vim").is_symlink()
+    assert (dest / ".vim" / "pack" / "plugin.vim").read_text() == "plugin"
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_dir_mode_files(tmp_path, rc_vim, workers):
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    rcmanager = RcManager(
+        tmp_path / "home",
+        dest,
+        dir_mode="files",
+        exclude=["colors.vim"],
+        workers=workers,
+    )
+    rcmanager.change_current_to_repo(rc_vim)
+    assert not (dest / ".vim").is_symlink()
+    assert (dest / ".vim" / "pack" / "plugin.vim").is_symlink()
+    assert not (dest / ".vim" / "colors.vim").exists()
+    rcmanager.change_current_to_init()
+    assert not (dest / ".vim" / "pack" / "plugin.vim").exists()
+
+
+def test_dir_mode_files_replaces_dir_link(tmp_path, rc_vim):
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    home = tmp_path / "home"
+    RcManager(home, dest, dir_mode="link").change_current_to_repo(rc_vim)
+    RcManager(home, dest, dir_mode="files").change_current_to_repo(rc_vim)
+    assert not (dest / ".vim").is_symlink()
+    assert (dest / ".vim" / "pack" / "plugin.vim").is_symlink()
+    # Files were never written through the old directory link into the repo
+    assert not (rc_vim / "vim" / "pack" / "plugin.vim").is_symlink()
+    assert (rc_vim / "vim" / "pack" / "plugin.vim").read_text() == "plugin"
+
+
+def test_dir_backup_and_reset(tmp_path, rc_vim):
+    dest = tmp_path / "dest"
+    (dest / ".vim" / "after").mkdir(parents=True)
+    (dest / ".vim" / "after" / "mine.vim").write_text("mine")
+    rcmanager = RcManager(tmp_path / "home", dest, dir_mode="link")
+    rcmanager.change_current_to_repo(rc_vim)
+    assert (dest / ".vim").is_symlink()
+    assert (rcmanager.init / "vim" / "after" / "mine.vim").read_text() == "mine"
+    rcmanager.change_current_to_init()
+    assert not (dest / ".vim").is_symlink()
+    assert (dest / ".vim" / "after" / "mine.vim").read_text() == "mine"
@@ -0,0 +1,238 @@
+"""Snapshots of config repos at the commits past generations linked.
+
+Generations link config repos as they are, so once a repo is pulled its old
+commit is no longer in any directory. Rolling back to such a generation
+checks the recorded commit out into `.snapshots` of the rc4me home, through a
+temporary index so that the repo itself is left alone, and switches to that
+snapshot instead.
+
+Stack and render directories link into their repos too. They record the
+repos they were built from next to them, as `<name>.sources`, and each
+generation records the commits of those repos. Rolling back to one whose
+repos moved builds a copy in `.snapshots` with its links into those repos
+pointing at snapshots instead. Snapshots that neither current nor prev uses
+are deleted by `rc4me gc`.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Optional, Set
+
+from rc4me.stack import PRUNE_GRACE
+
+if TYPE_CHECKING:
+    from rc4me.rcmanager import RcManager
+
+logger = logging.getLogger(__name__)
+
+# Bump when the snapshot layout changes so old snapshots are not reused
+SNAPSHOT_VERSION = 1
+# Directories of the home holding configs derived from repos
+DERIVED = (".stacks", ".renders", ".snapshots")
+
+
+def _sources_path(config: Path) -> Path:
+    return config.with_name(f"{config.name}.sources")
+
+
+def write_sources(config: Path, repos: Iterable[Path]) -> None:
+    """Record the repos that a derived config directory links into."""
+    path = _sources_path(config)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text("".join(f"{repo}\n" for repo in repos))
+    os.replace(tmp, path)
+
+
+def source_repos(rcmanager: "RcManager", config: Path) -> Optional[List[Path]]:
+    """Repos that a derived config directory links into.
+
+    Returns:
+        The recorded repos, or None if config is not derived from repos, or
+        was derived before they were recorded.
+    """
+    home = rcmanager.home.resolve()
+    config = config.resolve()
+    if config.parent not in [home / name for name in DERIVED]:
+        return None
+    try:
+        return [Path(line) for line in _sources_path(config).read_text().splitlines()]
+    except FileNotFoundError:
+        return None
+
+
+def _checkout(repo: Path, head: str, out: Path) -> None:
+    """Write the files of commit head of repo to the new directory out."""
+    import git
+
+    index = out.with_name(f"{out.name}.index")
+    env = {"GIT_INDEX_FILE": str(index)}
+    try:
+        r = git.Repo(repo)
+        r.git.read_tree(head, env=env)
+        r.git.checkout_index("--all", f"--prefix={out}{os.sep}", env=env)
+    except (git.GitError, OSError) as e:
+        raise FileNotFoundError(
+            f"Commit {head[:8]} of {repo} is not available: {e}"
+        ) from None
+    finally:
+        if index.exists():
+            index.unlink()
+
+
+def _build(path: Path, build: Callable[[Path], None]) -> None:
+    """Build a snapshot next to path and move it into place."""
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    try:
+        build(tmp)
+        os.rename(tmp, path)
+    except OSError:
+        # Built concurrently; the contents are the same
+        if not path.is_dir():
+            raise
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    # Snapshots hold copies, so they don't depend on any repo
+    write_sources(path, [])
+
+
+def snapshot_repo(rcmanager: "RcManager", repo: Path, head: str) -> Path:
+    """Return a directory holding the files of repo at commit head.
+
+    Raises:
+        FileNotFoundError: If the commit is not in the repo (any more).
+    """
+    snapshots = rcmanager.home / ".snapshots"
+    path = snapshots / f"{repo.name}-{head[:12]}"
+    if path.is_dir():
+        logger.info(f"Reusing snapshot {path.name}")
+        # Marks the snapshot as recently used, see prune_snapshots
+        os.utime(path)
+        return path
+    logger.info(f"Checking out {head[:8]} of {repo.name} into {path.name}")
+    snapshots.mkdir(exist_ok=True)
+    with rcmanager._repo_locked(repo):
+        _build(path, lambda tmp: _checkout(repo, head, tmp))
+    return path
+
+
+def _is_below(path: str, root: str) -> bool:
+    return path == root or path.startswith(f"{root}{os.sep}")
+
+
+def _relink(src: str, out: str, pinned: Dict[str, str], derived: List[str]) -> None:
+    """Copy a derived config directory, pointing its links at snapshots.
+
+    Links are resolved, so that links through other derived directories,
+    which gc may delete, are replaced too: targets in a pinned repo are
+    linked in its snapshot, and files of derived directories are hardlinked.
+    """
+    os.mkdir(out)
+    with os.scandir(src) as it:
+        for entry in it:
+            dst = os.path.join(out, entry.name)
+            if not entry.is_symlink():
+                if entry.is_dir():
+                    _relink(entry.path, dst, pinned, derived)
+                else:
+                    os.link(entry.path, dst)
+                continue
+            real = os.path.realpath(entry.path)
+            repo = next((repo for repo in pinned if _is_below(real, repo)), None)
+            if repo is not None:
+                os.symlink(pinned[repo] + real[len(repo) :], dst)
+            elif not any(_is_below(real, root) for root in derived):
+                os.symlink(real, dst)
+            elif os.path.isdir(real):
+                _relink(real, dst, pinned, derived)
+            else:
+                os.link(real, dst)
+
+
+def pin(
+    rcmanager: "RcManager", config: Path, moved: Dict[str, str], build: bool = True
+) -> Path:
+    """Return a config directory holding what config held at past commits.
+
+    Args:
+        rcmanager: Manager whose home holds the snapshots.
+        config: Config directory of a generation.
+        moved: Commits that repos of the config were at, for those whose
+            HEAD has moved since, keyed on repo path.
+        build: Build the snapshots if they are missing. Otherwise, e.g. when
+            only planning a rollback, it is only checked that the commits
+            are available, and config is returned.
+
+    Raises:
+        FileNotFoundError: If a commit is not in its repo (any more).
+    """
+    if not build:
+        import git
+
+        for repo, head in moved.items():
+            try:
+                git.Repo(repo).git.cat_file("-e", f"{head}^{{commit}}")
+            except (git.GitError, OSError):
+                raise FileNotFoundError(
+                    f"Commit {head[:8]} of {repo} is not available"
+                ) from None
+        return config
+    pinned = {
+        repo: str(snapshot_repo(rcmanager, Path(repo), head))
+        for repo, head in sorted(moved.items())
+    }
+    if str(config) in pinned:
+        return Path(pinned[str(config)])
+    data = json.dumps([SNAPSHOT_VERSION, str(config), sorted(pinned.items())])
+    key = hashlib.sha256(data.encode()).hexdigest()
+    path = rcmanager.home / ".snapshots" / f"{config.name}-{key[:16]}"
+    if path.is_dir():
+        os.utime(path)
+        return path
+    logger.info(f"Relinking {config.name} to snapshots as {path.name}")
+    derived = [str(rcmanager.home.resolve() / name) for name in DERIVED]
+    _build(path, lambda tmp: _relink(str(config), str(tmp), pinned, derived))
+    return path
+
+
+def prune_snapshots(rcmanager: "RcManager", in_use: Set[Path]) -> List[Path]:
+    """Delete the snapshots that are not in use.
+
+    Also deletes the recorded sources of derived directories that are gone,
+    so run it after pruning stacks and renders.
+
+    Args:
+        rcmanager: Manager whose home holds the snapshots.
+        in_use: Resolved config directories that are kept, e.g. current.
+
+    Returns:
+        The deleted snapshots.
+    """
+    snapshots = rcmanager.home / ".snapshots"
+    try:
+        paths = sorted(snapshots.iterdir())
+    except FileNotFoundError:
+        paths = []
+    # Snapshots are made before the home is locked for the switch to them
+    cutoff = time.time() - PRUNE_GRACE
+    removed = []
+    for path in paths:
+        # Hidden entries are snapshots being built
+        if path.name.startswith(".") or not path.is_dir():
+            continue
+        if path.resolve() in in_use or path.stat().st_mtime > cutoff:
+            continue
+        shutil.rmtree(path)
+        removed.append(path)
+    for name in DERIVED:
+        for sources in (rcmanager.home / name).glob("*.sources"):
+            if not sources.with_suffix("").is_dir():
+                sources.unlink()
+    if removed:
+        logger.info(f"Removed {len(removed)} unused snapshots")
+    return removed
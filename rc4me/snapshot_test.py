@@ -0,0 +1,77 @@
+import os
+
+import git
+
+from rc4me.rcmanager import RcManager
+
+
+def _commit(repo, files):
+    for name, text in files.items():
+        (repo / name).parent.mkdir(parents=True, exist_ok=True)
+        (repo / name).write_text(text)
+    r = git.Repo.init(repo, initial_branch="master")
+    r.index.add(list(files))
+    r.index.commit("Update")
+
+
+def test_rollback_restores_stacks(tmp_path, rc1_git, rc2):
+    _commit(rc2, {"bashrc": "bar"})
+    rcmanager = RcManager(tmp_path / "home", tmp_path)
+    rcmanager.change_current_to_stack([rc1_git, rc2])
+    stack = rcmanager.current.resolve()
+    sources = rcmanager.generations.get(1).sources
+    assert sources == {
+        str(rc1_git): git.Repo(rc1_git).head.commit.hexsha,
+        str(rc2): git.Repo(rc2).head.commit.hexsha,
+    }
+    _commit(rc1_git, {"vimrc": "new", "inputrc": "new"})
+    rcmanager.change_current_to_init()
+    rcmanager.rollback(1)
+    assert (tmp_path / ".vimrc").read_text() == "blahblah"
+    assert (tmp_path / ".bashrc").read_text() == "bar"
+    assert not (tmp_path / ".inputrc").exists()
+    # The stack itself still links the repos as they are now
+    assert (stack / "vimrc").read_text() == "new"
+    # Unchanged repos are still linked, changed ones restored from their commit
+    pinned = rcmanager.current.resolve()
+    assert os.readlink(pinned / "bashrc") == str(rc2 / "bashrc")
+    assert os.readlink(pinned / "vimrc").startswith(str(rcmanager.home / ".snapshots"))
+
+
+def test_rollback_restores_renders(tmp_path, rc1_git, monkeypatch):
+    monkeypatch.setenv("RC4ME_EDITOR", "vim")
+    _commit(rc1_git, {"inputrc.tmpl": "# {{ env.RC4ME_EDITOR }}\n", "vim/rc": "old"})
+    rcmanager = RcManager(tmp_path / "home", tmp_path, templates=True, dir_mode="link")
+    rcmanager.change_current_to_repo(rc1_git)
+    _commit(
+        rc1_git, {"inputrc.tmpl": "# new {{ env.RC4ME_EDITOR }}\n", "vim/rc": "new"}
+    )
+    rcmanager.change_current_to_repo(rc1_git)
+    assert (tmp_path / ".inputrc").read_text() == "# new vim\n"
+    assert (tmp_path / ".vim" / "rc").read_text() == "new"
+    rcmanager.rollback(1)
+    assert (tmp_path / ".inputrc").read_text() == "# vim\n"
+    assert (tmp_path / ".vim" / "rc").read_text() == "old"
+
+    # Snapshots are deleted once neither current nor prev uses them
+    rcmanager.rollback(2)
+    rcmanager.change_current_to_init()
+    snapshots = rcmanager.home / ".snapshots"
+    for path in snapshots.iterdir():
+        os.utime(path, (0, 0))
+    rcmanager.gc(keep=3)
+    assert list(snapshots.iterdir()) == []
+    # Generation 1 can still be restored
+    rcmanager.rollback(1)
+    assert (tmp_path / ".vim" / "rc").read_text() == "old"
+
+
+def test_plan_of_rollback_writes_nothing(tmp_path, rc1_git):
+    rcmanager = RcManager(tmp_path / "home", tmp_path)
+    rcmanager.change_current_to_repo(rc1_git)
+    _commit(rc1_git, {"bashrc": "new"})
+    rcmanager.change_current_to_init()
+    planner = RcManager(tmp_path / "home", tmp_path, dry_run=True)
+    assert planner.rollback(1)
+    assert not (rcmanager.home / ".snapshots").exists()
+    assert not (tmp_path / ".bashrc").exists()
@@ -0,0 +1,48 @@
+import git
+
+from rc4me.rcmanager import RcManager
+
+
+def _add_assets(remote, push_commit):
+    git.Repo(remote).git.config("uploadpack.allowFilter", "true")
+    push_commit(remote, "assets/logo.png", "big")
+
+
+def _missing_objects(repo_path):
+    objects = git.Repo(repo_path).git.rev_list("--objects", "--missing=print", "HEAD")
+    return [line for line in objects.splitlines() if line.startswith("?")]
+
+
+def test_sparse_clone_checks_out_top_level_files(tmp_path, rc1_remote, push_commit):
+    _add_assets(rc1_remote, push_commit)
+    rcmanager = RcManager(tmp_path / "home", tmp_path, clone_strategy="sparse")
+    rcmanager.fetch_repo(str(rc1_remote))
+    clone = rcmanager.repo_path
+    assert (clone / "bashrc").read_text() == "foo"
+    assert not (clone / "assets").exists()
+    # The blob of the file that isn't checked out was never downloaded
+    assert len(_missing_objects(clone)) == 1
+
+
+def test_sparse_checkout_follows_link_options(tmp_path, rc1_remote, push_commit):
+    _add_assets(rc1_remote, push_commit)
+    home = tmp_path / "home"
+    RcManager(home, tmp_path, clone_strategy="sparse").fetch_repo(str(rc1_remote))
+    rcmanager = RcManager(home, tmp_path, dir_mode="link", exclude=["vimrc"])
+    rcmanager.fetch_repo(str(rc1_remote))
+    clone = rcmanager.repo_path
+    assert (clone / "assets" / "logo.png").read_text() == "big"
+    assert not (clone / "vimrc").exists()
+    assert _missing_objects(clone) == []
+
+
+def test_sparse_include(tmp_path, rc1_remote, push_commit):
+    _add_assets(rc1_remote, push_commit)
+    rcmanager = RcManager(
+        tmp_path / "home",
+        tmp_path,
+        clone_strategy="sparse",
+        sparse_include=["/assets/"],
+    )
+    rcmanager.fetch_repo(str(rc1_remote))
+    assert (rcmanager.repo_path / "assets" / "logo.png").exists()
@@ -0,0 +1,206 @@
+"""Configs merged from an ordered stack of config repos.
+
+`rc4me apply team/base me/overrides` links the files of both repos, with
+later repos taking precedence: a path in a later repo replaces the same path,
+and any file or directory it overlaps, in earlier ones. Paths matching a
+concat pattern are instead concatenated from every repo that has them, in
+stack order.
+
+The merge is materialized as a stack directory in `.stacks` of the rc4me
+home, holding symlinks into the repos and the concatenated files, and
+`current` is switched to it like to any config repo. Stack directories are
+keyed on the repos' commits and the options that shape the merge, so applying
+an unchanged stack again reuses the directory and its recorded link names.
+Stack directories that no kept generation uses are deleted by `rc4me gc`.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, Optional, Sequence, Set
+
+from rc4me import manifest
+from rc4me.walk import compile_excludes
+
+if TYPE_CHECKING:
+    from rc4me.rcmanager import RcManager
+
+logger = logging.getLogger(__name__)
+
+# Bump when the stack layout changes so old stack directories are not reused
+STACK_VERSION = 1
+# Stacks are built before the home is locked for the switch to them, so stack
+# directories used this recently are never pruned
+PRUNE_GRACE = 3600
+
+
+class Stack(NamedTuple):
+    """A materialized stack directory and the paths linked from it."""
+
+    path: Path
+    names: List[str]
+
+
+def _parents(rel: str) -> List[str]:
+    """Ancestors of a relative path, e.g. ["a", "a/b"] for "a/b/c"."""
+    parts = rel.split("/")
+    return ["/".join(parts[:i]) for i in range(1, len(parts))]
+
+
+def merge(
+    layers: Sequence[Path], names: Sequence[List[str]], concat: Sequence[str] = ()
+) -> Dict[str, List[Path]]:
+    """Resolve the sources of every path of a stack in a single pass.
+
+    Args:
+        layers: Config directories, lowest precedence first.
+        names: Link names of each layer.
+        concat: Glob patterns of paths to concatenate across layers, see
+            `rc4me.walk.compile_excludes`.
+
+    Returns:
+        Map of relative path to its sources: one file, or several to
+        concatenate in order.
+    """
+    is_concat = compile_excludes(concat) if concat else None
+    merged: Dict[str, List[Path]] = {}
+    for layer, layer_names in zip(layers, names):
+        incoming = set(layer_names)
+        ancestors = {parent for rel in layer_names for parent in _parents(rel)}
+        # A path replaces files and directories it overlaps in earlier layers
+        for rel in [rel for rel in merged if rel not in incoming]:
+            if rel in ancestors or any(p in incoming for p in _parents(rel)):
+                del merged[rel]
+        for rel in layer_names:
+            name = rel.rsplit("/", 1)[-1]
+            if rel in merged and is_concat is not None and is_concat(rel, name):
+                merged[rel].append(layer / rel)
+            else:
+                merged[rel] = [layer / rel]
+    return merged
+
+
+def stack_key(
+    rcmanager: "RcManager", layers: Sequence[Path], concat: Sequence[str]
+) -> str:
+    """Hash of everything that determines the contents of a stack directory.
+
+    Layers are identified by their HEAD commit, or by their directory mtime
+    if they are not git repos.
+    """
+    state = []
+    for layer in layers:
+        head = manifest.read_head(layer)
+        state.append([str(layer), head or f"mtime:{layer.stat().st_mtime_ns}"])
+    options = [rcmanager.dir_mode, list(rcmanager.exclude), list(concat)]
+    data = json.dumps([STACK_VERSION, state, options])
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def _concat(path: Path, sources: List[Path]) -> None:
+    """Write the contents of sources to path, each ending in a newline."""
+    with open(path, "wb") as out:
+        for source in sources:
+            data = source.read_bytes()
+            out.write(data)
+            if data and not data.endswith(b"\n"):
+                out.write(b"\n")
+
+
+def _materialize(root: Path, merged: Dict[str, List[Path]]) -> None:
+    """Create a stack directory of symlinks and concatenated files."""
+    root.mkdir(parents=True)
+    for rel, sources in merged.items():
+        path = root / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if len(sources) == 1:
+            path.symlink_to(sources[0])
+        else:
+            _concat(path, sources)
+
+
+def _load_names(path: Path) -> Optional[List[str]]:
+    try:
+        return json.loads(path.read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def build_stack(
+    rcmanager: "RcManager", layers: Sequence[Path], concat: Sequence[str] = ()
+) -> Stack:
+    """Return the stack directory merging layers, building it if needed.
+
+    Args:
+        rcmanager: Manager whose home holds the stack directories and whose
+            options decide which paths of each layer are linked.
+        layers: Config directories, lowest precedence first.
+        concat: Glob patterns of paths to concatenate across layers.
+    """
+    layers = [Path(layer).resolve() for layer in layers]
+    key = stack_key(rcmanager, layers, concat)
+    stacks = rcmanager.home / ".stacks"
+    name = "+".join(layer.name for layer in layers)
+    path = stacks / f"{name}-{key[:16]}"
+    names_path = stacks / f"{path.name}.json"
+    names = _load_names(names_path)
+    if names is not None and path.is_dir():
+        logger.info(f"Reusing stack {path.name}")
+        # Marks the stack as recently used, see prune_stacks
+        os.utime(path)
+        return Stack(path, names)
+    with rcmanager.profiler.span("stack"):
+        merged = merge(layers, [rcmanager._listing(layer) for layer in layers], concat)
+        logger.info(f"Building stack {path.name} of {len(merged)} paths")
+        tmp = stacks / f".{path.name}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        _materialize(tmp, merged)
+        try:
+            os.rename(tmp, path)
+        except OSError:
+            # Built concurrently, or left without its names by an interrupted
+            # run; the contents are the same either way
+            shutil.rmtree(tmp)
+        names = sorted(merged)
+        tmp_names = names_path.with_name(f".{names_path.name}.{os.getpid()}.tmp")
+        tmp_names.write_text(json.dumps(names))
+        os.replace(tmp_names, names_path)
+    return Stack(path, names)
+
+
+def prune_stacks(rcmanager: "RcManager", in_use: Set[Path]) -> List[Path]:
+    """Delete the stack directories that are not in use.
+
+    Args:
+        rcmanager: Manager whose home holds the stack directories.
+        in_use: Resolved config directories that are kept, e.g. those of the
+            kept generations.
+
+    Returns:
+        The deleted stack directories.
+    """
+    stacks = rcmanager.home / ".stacks"
+    try:
+        paths = sorted(stacks.iterdir())
+    except FileNotFoundError:
+        return []
+    cutoff = time.time() - PRUNE_GRACE
+    removed = []
+    for path in paths:
+        # Hidden entries are stacks being built
+        if path.name.startswith(".") or not path.is_dir():
+            continue
+        if path.resolve() in in_use or path.stat().st_mtime > cutoff:
+            continue
+        shutil.rmtree(path)
+        names_path = stacks / f"{path.name}.json"
+        if names_path.exists():
+            names_path.unlink()
+        removed.append(path)
+    if removed:
+        logger.info(f"Removed {len(removed)} unused stacks")
+    return removed
@@ -0,0 +1,79 @@
+import os
+from pathlib import Path
+
+import git
+
+from rc4me.rcmanager import RcManager
+from rc4me.stack import build_stack, merge
+
+
+def test_merge():
+    base, mine = Path("/base"), Path("/mine")
+    merged = merge(
+        [base, mine],
+        [
+            ["bashrc", "vimrc", "vim/colors/a.vim", "config/nvim", "inputrc"],
+            ["bashrc", "vim", "config/nvim/init.lua", "inputrc"],
+        ],
+        concat=["inputrc"],
+    )
+    assert merged == {
+        "bashrc": [mine / "bashrc"],
+        "vimrc": [base / "vimrc"],
+        "vim": [mine / "vim"],
+        "config/nvim/init.lua": [mine / "config/nvim/init.lua"],
+        "inputrc": [base / "inputrc", mine / "inputrc"],
+    }
+
+
+def test_change_current_to_stack(tmp_path, rc1, rc2):
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    rcmanager = RcManager(tmp_path / "home", dest)
+    rcmanager.change_current_to_stack([rc1, rc2])
+    assert (dest / ".bashrc").read_text() == "bar"
+    assert (dest / ".vimrc").read_text() == "blahblah"
+    rcmanager.change_current_to_stack([rc1, rc2], concat=["bashrc"])
+    assert (dest / ".bashrc").read_text() == "foo\nbar\n"
+    rcmanager.change_current_to_prev()
+    assert (dest / ".bashrc").read_text() == "bar"
+
+
+def test_build_stack_is_cached(tmp_path, rc1_git, rc2, monkeypatch):
+    rcmanager = RcManager(tmp_path / "home", tmp_path)
+    stack = build_stack(rcmanager, [rc2, rc1_git])
+    assert stack.names == ["bashrc", "vimrc"]
+
+    def _no_listing(self, repo):
+        raise AssertionError(f"{repo} was listed")
+
+    with monkeypatch.context() as m:
+        m.setattr(RcManager, "link_names", _no_listing)
+        assert build_stack(rcmanager, [rc2, rc1_git]) == stack
+    # A new commit in a layer gives a new stack
+    (rc1_git / "inputrc").write_text("set editing-mode vi")
+    repo = git.Repo(rc1_git)
+    repo.index.add(["inputrc"])
+    repo.index.commit("Add inputrc")
+    new_stack = build_stack(rcmanager, [rc2, rc1_git])
+    assert new_stack.path != stack.path
+    assert new_stack.names == ["bashrc", "inputrc", "vimrc"]
+
+
+def test_gc_prunes_unused_stacks(tmp_path, rc1, rc2):
+    rcmanager = RcManager(tmp_path / "home", tmp_path)
+    rcmanager.change_current_to_stack([rc1, rc2])
+    old = rcmanager.current.resolve()
+    rcmanager.change_current_to_stack([rc1, rc2], concat=["bashrc"])
+    prev = rcmanager.current.resolve()
+    rcmanager.change_current_to_repo(rc1)
+    for stack in (old, prev):
+        os.utime(stack, (0, 0))
+    assert rcmanager.gc(keep=1) == [1, 2]
+    # prev still points at the second stack
+    assert not old.exists()
+    assert not old.with_name(f"{old.name}.json").exists()
+    assert not old.with_name(f"{old.name}.sources").exists()
+    assert prev.is_dir()
+    rcmanager.change_current_to_prev()
+    assert (tmp_path / ".bashrc").read_text() == "foo\nbar\n"
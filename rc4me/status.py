@@ -0,0 +1,239 @@
+"""Check that dest still matches the current config, and repair drift.
+
+Every path the current config links (see `RcManager._generate_link_paths`)
+is checked with a few stat calls, spread over a thread pool:
+
+- missing: nothing is at the path.
+- foreign: something other than rc4me's link is at the path, e.g. a real
+  file, or a link somewhere else.
+- dangling: rc4me's link is there, but the config no longer has the file,
+  or current points at a repo that is gone.
+- modified: a file restored from init (when current is init) was edited.
+
+Copies from init are compared by stat signature first and only hashed if the
+signatures differ, see `rc4me.plan._compare_copy`. Repairing only touches the
+paths that drifted.
+"""
+
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, List, NamedTuple, Optional, Set, Tuple
+
+from rc4me.plan import (
+    COPY,
+    KEEP,
+    SYMLINK,
+    UNLINK,
+    Op,
+    _compare_copy,
+    _plan_parents,
+    _plan_replace,
+    links_to,
+)
+
+if TYPE_CHECKING:
+    from rc4me.rcmanager import RcManager
+
+logger = logging.getLogger(__name__)
+
+MISSING = "missing"
+FOREIGN = "foreign"
+DANGLING = "dangling"
+MODIFIED = "modified"
+# Paths checked per task, so the pool isn't dominated by task overhead
+_BATCH = 256
+
+
+class Drift(NamedTuple):
+    """A destination path that does not match the current config.
+
+    Attributes:
+        kind: One of MISSING, FOREIGN, DANGLING or MODIFIED.
+        path: Path in dest.
+        source: Path under current that path should link to or copy.
+    """
+
+    kind: str
+    path: Path
+    source: Path
+
+    def __str__(self) -> str:
+        return f"{self.kind:<9}{self.path}"
+
+
+class Status(NamedTuple):
+    """Outcome of checking dest against the current config.
+
+    Attributes:
+        repo: Config directory current points at.
+        checked: Number of destination paths checked.
+        drifts: Paths that do not match, in path order.
+        seconds: Wall time of the check.
+        current_missing: Whether current points at a directory that is gone.
+    """
+
+    repo: Path
+    checked: int
+    drifts: List[Drift]
+    seconds: float
+    current_missing: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return not self.drifts and not self.current_missing
+
+    def __str__(self) -> str:
+        state = "ok" if self.ok else f"{len(self.drifts)} drifted"
+        if self.current_missing:
+            state += f", current points at missing {self.repo}"
+        return (
+            f"checked {self.checked} entries of {self.repo.name} in "
+            f"{self.seconds * 1e3:.1f}ms: {state}"
+        )
+
+
+def _check_link(rcmanager: "RcManager", link: Path, source: Path) -> Optional[str]:
+    """Kind of drift of a path that should link to source, if any."""
+    if links_to(link, source):
+        # The link is rc4me's, check that it leads somewhere
+        return None if os.path.exists(link) else DANGLING
+    if not os.path.exists(source):
+        # Deleted from the config since it was listed, so no longer expected
+        return None
+    return FOREIGN if os.path.lexists(link) else MISSING
+
+
+def _check_copy(rcmanager: "RcManager", link: Path, source: Path) -> Optional[str]:
+    """Kind of drift of a path that should hold a copy from init, if any."""
+    if link.is_symlink() or link.is_dir():
+        return FOREIGN
+    if not link.exists():
+        return MISSING
+    rel = source.relative_to(rcmanager.current).as_posix()
+    if _compare_copy(rcmanager, link, rcmanager.init / rel, rel) is None:
+        return MODIFIED
+    return None
+
+
+def _check_batch(
+    rcmanager: "RcManager", entries: List[Tuple[Path, Path]], is_init: bool
+) -> List[Drift]:
+    check = _check_copy if is_init else _check_link
+    drifts = []
+    for link, source in entries:
+        kind = check(rcmanager, link, source)
+        if kind is not None:
+            drifts.append(Drift(kind, link, source))
+    return drifts
+
+
+def _expected(
+    rcmanager: "RcManager", repo: Path
+) -> Tuple[List[Tuple[Path, Path]], List[Tuple[Path, Path]]]:
+    """Link and source paths that dest should hold, and that it held before.
+
+    Returns:
+        The entries current lists now, and the other entries that were
+        linked when switching to it, e.g. files since deleted from the config.
+    """
+    recorded = rcmanager._recorded_names(repo)
+    linked = set(recorded[1]) if recorded else set()
+    entries = list(rcmanager._generate_link_paths()) if repo.is_dir() else []
+    current = rcmanager.current
+    # Slicing the strings, which links_to needs anyway, beats relative_to
+    start = len(str(current)) + 1
+    linked -= {str(source)[start:] for _, source in entries}
+    previous = [(rcmanager.dest / f".{rel}", current / rel) for rel in sorted(linked)]
+    return entries, previous
+
+
+def check_status(rcmanager: "RcManager", workers: int = 8) -> Status:
+    """Compare dest with the links of the current config.
+
+    Args:
+        rcmanager: Manager of the rc4me home and dest to check.
+        workers: Threads that make the stat calls.
+    """
+    with rcmanager.profiler.span("status"):
+        return _check_status(rcmanager, workers)
+
+
+def _check_status(rcmanager: "RcManager", workers: int) -> Status:
+    start = time.perf_counter()
+    repo = rcmanager.current.resolve()
+    current_missing = not repo.is_dir()
+    entries, previous = _expected(rcmanager, repo)
+    is_init = not current_missing and rcmanager._current_is_init()
+    # Links from before only matter if they are left dangling
+    previous_links = {link for link, _ in previous}
+    entries += previous
+    batches = [entries[i : i + _BATCH] for i in range(0, len(entries), _BATCH)]
+    if workers > 1 and len(batches) > 1:
+        with ThreadPoolExecutor(min(workers, len(batches))) as pool:
+            results = list(
+                pool.map(lambda b: _check_batch(rcmanager, b, is_init), batches)
+            )
+    else:
+        results = [_check_batch(rcmanager, b, is_init) for b in batches]
+    drifts = sorted(
+        (
+            drift
+            for batch in results
+            for drift in batch
+            if drift.kind == DANGLING or drift.path not in previous_links
+        ),
+        key=lambda d: d.path,
+    )
+    seconds = time.perf_counter() - start
+    return Status(repo, len(entries), drifts, seconds, current_missing)
+
+
+def plan_repair(rcmanager: "RcManager", drifts: List[Drift]) -> List[Op]:
+    """Operations that fix the given drift and nothing else.
+
+    Missing paths are linked (or copied), foreign ones are backed up to init
+    and replaced, dangling links are removed and modified copies are kept in
+    the backup store, then copied again from init.
+    """
+    is_init = rcmanager._current_is_init()
+    ops = []
+    creates = []
+    parents: Set[Path] = set()
+    removed: Set[Path] = set()
+    for drift in drifts:
+        if drift.kind == DANGLING:
+            ops.append(Op(UNLINK, drift.path))
+            removed.add(drift.path)
+            continue
+        # Also replaces a top-level directory that is a link into a repo
+        top = _plan_parents(rcmanager, drift.path, parents, removed, ops)
+        rel = drift.source.relative_to(rcmanager.current).as_posix()
+        if drift.kind == FOREIGN and top not in removed:
+            ops.extend(_plan_replace(drift.path, rcmanager.init / rel, True))
+        elif drift.kind == MODIFIED:
+            # The edits are the user's own, keep them restorable
+            ops.append(Op(KEEP, rcmanager.init / rel, drift.path))
+        creates.append(Op(COPY if is_init else SYMLINK, drift.path, drift.source))
+    return ops + creates
+
+
+def repair(rcmanager: "RcManager", status: Status) -> List[Op]:
+    """Fix the drift found by `check_status`, unless dry_run is set.
+
+    Raises:
+        FileNotFoundError: If current points at a missing repo; switch to
+            another config instead.
+    """
+    if status.current_missing:
+        raise FileNotFoundError(
+            f"current points at missing {status.repo}, "
+            "use rc4me rollback or rc4me reset instead"
+        )
+    ops = plan_repair(rcmanager, status.drifts)
+    if not rcmanager.dry_run and ops:
+        with rcmanager._locked():
+            rcmanager._set_repo_files(ops)
+    return ops
@@ -0,0 +1,76 @@
+import shutil
+
+import pytest
+
+from rc4me.rcmanager import RcManager
+from rc4me.status import DANGLING, FOREIGN, MISSING, MODIFIED, check_status, repair
+
+
+def _kinds(status):
+    return {drift.path.name: drift.kind for drift in status.drifts}
+
+
+def test_status_and_repair(tmp_path, rc1):
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    (rc1 / "inputrc").write_text("set editing-mode vi")
+    (rc1 / "gitconfig").write_text("[user]")
+    rcmanager = RcManager(tmp_path / "home", dest)
+    rcmanager.change_current_to_repo(rc1)
+    assert check_status(rcmanager).ok
+
+    (dest / ".bashrc").unlink()
+    (dest / ".vimrc").unlink()
+    (dest / ".vimrc").write_text("mine")
+    (rc1 / "inputrc").unlink()
+    status = check_status(rcmanager, workers=1)
+    assert _kinds(status) == {
+        ".bashrc": MISSING,
+        ".inputrc": DANGLING,
+        ".vimrc": FOREIGN,
+    }
+    assert status.checked == 4
+    assert not status.ok
+
+    ops = repair(rcmanager, status)
+    assert len(ops) == 5
+    assert (dest / ".bashrc").read_text() == "foo"
+    assert (dest / ".vimrc").read_text() == "blahblah"
+    assert not (dest / ".inputrc").is_symlink()
+    # The replaced file was kept in init
+    assert (rcmanager.init / "vimrc").read_text() == "mine"
+    assert check_status(rcmanager).ok
+
+
+def test_status_of_init_copies(tmp_path, rc1, startingfiles):
+    dest = startingfiles
+    rcmanager = RcManager(tmp_path / "home", dest)
+    (dest / ".bashrc").write_text("hello")
+    rcmanager.change_current_to_repo(rc1)
+    rcmanager.change_current_to_init()
+    assert check_status(rcmanager).ok
+    (dest / ".bashrc").write_text("edited")
+    status = check_status(rcmanager)
+    assert _kinds(status) == {".bashrc": MODIFIED}
+    ops = repair(rcmanager, status)
+    assert [op.action for op in ops] == ["keep", "copy"]
+    assert (dest / ".bashrc").read_text() == "hello"
+    # The edit was kept in the store, without changing init
+    assert (rcmanager.init / "bashrc").read_text() == "hello"
+    restored = tmp_path / "restored"
+    rcmanager.store.restore("bashrc", restored, -2)
+    assert restored.read_text() == "edited"
+    assert check_status(rcmanager).ok
+
+
+def test_status_of_missing_repo(tmp_path, rc1):
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    rcmanager = RcManager(tmp_path / "home", dest)
+    rcmanager.change_current_to_repo(rc1)
+    shutil.rmtree(rc1)
+    status = check_status(rcmanager)
+    assert status.current_missing
+    assert set(_kinds(status).values()) == {DANGLING}
+    with pytest.raises(FileNotFoundError, match="rollback"):
+        repair(rcmanager, status)
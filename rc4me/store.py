@@ -0,0 +1,200 @@
+"""Content-addressed, deduplicated store for files backed up into init.
+
+Every backed-up file is stored once as a blob named by its SHA-256 hash, and
+the entry in init is a hardlink to that blob. An index maps each path in init
+to its backup generations, so backing up the same content again costs no
+copy, and earlier generations can still be restored.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+from rc4me.fastcopy import copy_file
+
+logger = logging.getLogger(__name__)
+
+_CHUNK_SIZE = 1 << 20
+
+
+class Generation(NamedTuple):
+    """A single backup of a file.
+
+    Attributes:
+        digest: SHA-256 hex digest of the file contents.
+        size: File size in bytes.
+        mtime_ns: Modification time of the backed-up file.
+        time: When the backup was made, in seconds since the epoch.
+    """
+
+    digest: str
+    size: int
+    mtime_ns: int
+    time: float
+
+
+def hash_file(path: Path) -> str:
+    """Return the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BlobStore:
+    """Blobs and backup index kept in a directory of the rc4me home."""
+
+    def __init__(self, root: Path):
+        """Initialize paths to the blobs and index.
+
+        Args:
+            root: Directory holding the store, e.g. `~/.rc4me/.store`.
+        """
+        self.root = root
+        self.blobs = root / "blobs"
+        self.index_path = root / "index.json"
+        self._index: Optional[Dict[str, List[Generation]]] = None
+
+    @property
+    def index(self) -> Dict[str, List[Generation]]:
+        """Map of path in init to its backup generations, oldest first."""
+        if self._index is None:
+            try:
+                data = json.loads(self.index_path.read_text())
+            except FileNotFoundError:
+                data = {}
+            self._index = {
+                rel: [Generation(*gen) for gen in gens] for rel, gens in data.items()
+            }
+        return self._index
+
+    def digest(self, rel: str, size: int, mtime_ns: int) -> Optional[str]:
+        """Digest of the latest generation of rel if it matches size and mtime.
+
+        Entries in init are hardlinks to their blobs, so an unmodified entry
+        has the size and mtime recorded for its latest generation.
+        """
+        gens = self.index.get(rel)
+        if gens and (gens[-1].size, gens[-1].mtime_ns) == (size, mtime_ns):
+            return gens[-1].digest
+        return None
+
+    def blob_path(self, digest: str) -> Path:
+        """Path of the blob holding the content with the given digest."""
+        return self.blobs / digest[:2] / digest[2:]
+
+    def _ingest(self, path: Path, digest: str) -> Path:
+        """Add a file to the store if its content isn't there yet."""
+        blob = self.blob_path(digest)
+        if blob.exists():
+            return blob
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        # Copy rather than hardlink the file, so later writes to it can never
+        # change a blob. Reflinks make this free where the filesystem allows.
+        tmp = blob.with_name(f".{blob.name}.tmp")
+        copy_file(path, tmp)
+        os.replace(tmp, blob)
+        return blob
+
+    def backup(self, path: Path, backup_path: Path, rel: str) -> str:
+        """Back up a file into the store and link it into init.
+
+        The file is only hashed if its size or mtime differ from the latest
+        generation already stored for rel.
+
+        Args:
+            path: File to back up.
+            backup_path: Entry in init that will hardlink to the blob.
+            rel: Key of the entry in the index, its path relative to init.
+
+        Returns:
+            The digest of the backed-up content.
+        """
+        st = os.stat(path)
+        digest = self.digest(rel, st.st_size, st.st_mtime_ns)
+        gens = self.index.setdefault(rel, [])
+        if digest is None:
+            digest = hash_file(path)
+            gen = Generation(digest, st.st_size, st.st_mtime_ns, time.time())
+            if not gens or gens[-1].digest != digest:
+                gens.append(gen)
+        blob = self._ingest(path, digest)
+        self._link(blob, backup_path)
+        return digest
+
+    def keep(self, path: Path, backup_path: Path, rel: str) -> str:
+        """Store a file that is about to be replaced by the entry of rel in init.
+
+        The file is recorded as a generation of rel followed by the latest
+        generation again, so the entry in init still matches the latest
+        generation and the file can be restored with `restore(rel, path, -2)`.
+
+        Args:
+            path: File to keep.
+            backup_path: Entry of rel in init, which is left as it is.
+            rel: Key of the entry in the index, its path relative to init.
+
+        Returns:
+            The digest of the kept content.
+        """
+        gens = self.index.setdefault(rel, [])
+        if not gens:
+            st = os.stat(backup_path)
+            digest = hash_file(backup_path)
+            gens.append(Generation(digest, st.st_size, st.st_mtime_ns, time.time()))
+        st = os.stat(path)
+        digest = hash_file(path)
+        self._ingest(path, digest)
+        now = time.time()
+        gens.append(Generation(digest, st.st_size, st.st_mtime_ns, now))
+        gens.append(gens[-2]._replace(time=now))
+        return digest
+
+    @staticmethod
+    def _link(blob: Path, path: Path) -> None:
+        """Replace path with a hardlink to blob (or a copy across devices)."""
+        try:
+            if os.path.samefile(blob, path):
+                # Renaming a link over another link to the same file is a
+                # no-op that would leave the temporary link behind
+                return
+        except FileNotFoundError:
+            pass
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.tmp")
+        if tmp.exists():
+            tmp.unlink()
+        try:
+            os.link(blob, tmp)
+        except OSError:
+            copy_file(blob, tmp)
+        os.replace(tmp, path)
+
+    def restore(self, rel: str, path: Path, generation: int = -1) -> Generation:
+        """Copy a stored generation of rel to path, without hashing it.
+
+        Args:
+            rel: Key of the entry in the index.
+            path: File to write.
+            generation: Index into the generations of rel, latest by default.
+
+        Returns:
+            The restored generation.
+        """
+        gen = self.index[rel][generation]
+        copy_file(self.blob_path(gen.digest), path)
+        return gen
+
+    def save(self) -> None:
+        """Persist the index if it has been loaded."""
+        if self._index is None:
+            return
+        self.root.mkdir(exist_ok=True)
+        tmp = self.index_path.with_name(f".{self.index_path.name}.tmp")
+        tmp.write_text(json.dumps(self._index))
+        os.replace(tmp, self.index_path)
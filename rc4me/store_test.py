@@ -0,0 +1,52 @@
+import os
+
+import pytest
+
+from rc4me import store
+from rc4me.store import BlobStore
+
+
+def test_backup_dedupes_and_links_into_init(tmp_path):
+    blob_store = BlobStore(tmp_path / ".store")
+    init = tmp_path / "init"
+    for name in ["a", "b"]:
+        (tmp_path / name).write_text("same")
+        blob_store.backup(tmp_path / name, init / name, name)
+    blobs = [p for p in blob_store.blobs.rglob("*") if p.is_file()]
+    assert len(blobs) == 1
+    assert os.stat(init / "a").st_ino == os.stat(blobs[0]).st_ino
+    assert (init / "b").read_text() == "same"
+
+
+def test_backup_generations(tmp_path, monkeypatch):
+    blob_store = BlobStore(tmp_path / ".store")
+    rc = tmp_path / "bashrc"
+    backup = tmp_path / "init" / "bashrc"
+    rc.write_text("one")
+    first_digest = blob_store.backup(rc, backup, "bashrc")
+    rc.write_text("two!")
+    blob_store.backup(rc, backup, "bashrc")
+    blob_store.save()
+
+    reloaded = BlobStore(tmp_path / ".store")
+    assert [gen.digest for gen in reloaded.index["bashrc"]] == [
+        first_digest,
+        store.hash_file(rc),
+    ]
+    # Backing up unchanged content again needs no hashing and adds nothing
+    monkeypatch.setattr(store, "hash_file", pytest.fail)
+    reloaded.backup(rc, backup, "bashrc")
+    assert len(reloaded.index["bashrc"]) == 2
+
+    restored = tmp_path / "restored"
+    reloaded.restore("bashrc", restored, generation=0)
+    assert restored.read_text() == "one"
+
+
+def test_backup_same_content_twice(tmp_path):
+    blob_store = BlobStore(tmp_path / ".store")
+    init = tmp_path / "init"
+    (tmp_path / "a").write_text("same")
+    blob_store.backup(tmp_path / "a", init / "a", "a")
+    blob_store.backup(tmp_path / "a", init / "a", "a")
+    assert sorted(p.name for p in init.iterdir()) == ["a"]
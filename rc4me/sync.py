@@ -0,0 +1,79 @@
+"""Fetch every cached rc repo concurrently."""
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, NamedTuple, Optional
+
+from rc4me.rcmanager import RcManager
+
+logger = logging.getLogger(__name__)
+
+
+class SyncResult(NamedTuple):
+    """Outcome of syncing a single repo.
+
+    Attributes:
+        name: Repo name in the rc4me home directory.
+        seconds: Wall time spent fetching (and pulling).
+        behind: Number of commits the repo was behind origin.
+        pulled: Whether new commits were pulled.
+        error: Error message if the sync failed, otherwise None.
+    """
+
+    name: str
+    seconds: float
+    behind: int = 0
+    pulled: bool = False
+    error: Optional[str] = None
+
+    def __str__(self) -> str:
+        if self.error is not None:
+            status = f"failed: {self.error}"
+        elif self.pulled:
+            status = f"pulled {self.behind} commit(s)"
+        elif self.behind:
+            status = f"{self.behind} commit(s) behind"
+        else:
+            status = "up to date"
+        return f"{self.name:<32} {self.seconds:>7.2f}s  {status}"
+
+
+def _sync_one(rcmanager: RcManager, repo_path: Path, pull: bool) -> SyncResult:
+    """Fetch a single repo, catching errors so other repos still sync."""
+    start = time.perf_counter()
+    try:
+        # Sync always asks the remotes, so a pull isn't skipped after a fetch
+        behind, pulled = rcmanager.refresh_repo(repo_path, lambda: pull, ttl=0)
+    except Exception as e:
+        # Report any failure per repo rather than aborting the whole sync
+        logger.debug(f"Failed to sync {repo_path}", exc_info=True)
+        return SyncResult(repo_path.name, time.perf_counter() - start, error=str(e))
+    return SyncResult(repo_path.name, time.perf_counter() - start, behind, pulled)
+
+
+def sync_repos(rcmanager: RcManager, pull: bool, workers: int = 8) -> List[SyncResult]:
+    """Fetch all cached git repos in the rc4me home with a bounded pool.
+
+    Each repo is refreshed under its lock, as `RcManager.fetch_repo` does, so
+    a sync never fetches into a repo that is being cloned or replaced.
+
+    Args:
+        rcmanager: Manager holding the rc4me home directory.
+        pull: Pull new commits into repos that are behind origin. Otherwise
+            repos are only fetched and their delta reported.
+        workers: Maximum number of repos fetched at once.
+
+    Returns:
+        One result per repo, sorted by repo name.
+    """
+    repos = [
+        path
+        for _, path in sorted(rcmanager.get_rc_repos().items())
+        if (path / ".git").exists()
+    ]
+    if not repos:
+        return []
+    with ThreadPoolExecutor(min(workers, len(repos))) as pool:
+        return list(pool.map(lambda path: _sync_one(rcmanager, path, pull), repos))
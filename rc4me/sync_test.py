@@ -0,0 +1,59 @@
+import threading
+import time
+
+import git
+
+from rc4me.rcmanager import REMOTE_REF, RcManager
+from rc4me.sync import sync_repos
+
+
+def test_sync_repos(tmp_path, rc1_remote, push_commit):
+    rcmanager = RcManager(tmp_path / "home", tmp_path)
+    rcmanager.fetch_repo(str(rc1_remote))
+    clone = rcmanager.repo_path
+    push_commit(rc1_remote, "bashrc", "new")
+    push_commit(rc1_remote, "inputrc", "new")
+
+    results = sync_repos(rcmanager, pull=False)
+    # init is not a git repo and isn't synced
+    assert [(r.name, r.behind, r.pulled, r.error) for r in results] == [
+        ("rc1.git", 2, False, None)
+    ]
+    assert not (clone / "inputrc").exists()
+
+    results = sync_repos(rcmanager, pull=True)
+    assert [(r.behind, r.pulled) for r in results] == [(2, True)]
+    assert (clone / "inputrc").read_text() == "new"
+    assert [(r.behind, r.pulled) for r in sync_repos(rcmanager, pull=True)] == [
+        (0, False)
+    ]
+
+
+def test_sync_reports_errors_per_repo(tmp_path, rc1_remote):
+    rcmanager = RcManager(tmp_path / "home", tmp_path)
+    rcmanager.fetch_repo(str(rc1_remote))
+    git.Repo(rcmanager.repo_path).remote("origin").set_url(str(tmp_path / "missing"))
+    (result,) = sync_repos(rcmanager, pull=True)
+    assert result.error is not None
+    assert "failed" in str(result)
+
+
+def test_sync_waits_for_the_repo_lock(tmp_path, rc1_remote, push_commit):
+    rcmanager = RcManager(tmp_path / "home", tmp_path, fetch_ttl=3600)
+    rcmanager.fetch_repo(str(rc1_remote))
+    clone = rcmanager.repo_path
+    push_commit(rc1_remote, "bashrc", "new")
+    results = []
+    # An apply or bundle import of the repo holds its lock
+    with rcmanager._repo_locked(clone):
+        thread = threading.Thread(
+            target=lambda: results.extend(sync_repos(rcmanager, pull=True))
+        )
+        thread.start()
+        time.sleep(0.2)
+        assert not results
+    thread.join()
+    # Synced despite the TTL, and recorded in the fetch cache as fetch_repo does
+    assert [(r.behind, r.pulled, r.error) for r in results] == [(1, True, None)]
+    assert (clone / "bashrc").read_text() == "new"
+    assert rcmanager.fetch_cache.is_fresh(clone, REMOTE_REF, 3600)
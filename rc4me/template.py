@@ -0,0 +1,431 @@
+"""Config files rendered for each host from templates.
+
+With templates turned on (`rc4me --templates`, or RC4ME_TEMPLATES=1), a
+file of a config repo whose name ends in `.tmpl`, e.g. `bashrc.tmpl`, is
+rendered with facts about the host and linked without the suffix, as
+`~/.bashrc`, replacing any `bashrc` of the repo. Otherwise it is linked as it
+is. `{{ name }}` is replaced by a fact, and lines holding only an `{% if %}`
+tag keep or drop the lines up to the matching `{% elif %}`, `{% else %}` or
+`{% endif %}`:
+
+    export EDITOR={{ env.EDITOR }}
+    {% if os == "darwin" %}
+    alias ls="ls -G"
+    {% elif hostname != "build" %}
+    alias ls="ls --color=auto"
+    {% endif %}
+
+The facts are `hostname`, `os`, `arch` and `user`, and `env.NAME` for every
+environment variable (empty if it is unset). Bare conditions such as
+`{% if env.TMUX %}` hold if the fact is not empty.
+
+Each render is stored in `.renders/blobs` of the rc4me home, named by a hash
+of the template and of the values of just the facts it uses, and is only
+rendered again when either changes. The facts a template uses are recorded
+when it is first parsed, by template hash, and template hashes are cached by
+stat signature, so applying an unchanged config again renders and parses
+nothing. As with `rc4me.stack`, the config is then materialized as a render
+directory in `.renders`, holding links to the repo's other files and to the
+renders, and `current` is switched to it; each generation keeps the render
+directory it applied. Render directories that no kept generation uses, and
+renders that no remaining render directory links, are deleted by `rc4me gc`.
+"""
+
+import getpass
+import hashlib
+import json
+import logging
+import os
+import platform
+import re
+import shutil
+import socket
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Set, Tuple, Union
+
+from rc4me.stack import _materialize
+from rc4me.store import hash_file
+
+if TYPE_CHECKING:
+    from rc4me.rcmanager import RcManager
+
+logger = logging.getLogger(__name__)
+
+# Bump when the template syntax or render layout changes so renders are redone
+RENDER_VERSION = 1
+SUFFIX = ".tmpl"
+
+_FACT = re.compile(r"{{\s*([\w.-]+)\s*}}")
+_TAG = re.compile(r"^\s*{%\s*(\w+)\s*(.*?)\s*%}\s*$")
+_CONDITION = re.compile(r'^([\w.-]+)(?:\s*(==|!=)\s*"([^"]*)")?$')
+
+# (fact, operator, value) of an if tag; operator and value are None for a
+# bare fact. None stands for an else branch.
+_Condition = Optional[Tuple[str, Optional[str], Optional[str]]]
+# Parsed lines: plain text, text split around facts (facts at odd indices),
+# or an if block as a list of (condition, lines) branches
+_Node = Union[str, Tuple[str, ...], List[Tuple[_Condition, list]]]
+
+
+class Template:
+    """A template parsed into its lines, facts and if blocks.
+
+    Attributes:
+        name: Name of the template in error messages.
+        facts: Names of the facts the template uses.
+    """
+
+    def __init__(self, text: str, name: str = "<template>"):
+        """Parse a template.
+
+        Raises:
+            ValueError: If a tag is malformed or an if block is not closed.
+        """
+        self.name = name
+        self.facts: Set[str] = set()
+        self._lines: List[_Node] = []
+        # Branches of the open if blocks, innermost last
+        self._open: List[List[Tuple[_Condition, list]]] = []
+        lineno = 0
+        for lineno, line in enumerate(text.splitlines(keepends=True), 1):
+            tag = _TAG.match(line) if "{%" in line else None
+            if tag is not None:
+                self._parse_tag(*tag.groups(), lineno)
+            elif "{{" in line:
+                parts = _FACT.split(line)
+                self.facts.update(parts[1::2])
+                self._body().append(tuple(parts))
+            else:
+                self._body().append(line)
+        if self._open:
+            raise self._error(lineno, "if without endif")
+
+    def _error(self, lineno: int, message: str) -> ValueError:
+        return ValueError(f"{self.name}:{lineno}: {message}")
+
+    def _body(self) -> list:
+        """Lines that parsed lines are added to, those of the open branch."""
+        return self._open[-1][-1][1] if self._open else self._lines
+
+    def _condition(self, text: str, lineno: int) -> _Condition:
+        match = _CONDITION.match(text)
+        if match is None:
+            raise self._error(lineno, f"invalid condition {text!r}")
+        self.facts.add(match.group(1))
+        return match.group(1), match.group(2), match.group(3)
+
+    def _parse_tag(self, word: str, rest: str, lineno: int) -> None:
+        if word == "if":
+            branches = [(self._condition(rest, lineno), [])]
+            self._body().append(branches)
+            self._open.append(branches)
+            return
+        if word not in ("elif", "else", "endif"):
+            raise self._error(lineno, f"unknown tag {word!r}")
+        if not self._open:
+            raise self._error(lineno, f"{word} without if")
+        if word != "elif" and rest:
+            raise self._error(lineno, f"{word} takes no condition")
+        branches = self._open[-1]
+        if word == "endif":
+            self._open.pop()
+        elif branches[-1][0] is None:
+            raise self._error(lineno, f"{word} after else")
+        else:
+            condition = self._condition(rest, lineno) if word == "elif" else None
+            branches.append((condition, []))
+
+    def render(self, facts: Dict[str, str]) -> str:
+        """Render the template with the values of (at least) its facts."""
+        out: List[str] = []
+        _render(self._lines, facts, out)
+        return "".join(out)
+
+
+def _holds(condition: _Condition, facts: Dict[str, str]) -> bool:
+    if condition is None:
+        return True
+    fact, operator, value = condition
+    if operator is None:
+        return bool(facts[fact])
+    return (facts[fact] == value) == (operator == "==")
+
+
+def _render(lines: List[_Node], facts: Dict[str, str], out: List[str]) -> None:
+    for node in lines:
+        if isinstance(node, str):
+            out.append(node)
+        elif isinstance(node, tuple):
+            for i, part in enumerate(node):
+                out.append(facts[part] if i % 2 else part)
+        else:
+            for condition, branch in node:
+                if _holds(condition, facts):
+                    _render(branch, facts, out)
+                    break
+
+
+def _user() -> str:
+    try:
+        return getpass.getuser()
+    except (KeyError, OSError):
+        # No login name, e.g. in containers running as an unnamed uid
+        return str(os.getuid()) if hasattr(os, "getuid") else ""
+
+
+def host_facts(overrides: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """Facts about this host that templates can use.
+
+    Args:
+        overrides: Facts that replace or add to those of the host.
+    """
+    facts = {
+        "hostname": socket.gethostname(),
+        "os": platform.system().lower(),
+        "arch": platform.machine(),
+        "user": _user(),
+    }
+    facts.update((f"env.{name}", value) for name, value in os.environ.items())
+    if overrides:
+        facts.update(overrides)
+    return facts
+
+
+def fact_values(names: List[str], facts: Dict[str, str], template: str):
+    """Values of the facts a template uses.
+
+    Raises:
+        ValueError: If the template uses a fact that is not defined.
+    """
+    values = {}
+    for name in names:
+        if name in facts:
+            values[name] = facts[name]
+        elif name.startswith("env."):
+            values[name] = ""
+        else:
+            raise ValueError(f"{template}: unknown fact {name!r}")
+    return values
+
+
+class RenderCache:
+    """Renders of templates in `.renders/blobs`, and what is known of them."""
+
+    def __init__(self, root: Path):
+        """Initialize paths to the renders and index.
+
+        Args:
+            root: Directory holding the renders, e.g. `~/.rc4me/.renders`.
+        """
+        self.root = root
+        self.blobs = root / "blobs"
+        self.index_path = root / "index.json"
+        self._index: Optional[Dict[str, dict]] = None
+        self._changed = False
+
+    @property
+    def index(self) -> Dict[str, dict]:
+        """Digest of each template by path, with the stat signature it was
+        hashed at, and the facts used by each template digest."""
+        if self._index is None:
+            try:
+                data = json.loads(self.index_path.read_text())
+            except (FileNotFoundError, ValueError):
+                data = {}
+            if data.get("version") != RENDER_VERSION:
+                data = {"version": RENDER_VERSION, "digests": {}, "facts": {}}
+            self._index = data
+        return self._index
+
+    def _digest(self, path: Path, st: os.stat_result) -> str:
+        """Digest of a template, only hashing it if its stat signature changed."""
+        signature = [st.st_size, st.st_mtime_ns]
+        known = self.index["digests"].get(str(path))
+        if known is not None and known[:2] == signature:
+            return known[2]
+        digest = hash_file(path)
+        self.index["digests"][str(path)] = signature + [digest]
+        self._changed = True
+        return digest
+
+    def render(
+        self, path: Path, facts: Dict[str, str], write: bool = True
+    ) -> Tuple[Path, bool]:
+        """Render a template, unless it was already rendered with these facts.
+
+        Args:
+            path: Template file.
+            facts: Facts of the host, see `host_facts`.
+            write: Write the render if it is missing. Otherwise only its path
+                is computed, and nothing is written.
+
+        Returns:
+            The render, and whether it had to be rendered.
+
+        Raises:
+            ValueError: If the template is invalid or uses an unknown fact.
+        """
+        st = os.stat(path)
+        digest = self._digest(path, st)
+        template = None
+        names = self.index["facts"].get(digest)
+        if names is None:
+            template = Template(path.read_text(), path.name)
+            names = self.index["facts"][digest] = sorted(template.facts)
+            self._changed = True
+        values = fact_values(names, facts, path.name)
+        mode = st.st_mode & 0o777
+        data = json.dumps([RENDER_VERSION, digest, values, mode], sort_keys=True)
+        key = hashlib.sha256(data.encode()).hexdigest()
+        blob = self.blobs / key[:2] / key[2:]
+        if not write or blob.exists():
+            return blob, False
+        if template is None:
+            template = Template(path.read_text(), path.name)
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        tmp = blob.with_name(f".{blob.name}.{os.getpid()}.tmp")
+        tmp.write_text(template.render(values))
+        os.chmod(tmp, mode)
+        os.replace(tmp, blob)
+        return blob, True
+
+    def save(self) -> None:
+        """Persist the index if anything was added to it."""
+        if not self._changed:
+            return
+        self.root.mkdir(exist_ok=True)
+        tmp = self.index_path.with_name(f".{self.index_path.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(self._index))
+        os.replace(tmp, self.index_path)
+        self._changed = False
+
+
+def render_templates(
+    rcmanager: "RcManager", repo: Path, names: List[str], build: bool = True
+) -> Tuple[Path, List[str]]:
+    """Return the render directory of a config, building it if needed.
+
+    Args:
+        rcmanager: Manager whose home holds the renders and whose `facts`
+            override those of the host.
+        repo: Config directory.
+        names: Link names of repo.
+        build: Render the templates and build the render directory if they
+            are missing. Otherwise, e.g. when only planning a switch, the
+            templates are still checked but nothing is written to the home,
+            and the returned directory may not exist.
+
+    Returns:
+        The render directory and its link names, or repo and names as they
+        are if the config has no templates.
+
+    Raises:
+        ValueError: If a template is invalid or uses an unknown fact.
+    """
+    if not any(rel.endswith(SUFFIX) for rel in names):
+        return repo, names
+    with rcmanager.profiler.span("render"):
+        return _render_repo(rcmanager, repo.resolve(), names, build)
+
+
+def _links(
+    repo: Path, names: List[str], sources: Dict[str, Path]
+) -> Dict[str, List[Path]]:
+    """Entries of a render directory, as taken by `rc4me.stack._materialize`.
+
+    Top-level directories without templates are linked as a whole rather
+    than file by file, since they hold most of the files of large configs.
+    """
+    rendered = {rel.split("/", 1)[0] for rel in names if rel.endswith(SUFFIX)}
+    links = {}
+    for rel, source in sources.items():
+        top = rel.split("/", 1)[0]
+        if top != rel and top not in rendered:
+            links[top] = [repo / top]
+        else:
+            links[rel] = [source]
+    return links
+
+
+def _render_repo(
+    rcmanager: "RcManager", repo: Path, names: List[str], build: bool
+) -> Tuple[Path, List[str]]:
+    renders = rcmanager.home / ".renders"
+    cache = RenderCache(renders)
+    facts = host_facts(rcmanager.facts)
+    sources = {rel: repo / rel for rel in names if not rel.endswith(SUFFIX)}
+    for rel in names:
+        if rel.endswith(SUFFIX):
+            blob, rendered = cache.render(repo / rel, facts, build)
+            sources[rel[: -len(SUFFIX)]] = blob
+            if rendered:
+                rcmanager.profiler.count("rendered")
+    links = sorted((rel, str(source)) for rel, source in sources.items())
+    data = json.dumps([RENDER_VERSION, str(repo), links])
+    key = hashlib.sha256(data.encode()).hexdigest()
+    path = renders / f"{repo.name}-{key[:16]}"
+    if not build:
+        return path, sorted(sources)
+    cache.save()
+    if path.is_dir():
+        logger.info(f"Reusing render {path.name}")
+        return path, sorted(sources)
+    logger.info(f"Building render {path.name} of {len(sources)} paths")
+    tmp = renders / f".{path.name}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    _materialize(tmp, _links(repo, names, sources))
+    try:
+        os.rename(tmp, path)
+    except OSError:
+        # Built concurrently; the contents are the same
+        shutil.rmtree(tmp)
+    return path, sorted(sources)
+
+
+def _blob_links(root: Path, blobs: str) -> Iterator[str]:
+    """Targets of the links into the render blobs in a render directory."""
+    # Links to repo directories are not followed, renders are never below them
+    for directory, dirs, files in os.walk(root):
+        for name in files + dirs:
+            path = os.path.join(directory, name)
+            if os.path.islink(path):
+                target = os.readlink(path)
+                if target.startswith(blobs):
+                    yield target
+
+
+def prune_renders(rcmanager: "RcManager", in_use: Set[Path]) -> List[Path]:
+    """Delete the render directories that are not in use, and unused renders.
+
+    Args:
+        rcmanager: Manager whose home holds the renders.
+        in_use: Resolved config directories that are kept, e.g. those of the
+            kept generations.
+
+    Returns:
+        The deleted render directories.
+    """
+    renders = rcmanager.home / ".renders"
+    try:
+        paths = sorted(renders.iterdir())
+    except FileNotFoundError:
+        return []
+    blobs = renders / "blobs"
+    linked: Set[str] = set()
+    removed = []
+    for path in paths:
+        # Hidden entries are render directories being built
+        if path == blobs or path.name.startswith(".") or not path.is_dir():
+            continue
+        if path.resolve() in in_use:
+            linked.update(_blob_links(path, f"{blobs}{os.sep}"))
+        else:
+            shutil.rmtree(path)
+            removed.append(path)
+    if blobs.is_dir():
+        for blob in blobs.glob("*/*"):
+            if str(blob) not in linked:
+                blob.unlink()
+    if removed:
+        logger.info(f"Removed {len(removed)} unused renders")
+    return removed
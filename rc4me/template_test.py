@@ -0,0 +1,133 @@
+import pytest
+
+from rc4me.plan import SWAP, SYMLINK
+from rc4me.rcmanager import RcManager
+from rc4me.template import Template
+from rc4me.timing import Profiler
+
+BASHRC = """export EDITOR={{ env.RC4ME_EDITOR }}
+{% if os == "darwin" %}
+alias ls="ls -G"
+{% elif host != "build" %}
+alias ls="ls --color=auto"
+{% else %}
+{% if env.RC4ME_CI %}
+export CI=1
+{% endif %}
+{% endif %}
+# {{host}}
+"""
+
+
+def test_render():
+    template = Template(BASHRC)
+    assert template.facts == {"env.RC4ME_EDITOR", "os", "host", "env.RC4ME_CI"}
+    facts = {"env.RC4ME_EDITOR": "vim", "os": "darwin", "host": "a", "env.RC4ME_CI": ""}
+    assert template.render(facts) == 'export EDITOR=vim\nalias ls="ls -G"\n# a\n'
+    facts.update({"os": "linux", "host": "build", "env.RC4ME_CI": "true"})
+    assert template.render(facts) == "export EDITOR=vim\nexport CI=1\n# build\n"
+
+
+@pytest.mark.parametrize(
+    "text,error",
+    [
+        ("{% if os %}\n", "1: if without endif"),
+        ("{% endif %}\n", "1: endif without if"),
+        ("{% if os %}\n{% else %}\n{% elif os %}\n", "3: elif after else"),
+        ('{% if os = "linux" %}\n', "1: invalid condition"),
+        ("{% for os %}\n", "1: unknown tag"),
+    ],
+)
+def test_template_errors(text, error):
+    with pytest.raises(ValueError, match=error):
+        Template(text, "bashrc.tmpl")
+
+
+def test_apply_template(tmp_path, rc1, monkeypatch):
+    monkeypatch.setenv("RC4ME_EDITOR", "nvim")
+    (rc1 / "bashrc.tmpl").write_text("export EDITOR={{ env.RC4ME_EDITOR }}\n")
+    (rc1 / "inputrc.tmpl").write_text("# {{ user }}\n")
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    profiler = Profiler()
+    rcmanager = RcManager(tmp_path / "home", dest, templates=True, profiler=profiler)
+    rcmanager.change_current_to_repo(rc1)
+    # The template replaces the plain bashrc of the repo
+    assert (dest / ".bashrc").read_text() == "export EDITOR=nvim\n"
+    assert (dest / ".vimrc").read_text() == "blahblah"
+    assert not (dest / ".bashrc.tmpl").exists()
+    assert profiler.summary()["counters"]["rendered"] == 2
+
+    # Applying it again renders nothing and reuses the render directory
+    render = rcmanager.current.resolve()
+    rcmanager.change_current_to_init()
+    rcmanager.change_current_to_repo(rc1)
+    assert rcmanager.current.resolve() == render
+    assert profiler.summary()["counters"]["rendered"] == 2
+
+    # Only the template using a changed fact is rendered again
+    monkeypatch.setenv("RC4ME_EDITOR", "vim")
+    rcmanager.change_current_to_repo(rc1)
+    assert (dest / ".bashrc").read_text() == "export EDITOR=vim\n"
+    assert profiler.summary()["counters"]["rendered"] == 3
+    rcmanager.change_current_to_prev()
+    assert (dest / ".bashrc").read_text() == "export EDITOR=nvim\n"
+
+
+def test_apply_template_with_unknown_fact(tmp_path, rc1):
+    (rc1 / "bashrc.tmpl").write_text("{{ hostnmae }}\n")
+    rcmanager = RcManager(tmp_path / "home", tmp_path, templates=True)
+    with pytest.raises(ValueError, match="unknown fact 'hostnmae'"):
+        rcmanager.change_current_to_repo(rc1)
+    rcmanager = RcManager(
+        tmp_path / "home", tmp_path, templates=True, facts={"hostnmae": "a"}
+    )
+    rcmanager.change_current_to_repo(rc1)
+    assert (tmp_path / ".bashrc").read_text() == "a\n"
+
+
+def test_plan_with_templates_writes_nothing(tmp_path, rc1):
+    (rc1 / "bashrc.tmpl").write_text("# {{ user }}\n")
+    home = tmp_path / "home"
+    planner = RcManager(home, tmp_path, templates=True, dry_run=True)
+    ops = planner.change_current_to_repo(rc1)
+    assert not (home / ".renders").exists()
+    assert (SYMLINK, tmp_path / ".bashrc") in [(op.action, op.path) for op in ops]
+    # Templates are still checked
+    (rc1 / "inputrc.tmpl").write_text("{{ hostnmae }}\n")
+    with pytest.raises(ValueError, match="unknown fact 'hostnmae'"):
+        planner.change_current_to_repo(rc1)
+    (rc1 / "inputrc.tmpl").unlink()
+    # The plan switches to the render directory the switch builds
+    RcManager(home, tmp_path, templates=True).change_current_to_repo(rc1)
+    (swap,) = [op for op in ops if op.action == SWAP]
+    assert swap.source == planner.current.resolve()
+
+
+def test_templates_are_opt_in(tmp_path, rc1):
+    (rc1 / "gitmessage.tmpl").write_text("{{ ticket }}: \n")
+    rcmanager = RcManager(tmp_path / "home", tmp_path)
+    rcmanager.change_current_to_repo(rc1)
+    assert (tmp_path / ".gitmessage.tmpl").read_text() == "{{ ticket }}: \n"
+    assert not (rcmanager.home / ".renders").exists()
+
+
+def test_gc_prunes_unused_renders(tmp_path, rc1, monkeypatch):
+    (rc1 / "bashrc.tmpl").write_text("export EDITOR={{ env.RC4ME_EDITOR }}\n")
+    (rc1 / "inputrc.tmpl").write_text("set editing-mode vi\n")
+    rcmanager = RcManager(tmp_path / "home", tmp_path, templates=True)
+    renders = rcmanager.home / ".renders"
+    for editor in ("vi", "vim", "nvim"):
+        monkeypatch.setenv("RC4ME_EDITOR", editor)
+        rcmanager.change_current_to_repo(rc1)
+    assert len(list(renders.glob("blobs/*/*"))) == 4
+    prev = rcmanager.prev.resolve()
+    assert rcmanager.gc(keep=1) == [1, 2]
+    # Only the renders of current and prev are left
+    assert sorted(p for p in renders.glob("mstefferson_rc-*") if p.is_dir()) == sorted(
+        {prev, rcmanager.current.resolve()}
+    )
+    assert len(list(renders.glob("blobs/*/*"))) == 3
+    rcmanager.change_current_to_prev()
+    assert (tmp_path / ".bashrc").read_text() == "export EDITOR=vim\n"
+    assert (tmp_path / ".inputrc").read_text() == "set editing-mode vi\n"
@@ -0,0 +1,142 @@
+"""Per-phase timers and counters for profiling rc4me commands.
+
+A `Profiler` accumulates the wall time of named spans (e.g. "git", "plan",
+"backup") and integer counters (e.g. files linked, bytes copied). Callers
+that want each span as it ends register hooks:
+
+    profiler = Profiler()
+    profiler.add_hook(lambda name, seconds: print(name, seconds))
+    RcManager(home, dest, profiler=profiler).change_current_to_init()
+    print(profiler.summary())
+
+When profiling is off, `NULL_PROFILER` stands in, and spans and counts cost a
+method call. `import_times` measures the other cost of a command, importing
+it, as reported by `python -X importtime`.
+"""
+
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+# Called with the name and duration in seconds of each span that ends
+Hook = Callable[[str, float], None]
+
+
+class Profiler:
+    """Thread-safe accumulator of span times and counters."""
+
+    enabled = True
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        # Span name -> [number of spans, total seconds]
+        self.spans: Dict[str, List[float]] = {}
+        self.counters: Dict[str, int] = {}
+        self.hooks: List[Hook] = []
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook: Hook) -> None:
+        """Call hook with the name and duration of every span that ends."""
+        self.hooks.append(hook)
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        """Time the body of a `with` block under name.
+
+        Spans may nest and run concurrently; the times of concurrent spans
+        with the same name add up, so they can exceed the wall time.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name: str, seconds: float) -> None:
+        """Record a span measured by the caller."""
+        with self._lock:
+            span = self.spans.setdefault(name, [0, 0.0])
+            span[0] += 1
+            span[1] += seconds
+        for hook in self.hooks:
+            hook(name, seconds)
+
+    def count(self, name: str, n: int = 1) -> None:
+        """Add n to a counter."""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def summary(self) -> Dict[str, object]:
+        """Return the totals so far as a JSON-serializable dict."""
+        with self._lock:
+            return {
+                "seconds": time.perf_counter() - self.started,
+                "spans": {
+                    name: {"count": int(count), "seconds": seconds}
+                    for name, (count, seconds) in sorted(self.spans.items())
+                },
+                "counters": dict(sorted(self.counters.items())),
+            }
+
+
+class _NullSpan:
+    """Reusable context manager that does nothing."""
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, *exc_info) -> None:
+        return None
+
+
+class _NullProfiler(Profiler):
+    """Profiler that records nothing, used when profiling is off."""
+
+    enabled = False
+    _span = _NullSpan()
+
+    def add_hook(self, hook: Hook) -> None:
+        raise RuntimeError("Hooks need a Profiler, profiling is disabled")
+
+    def span(self, name: str) -> _NullSpan:  # type: ignore[override]
+        return self._span
+
+    def add_time(self, name: str, seconds: float) -> None:
+        pass
+
+    def count(self, name: str, n: int = 1) -> None:
+        pass
+
+
+NULL_PROFILER = _NullProfiler()
+
+
+def import_times(code: str, env: Optional[Dict[str, str]] = None) -> Dict[str, int]:
+    """Run code in a fresh interpreter and return cumulative import times in us.
+
+    Args:
+        code: Python code to run, e.g. "import rc4me.cli".
+        env: Environment of the interpreter, that of this process if None.
+
+    Returns:
+        Cumulative import time of each module the code imported, by name.
+    """
+    # Imported here, as the commands that import this module never need it
+    import subprocess
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        env=env,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line.split("|")
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative)
+    return times
@@ -0,0 +1,43 @@
+from rc4me.rcmanager import RcManager
+from rc4me.timing import NULL_PROFILER, Profiler
+
+
+def test_profiler_spans_and_counters():
+    profiler = Profiler()
+    ended = []
+    profiler.add_hook(lambda name, seconds: ended.append(name))
+    with profiler.span("outer"):
+        with profiler.span("inner"):
+            pass
+    with profiler.span("inner"):
+        pass
+    profiler.count("linked", 2)
+    profiler.count("linked")
+    summary = profiler.summary()
+    assert ended == ["inner", "outer", "inner"]
+    assert summary["spans"]["inner"]["count"] == 2
+    assert summary["spans"]["outer"]["seconds"] >= 0
+    assert summary["counters"] == {"linked": 3}
+
+
+def test_null_profiler_records_nothing():
+    with NULL_PROFILER.span("plan"):
+        NULL_PROFILER.count("linked")
+    assert NULL_PROFILER.summary()["spans"] == {}
+    assert NULL_PROFILER.summary()["counters"] == {}
+
+
+def test_switch_counts(tmp_path, rc1):
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    (dest / ".bashrc").write_text("mine")
+    profiler = Profiler()
+    rcmanager = RcManager(tmp_path / "home", dest, profiler=profiler)
+    rcmanager.change_current_to_repo(rc1)
+    rcmanager.change_current_to_init()
+    summary = profiler.summary()
+    assert summary["counters"]["linked"] == 2
+    assert summary["counters"]["backed_up"] == 1
+    assert summary["counters"]["copied"] == 1
+    assert summary["counters"]["bytes_copied"] == len("mine")
+    assert {"plan", "create", "symlink", "backup"} <= set(summary["spans"])
@@ -0,0 +1,83 @@
+"""Iterative, scandir-based walker for directory trees in config repos."""
+
+import os
+import re
+from fnmatch import translate
+from pathlib import Path
+from typing import Callable, Iterator, Sequence
+
+# Never descend into or link VCS metadata
+ALWAYS_EXCLUDE = (".git",)
+
+
+def compile_excludes(exclude: Sequence[str]) -> Callable[[str, str], bool]:
+    """Compile exclude patterns into a single matcher.
+
+    Patterns are matched with fnmatch rules against both the full relative
+    path (e.g. `vim/pack/*`) and the final path component (e.g. `*.pyc`).
+
+    Args:
+        exclude: Glob patterns to exclude.
+
+    Returns:
+        Function of (relative path, name) returning whether it is excluded.
+    """
+    if not exclude:
+        return lambda rel, name: name in ALWAYS_EXCLUDE
+    match = re.compile("|".join(translate(pattern) for pattern in exclude)).match
+    return lambda rel, name: (
+        name in ALWAYS_EXCLUDE or match(rel) is not None or match(name) is not None
+    )
+
+
+def is_excluded(rel: str, exclude: Sequence[str]) -> bool:
+    """Check if a relative path matches any exclude pattern.
+
+    Args:
+        rel: Path relative to the config repo, with "/" separators.
+        exclude: Glob patterns to exclude, see `compile_excludes`.
+    """
+    return compile_excludes(exclude)(rel, rel.rsplit("/", 1)[-1])
+
+
+def walk_files(
+    root: Path,
+    prefix: str = "",
+    exclude: Sequence[str] = (),
+    follow_symlinks: bool = True,
+) -> Iterator[str]:
+    """Yield the relative paths of all non-directory entries below root.
+
+    Uses an explicit stack and a single `os.scandir` call per directory, so
+    deep trees don't hit the recursion limit and file entries cost no extra
+    syscalls. Symlinks to directories are walked into when follow_symlinks is
+    set; each directory is visited at most once, so link cycles terminate.
+
+    Args:
+        root: Directory to walk.
+        prefix: Relative path of root, prepended to every yielded path.
+        exclude: Glob patterns of paths to skip, see `is_excluded`.
+        follow_symlinks: Walk into symlinked directories instead of
+            yielding them as entries.
+
+    Yields:
+        Paths relative to root's parent config repo, with "/" separators.
+    """
+    excluded = compile_excludes(exclude)
+    seen = set()
+    stack = [(os.fspath(root), prefix)]
+    while stack:
+        path, rel_dir = stack.pop()
+        st = os.stat(path)
+        if (st.st_dev, st.st_ino) in seen:
+            continue
+        seen.add((st.st_dev, st.st_ino))
+        with os.scandir(path) as it:
+            for entry in it:
+                rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                if excluded(rel, entry.name):
+                    continue
+                if entry.is_dir(follow_symlinks=follow_symlinks):
+                    stack.append((entry.path, rel))
+                else:
+                    yield rel
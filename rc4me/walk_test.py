@@ -0,0 +1,34 @@
+from rc4me.walk import is_excluded, walk_files
+
+
+def test_walk_files_nested(tmp_path):
+    (tmp_path / "vim" / "pack" / "start").mkdir(parents=True)
+    (tmp_path / "vim" / "vimrc").write_text("")
+    (tmp_path / "vim" / "pack" / "start" / "plugin.vim").write_text("")
+    (tmp_path / "vim" / ".git").mkdir()
+    (tmp_path / "vim" / ".git" / "HEAD").write_text("")
+    found = set(walk_files(tmp_path / "vim", "vim"))
+    assert found == {"vim/vimrc", "vim/pack/start/plugin.vim"}
+
+
+def test_walk_files_exclude(tmp_path):
+    (tmp_path / "pack").mkdir()
+    (tmp_path / "pack" / "plugin.vim").write_text("")
+    (tmp_path / "vimrc").write_text("")
+    (tmp_path / "vimrc.pyc").write_text("")
+    assert list(walk_files(tmp_path, exclude=["pack", "*.pyc"])) == ["vimrc"]
+    assert is_excluded("vim/pack/start", ["vim/pack/*"])
+
+
+def test_walk_files_symlinked_subtree(tmp_path):
+    (tmp_path / "real").mkdir()
+    (tmp_path / "real" / "a").write_text("")
+    (tmp_path / "tree").mkdir()
+    (tmp_path / "tree" / "linked").symlink_to(tmp_path / "real")
+    # A cycle back to the top of the tree is only walked once
+    (tmp_path / "tree" / "loop").symlink_to(tmp_path / "tree")
+    assert set(walk_files(tmp_path / "tree")) == {"linked/a"}
+    assert set(walk_files(tmp_path / "tree", follow_symlinks=False)) == {
+        "linked",
+        "loop",
+    }
@@ -0,0 +1,295 @@
+"""Keep dest in sync with the current config while it is being edited.
+
+`rc4me watch` watches the directory current points at and, after each burst
+of changes, hands only the changed paths to `RcManager.apply_changes`, so a
+file added to or removed from the config shows up in dest without relisting
+the config. On Linux, changes are reported by inotify, loaded from libc with
+ctypes. Elsewhere, or with `--poll`, the config is rescanned on an interval.
+
+Stack and render directories (see `rc4me.stack` and `rc4me.template`) hold
+links into their repos, so edits to the stacked repos or to templates are not
+seen; apply the config again instead.
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import stat
+import struct
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from rc4me.plan import Op
+from rc4me.rcmanager import RcManager
+from rc4me.walk import ALWAYS_EXCLUDE
+
+logger = logging.getLogger(__name__)
+
+# inotify event masks, from <sys/inotify.h>
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, "O_CLOEXEC", 0o2000000)
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+)
+_EVENT = struct.Struct("iIII")
+# (mode, size, mtime_ns) of a path, as compared between polls
+_Stat = Tuple[int, int, int]
+
+
+class InotifyWatcher:
+    """Changed paths of a directory tree, as reported by Linux inotify.
+
+    Every directory of the tree gets a watch, and directories created later
+    are added as they appear. If the kernel queue overflows, the empty path
+    is reported, meaning that anything may have changed.
+    """
+
+    def __init__(self, root: Path):
+        """Start watching root.
+
+        Raises:
+            OSError: If inotify is not available.
+        """
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux")
+        self.root = Path(root)
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # Relative path of the directory of each watch descriptor
+        self._dirs: Dict[int, str] = {}
+        self._add_tree(self.root, "")
+
+    def _add_tree(self, path: Path, rel: str):
+        """Watch a directory and, recursively, the directories below it."""
+        stack = [(os.fspath(path), rel)]
+        while stack:
+            path, rel = stack.pop()
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+            if wd < 0:
+                # Removed again before it could be watched
+                logger.debug(f"Can't watch {path}: {os.strerror(ctypes.get_errno())}")
+                continue
+            self._dirs[wd] = rel
+            try:
+                with os.scandir(path) as it:
+                    for entry in it:
+                        if entry.name in ALWAYS_EXCLUDE:
+                            continue
+                        if entry.is_dir(follow_symlinks=False):
+                            sub = f"{rel}/{entry.name}" if rel else entry.name
+                            stack.append((entry.path, sub))
+            except FileNotFoundError:
+                continue
+
+    def _parse(self, data: bytes) -> Set[str]:
+        """Turn a buffer of inotify events into changed relative paths."""
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                changed.add("")
+                continue
+            if mask & IN_IGNORED:
+                self._dirs.pop(wd, None)
+                continue
+            parent = self._dirs.get(wd)
+            if parent is None or not name or name in ALWAYS_EXCLUDE:
+                continue
+            rel = f"{parent}/{name}" if parent else name
+            if mask & IN_ISDIR:
+                self._update_tree(mask, rel)
+            changed.add(rel)
+        return changed
+
+    def _update_tree(self, mask: int, rel: str):
+        """Follow a directory that was added to or moved out of the tree."""
+        if mask & (IN_CREATE | IN_MOVED_TO):
+            self._add_tree(self.root / rel, rel)
+        elif mask & IN_MOVED_FROM:
+            # Watches follow the moved directory, so their paths are stale
+            for wd, path in list(self._dirs.items()):
+                if path == rel or path.startswith(f"{rel}/"):
+                    self._libc.inotify_rm_watch(self.fd, wd)
+                    del self._dirs[wd]
+
+    def read(self, timeout: Optional[float] = None) -> Set[str]:
+        """Wait up to timeout seconds (forever if None) for changed paths.
+
+        Returns:
+            Paths relative to root, empty if nothing changed in time.
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return changed
+            changed |= self._parse(data)
+
+    def close(self):
+        os.close(self.fd)
+
+
+def _differs(old: Optional[_Stat], new: Optional[_Stat]) -> bool:
+    """Check if a path changed between scans, ignoring directory mtimes.
+
+    A directory's mtime changes with its entries, which are reported anyway.
+    """
+    if old is not None and new is not None:
+        if stat.S_ISDIR(old[0]) and stat.S_ISDIR(new[0]):
+            return False
+    return old != new
+
+
+class PollingWatcher:
+    """Changed paths of a directory tree, found by rescanning it."""
+
+    def __init__(self, root: Path, interval: float = 0.5):
+        self.root = Path(root)
+        self.interval = interval
+        self._state = self._scan()
+
+    def _scan(self) -> Dict[str, _Stat]:
+        """Map each path below root to its (mode, size, mtime_ns)."""
+        state = {}
+        stack = [(os.fspath(self.root), "")]
+        while stack:
+            path, rel_dir = stack.pop()
+            try:
+                with os.scandir(path) as it:
+                    entries = list(it)
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                if entry.name in ALWAYS_EXCLUDE:
+                    continue
+                rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                state[rel] = (st.st_mode, st.st_size, st.st_mtime_ns)
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append((entry.path, rel))
+        return state
+
+    def read(self, timeout: Optional[float] = None) -> Set[str]:
+        """Wait up to timeout seconds (forever if None) for changed paths."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.interval
+            if deadline is not None:
+                wait = min(wait, max(0.0, deadline - time.monotonic()))
+            time.sleep(wait)
+            state = self._scan()
+            changed = {
+                rel
+                for rel in state.keys() | self._state.keys()
+                if _differs(self._state.get(rel), state.get(rel))
+            }
+            self._state = state
+            if changed or (deadline is not None and time.monotonic() >= deadline):
+                return changed
+
+    def close(self):
+        pass
+
+
+def open_watcher(root: Path, poll: bool = False, interval: float = 0.5):
+    """Watch root with inotify if possible, otherwise by polling it."""
+    if not poll:
+        try:
+            return InotifyWatcher(root)
+        except (OSError, AttributeError) as e:
+            # AttributeError if libc has no inotify functions
+            logger.info(f"inotify is not available ({e}), polling instead")
+    return PollingWatcher(root, interval)
+
+
+def wait_for_changes(watcher, debounce: float) -> Set[str]:
+    """Block until paths change, then until none have changed for debounce s."""
+    changed = watcher.read()
+    while True:
+        more = watcher.read(debounce)
+        if not more:
+            return changed
+        changed |= more
+
+
+def watch(
+    rcmanager: RcManager,
+    debounce: float = 0.05,
+    poll: bool = False,
+    interval: float = 0.5,
+    on_update: Optional[Callable[[Set[str], List[Op]], None]] = None,
+    batches: Optional[int] = None,
+) -> None:
+    """Apply changes to the current config to dest as they happen.
+
+    If current is switched to another config meanwhile, that config is
+    watched from then on.
+
+    Args:
+        rcmanager: Manager of the rc4me home and dest to keep in sync.
+        debounce: Seconds without changes that end a burst of changes.
+        poll: Poll for changes even if inotify is available.
+        interval: Seconds between scans when polling.
+        on_update: Called with the changed paths and the operations run for
+            them, after each burst.
+        batches: Stop after this many bursts, e.g. in tests. Runs until
+            interrupted if None.
+    """
+    root = rcmanager.current.resolve()
+    watcher = open_watcher(root, poll, interval)
+    logger.info(f"Watching {root} with {type(watcher).__name__}")
+    try:
+        while batches is None or batches > 0:
+            changed = wait_for_changes(watcher, debounce)
+            if rcmanager.current.resolve() != root:
+                # Switched by another rc4me command; the switch updated dest
+                watcher.close()
+                root = rcmanager.current.resolve()
+                watcher = open_watcher(root, poll, interval)
+                logger.info(f"Current changed, watching {root}")
+                continue
+            start = time.perf_counter()
+            ops = rcmanager.apply_changes(changed)
+            logger.info(
+                f"Applied {len(changed)} changed path(s) with {len(ops)} "
+                f"operation(s) in {(time.perf_counter() - start) * 1e3:.1f}ms"
+            )
+            if on_update is not None:
+                on_update(changed, ops)
+            if batches is not None:
+                batches -= 1
+    finally:
+        watcher.close()
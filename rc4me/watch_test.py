@@ -0,0 +1,66 @@
+import threading
+
+import pytest
+
+from rc4me.rcmanager import RcManager
+from rc4me.watch import PollingWatcher, watch
+
+
+def test_apply_changes(tmp_path, rc1):
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    rcmanager = RcManager(tmp_path / "home", dest, dir_mode="files")
+    rcmanager.change_current_to_repo(rc1)
+    (rc1 / "inputrc").write_text("set editing-mode vi")
+    (rc1 / "config" / "git").mkdir(parents=True)
+    (rc1 / "config" / "git" / "ignore").write_text("*.pyc")
+    (rc1 / "bashrc").unlink()
+    ops = rcmanager.apply_changes(["inputrc", "config", "bashrc"])
+    assert len(ops) == 4
+    assert (dest / ".inputrc").read_text() == "set editing-mode vi"
+    assert (dest / ".config" / "git" / "ignore").read_text() == "*.pyc"
+    assert not (dest / ".bashrc").exists()
+    # Edits to linked files need no work
+    (rc1 / "vimrc").write_text("new")
+    assert rcmanager.apply_changes(["vimrc"]) == []
+    # The recorded links follow, so switching away removes the new links
+    rcmanager.change_current_to_init()
+    assert not (dest / ".inputrc").exists()
+    assert not (dest / ".config" / "git" / "ignore").exists()
+
+
+@pytest.mark.parametrize("poll", [False, True])
+def test_watch(tmp_path, rc1, poll):
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    rcmanager = RcManager(tmp_path / "home", dest)
+    rcmanager.change_current_to_repo(rc1)
+    updates = []
+    thread = threading.Thread(
+        target=watch,
+        args=(rcmanager,),
+        kwargs=dict(
+            poll=poll,
+            interval=0.01,
+            on_update=lambda changed, ops: updates.append(changed),
+            batches=1,
+        ),
+    )
+    thread.start()
+    # Give the watcher time to take its first snapshot or add its watches
+    threading.Event().wait(0.2)
+    (rc1 / "inputrc").write_text("set editing-mode vi")
+    (rc1 / "vimrc").unlink()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert updates == [{"inputrc", "vimrc"}]
+    assert (dest / ".inputrc").read_text() == "set editing-mode vi"
+    assert not (dest / ".vimrc").is_symlink()
+
+
+def test_polling_ignores_directory_mtimes(tmp_path):
+    (tmp_path / "vim").mkdir()
+    watcher = PollingWatcher(tmp_path, interval=0.01)
+    (tmp_path / "vim" / "vimrc").write_text("x")
+    assert watcher.read(0.05) == {"vim/vimrc"}
+    assert watcher.read(0.05) == set()
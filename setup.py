@@ -6,7 +6,9 @@ setup(
     author_email="mstefferson@gmail.com",
     description="Description",
     packages=find_packages(),
-    install_requires=["click>=7.1.2", "pick>=1.0.0", "gitpython>=3.1.11"],
+    install_requires=["click>=7.1.2", "gitpython>=3.1.11"],
+    # TOML batch plans need tomli before Python 3.11, see rc4me.batch
+    extras_require={"toml": ["tomli>=1.1.0; python_version < '3.11'"]},
     python_requires=">=3.8",
     license="MIT License",
     entry_points="""